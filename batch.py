@@ -0,0 +1,165 @@
+# Batch mode: lex, or lex and parse, every program under directories or glob patterns in one run
+# Files are spread over a process pool; each worker builds its lexer (and parse table) once and
+# handles many files, and one JSON Lines record per file is written as soon as its result comes back.
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from multiprocessing import Pool
+
+import lexer
+import parse_cache
+import wumpus_parser
+from wumpus_parser import LexerTokenStream, ExpectationError, MissingTokenError, count_nodes
+
+MODES = ('lex', 'parse')
+PARSERS = ('recursive', 'table')
+
+# per-worker state, set up by init_worker
+worker = {}
+
+def find_files(paths, pattern):
+    # directories are searched recursively for pattern, anything else is a file or a glob
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '**', pattern), recursive=True)))
+        elif glob.has_magic(path):
+            files.extend(sorted(glob.glob(path, recursive=True)))
+        else:
+            files.append(path)
+    return [file for file in dict.fromkeys(files) if os.path.isfile(file)]
+
+def init_worker(mode, engine, parser, cache_directory=None, cache_bytes=None):
+    worker['mode'] = mode
+    worker['engine'] = engine
+    worker['lexer'] = lexer.build_lexer() if engine == 'ply' else None
+    worker['cache'] = None
+    if cache_directory is not None:
+        worker['cache'] = parse_cache.ParseCache(cache_directory, cache_bytes)
+    # both parsers recover from syntax errors, so a file's errors are all found in one pass
+    if parser == 'table':
+        import table_parser
+        table_parser.load_grammar()
+        worker['parse'] = table_parser.parse_recovering
+    else:
+        worker['parse'] = wumpus_parser.parse_recovering
+
+def describe_error(error):
+    # report fields of a syntax error, with its position when the token is known
+    fields = {'ok': False, 'error': error.message}
+    token = error.token
+    if token is not None and token.token_column is not None:
+        fields.update(line=token.token_line, column=token.token_column, span=error.span)
+    elif isinstance(error, ExpectationError):
+        fields['line'] = token.token_line
+    return fields
+
+def process_file(path):
+    # lex (and parse) one file and describe the outcome as a dict for the report
+    start = time.perf_counter()
+    result = {'file': path, 'ok': True}
+    cache = worker['cache']
+    if cache is not None:
+        before = (cache.hits, cache.bytes_read, cache.bytes_written)
+    try:
+        with open(path, 'r') as file:
+            source = file.read()
+        result['bytes'] = len(source)
+        if worker['mode'] == 'lex':
+            if cache is None:
+                result['tokens'] = sum(1 for _ in lexer.tokenize(source, worker['lexer'], worker['engine']))
+            else:
+                result['tokens'] = len(parse_cache.lex_source(source, cache, worker['lexer'], worker['engine']))
+        else:
+            if cache is None:
+                tree, errors = worker['parse'](LexerTokenStream(lexer.tokenize(source, worker['lexer'], worker['engine']), lexer.LineIndex(source)))
+            else:
+                tree, errors = parse_cache.parse_source(source, worker['parse'], cache, worker['lexer'], worker['engine'])
+            result['nodes'] = count_nodes(tree)
+            if errors:
+                result.update(describe_error(errors[0]), errors=[describe_error(error) for error in errors])
+    except (ExpectationError, MissingTokenError) as e:
+        result.update(describe_error(e))
+    except Exception as e:
+        result.update(ok=False, error=f'{type(e).__name__}: {e}')
+    if cache is not None:
+        result['cache'] = 'hit' if cache.hits > before[0] else 'miss'
+        result['cache_bytes_read'] = cache.bytes_read - before[1]
+        result['cache_bytes_written'] = cache.bytes_written - before[2]
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    return result
+
+def run_batch(files, report, workers, chunksize, mode, engine, parser, cache_directory=None, cache_bytes=None):
+    # write one line per file to report, in completion order, and return the totals
+    totals = {'files': 0, 'failed': 0, 'bytes': 0, 'tokens': 0, 'nodes': 0,
+              'cache_hits': 0, 'cache_misses': 0, 'cache_bytes_read': 0, 'cache_bytes_written': 0}
+    initargs = (mode, engine, parser, cache_directory, cache_bytes)
+    if workers == 1:
+        init_worker(*initargs)
+        results = map(process_file, files)
+    else:
+        pool = Pool(workers, initializer=init_worker, initargs=initargs)
+        results = pool.imap_unordered(process_file, files, chunksize)
+    try:
+        for result in results:
+            report.write(json.dumps(result) + '\n')
+            totals['files'] += 1
+            totals['failed'] += not result['ok']
+            totals['bytes'] += result.get('bytes', 0)
+            totals['tokens'] += result.get('tokens', 0)
+            totals['nodes'] += result.get('nodes', 0)
+            if 'cache' in result:
+                totals['cache_hits'] += result['cache'] == 'hit'
+                totals['cache_misses'] += result['cache'] == 'miss'
+                totals['cache_bytes_read'] += result['cache_bytes_read']
+                totals['cache_bytes_written'] += result['cache_bytes_written']
+    finally:
+        if workers != 1:
+            pool.close()
+            pool.join()
+    return totals
+
+def main():
+    parse = argparse.ArgumentParser(description='Lex or parse many Wumpus programs over a process pool')
+    parse.add_argument('paths', help='Source files, directories (searched recursively) or glob patterns', nargs='+')
+    parse.add_argument('-o', '--output', help='JSON Lines report, one record per file', type=str, default='batch_report.jsonl')
+    parse.add_argument('-j', '--workers', help='Number of worker processes (1 runs in this process)', type=int, default=os.cpu_count())
+    parse.add_argument('-c', '--chunksize', help='Files handed to a worker at a time', type=int, default=16)
+    parse.add_argument('-p', '--pattern', help='File name pattern used inside directories', type=str, default='*.txt')
+    parse.add_argument('-m', '--mode', help='Only lex, or lex and parse', choices=MODES, default='parse')
+    parse.add_argument('--engine', help='Lexer backend', choices=lexer.ENGINES, default='scanner')
+    parse.add_argument('--parser', help='Recursive descent parser, or the LL(1) table parser', choices=PARSERS, default='recursive')
+    parse.add_argument('--cache', help='Reuse the tokens and CSTs of sources seen before, from this cache directory', nargs='?', const='.wumpus_cache', type=str)
+    parse.add_argument('--cache-size', help='Largest size of the cache directory in MB', type=int, default=256)
+    args = parse.parse_args()
+
+    files = find_files(args.paths, args.pattern)
+    if not files:
+        print('No input files found')
+        sys.exit(1)
+    # build the lexer tables once here, so that the workers only load them
+    lexer.build_lexer()
+
+    start = time.perf_counter()
+    with open(args.output, 'w', encoding='utf8') as report:
+        totals = run_batch(files, report, max(1, args.workers), max(1, args.chunksize), args.mode, args.engine, args.parser,
+                           args.cache, args.cache_size << 20)
+    elapsed = time.perf_counter() - start
+
+    print(f"{totals['files']} files, {totals['failed']} failed, report written to {args.output}")
+    print(f"{elapsed:.3f} s: {totals['files'] / elapsed:.1f} files/s, {totals['bytes'] / elapsed / 1e6:.2f} MB/s", end='')
+    if args.mode == 'lex':
+        print(f", {totals['tokens'] / elapsed:.0f} tokens/s")
+    else:
+        print(f", {totals['nodes'] / elapsed:.0f} CST nodes/s")
+    if args.cache is not None:
+        print(f"cache: {totals['cache_hits']} hits, {totals['cache_misses']} misses, "
+              f"{totals['cache_bytes_read']} bytes read, {totals['cache_bytes_written']} bytes written")
+    sys.exit(1 if totals['failed'] else 0)
+
+if __name__ == '__main__':
+    main()
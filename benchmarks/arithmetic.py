@@ -0,0 +1,101 @@
+# Arithmetic evaluation order: chains of + and - are left associative (10 - 3 - 2 is 5), * and / bind
+# tighter, and / is floor division. Every expression below, fixed and random, is run by the VM both
+# plain and constant folded and must give the value Python computes for it
+
+import os
+import sys
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import table_parser
+from lexer import tokenize
+from wumpus_parser import LexerTokenStream
+from wumpus_vm import VM, compile_program
+
+# (expression, value)
+CASES = [
+    ('10 - 3 - 2', 5),
+    ('10 - 3 + 2', 9),
+    ('1 + 2 - 3 + 4 - 5', -1),
+    ('20 - 4 * 2 - 3', 9),
+    ('100 / 10 - 5 - 2', 3),
+    ('2 - (3 - 4)', 3),
+    ('-7 / 2 - 1', -5),
+]
+
+SOURCE = '''init {{
+  grid_size(4, 4)
+  place_agent(0, 0)
+  place_wumpus(3, 3)
+  place_gold(3, 0)
+}}
+play {{
+  x = {expression}
+  if (x == {value}) {{ print_position() }}
+  y = 1 - 1 - 1
+  if (x == {value} - y - 1) {{ print_position() }}
+}}
+'''
+
+def random_expression(rng, depth=0):
+    # (wumpus source, python source) of an <expr>
+    terms = [random_term(rng, depth) for _ in range(rng.randint(1, 5))]
+    source, python = terms[0]
+    for term_source, term_python in terms[1:]:
+        operator = rng.choice('+-')
+        source += f' {operator} {term_source}'
+        python += f' {operator} {term_python}'
+    return source, python
+
+def random_term(rng, depth):
+    # an <exprfac>, with at most one * or /
+    left = random_base(rng, depth)
+    if rng.random() < 0.4:
+        operator = rng.choice('*/')
+        right = random_base(rng, depth)
+        return f'{left[0]} {operator} {right[0]}', f'{left[1]} {"//" if operator == "/" else "*"} {right[1]}'
+    return left
+
+def random_base(rng, depth):
+    choice = rng.random()
+    if depth < 3 and choice < 0.2:
+        source, python = random_expression(rng, depth + 1)
+        return f'({source})', f'({python})'
+    if depth < 3 and choice < 0.3:
+        source, python = random_base(rng, depth + 1)
+        return f'-{source}', f'(-{python})'
+    value = str(rng.randint(0, 20))
+    return value, value
+
+def evaluate(expression, value, optimize):
+    # True when the VM finds x equal to value, printing both positions
+    source = SOURCE.format(expression=expression, value=value)
+    cst = table_parser.parse(LexerTokenStream(tokenize(source, engine='scanner')))
+    return len(VM(compile_program(cst, optimize)).run().positions) == 2
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('--cases', help='Random expressions to check', type=int, default=300)
+    parse.add_argument('-s', '--seed', type=int, default=0)
+    args = parse.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = list(CASES)
+    while len(cases) < len(CASES) + args.cases:
+        source, python = random_expression(rng)
+        try:
+            cases.append((source, eval(python)))
+        except ZeroDivisionError:
+            continue
+    for expression, value in cases:
+        for optimize in (False, True):
+            if not evaluate(expression, value, optimize):
+                print(f'MISMATCH: {expression} should be {value}{" when folded" if optimize else ""}')
+                sys.exit(1)
+    print(f'{len(cases)} expressions evaluate as expected, plain and folded')
+
+if __name__ == '__main__':
+    main()
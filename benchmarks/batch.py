@@ -0,0 +1,90 @@
+# Cost of running one agent program over N random worlds in lock step, against N single-world VM runs
+# The first worlds of each batch are replayed one by one with wumpus_vm and their outcome, score and
+# number of actions must match the batch's. A batch runs until its longest world is done, so its cost is
+# compared with that world's number of statements too (see the wumpus_batch header)
+
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import table_parser
+import wumpus_ast
+from lexer import tokenize
+from wumpus_parser import LexerTokenStream
+from wumpus_vm import VM, compile_program
+from wumpus_batch import WorldBatch, BatchRunner, OUTCOMES
+
+# walks the rows of the grid, stepping back from breezes, and shoots when it smells the Wumpus
+SOURCE = '''const int size = 8
+function int turn(int row) {
+  if ((row / 2) * 2 == row) { return 1 }
+  return 0
+}
+init {
+  grid_size(8, 8)
+  place_agent(0, 0)
+  place_wumpus(5, 5)
+  place_gold(7, 7)
+}
+play {
+  row = 0
+  while (row < size) {
+    col = 0
+    forward = turn(row)
+    while (col < size - 1) {
+      if (sense_glitter()) { grab() }
+      if (sense_stench() and shot == 0) {
+        if (forward == 1) { shoot(east) } else { shoot(west) }
+        shot = 1
+      }
+      if (sense_breeze() and col > 0) {
+        col = size
+      } else {
+        if (forward == 1) { move(east) } else { move(west) }
+        col = col + 1
+      }
+      seen[row * size + col] = 1
+    }
+    if (sense_glitter()) { grab() }
+    move(north)
+    row = row + 1
+  }
+}
+'''
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('-n', '--worlds', help='Largest batch', type=int, default=10000)
+    parse.add_argument('-c', '--check', help='Worlds of each batch replayed with the VM', type=int, default=200)
+    parse.add_argument('-s', '--seed', type=int, default=1)
+    args = parse.parse_args()
+
+    program = wumpus_ast.lower(table_parser.parse(LexerTokenStream(tokenize(SOURCE, engine='scanner'))))
+    vm = VM(compile_program(program))
+    runner = BatchRunner(program)
+
+    single = None
+    for count in (1, 100, args.worlds):
+        worlds = WorldBatch.random(program.world, count, seed=args.seed)
+        start = time.perf_counter()
+        result = runner.run(worlds)
+        seconds = time.perf_counter() - start
+        single = single or seconds
+        for i in range(min(count, args.check)):
+            expected = vm.run(worlds.world(i))
+            got = (OUTCOMES[result.outcome[i]], int(result.score[i]), int(result.actions[i]))
+            if got != (expected.outcome, expected.score, expected.actions):
+                print(f'MISMATCH in world {i} of {count}: batch {got}, VM {(expected.outcome, expected.score, expected.actions)}')
+                sys.exit(1)
+        start = time.perf_counter()
+        for i in range(min(count, 1000)):
+            vm.run(worlds.world(i))
+        vm_seconds = (time.perf_counter() - start) / min(count, 1000) * count
+        print(f'{count:>6} worlds  batch {seconds * 1000:9.2f} ms ({seconds / single:6.1f}x one world, longest world {result.steps.max()} statements)  VM one by one {vm_seconds * 1000:9.2f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Memory per node and construction time of the CST: TreeNode objects against the array-backed CSTArena
+# Both trees are built by the table parser from the same pre-lexed tokens, so only the tree storage differs
+
+import os
+import sys
+import gc
+import time
+import tracemalloc
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lexer
+import table_parser
+from wumpus_parser import Token, count_nodes
+from cst_arena import CSTArena
+
+HEADER = '''const int size = 6
+function int add(int a, int b) {
+  return a + b * 2
+}
+init {
+  grid_size(6, 6)
+  place_agent(0, 0)
+  place_wumpus(4, 4)
+  place_gold(3, 3)
+}
+play {
+'''
+
+BODY = '''  x = add(size, size)
+  arr[x + 1] = -x
+  if (sense_glitter() or x <= 3) { grab() print_position() }
+  while (x < 10) { x = x + 1 move(east) }
+'''
+
+class ListTokenStream:
+    # peek/pop over tokens that were lexed beforehand
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.index = 0
+
+    def pop(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.index + offset, len(self.tokens) - 1)]
+
+def build(tokens, arena):
+    grammar = table_parser.load_grammar()
+    start = time.perf_counter()
+    if arena:
+        tree = CSTArena()
+        table_parser.parse(ListTokenStream(tokens), grammar, arena=tree)
+    else:
+        tree = table_parser.parse(ListTokenStream(tokens), grammar)
+    return tree, time.perf_counter() - start
+
+def measure(tokens, arena):
+    gc.collect()
+    tracemalloc.start()
+    tree, _ = build(tokens, arena)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    nodes = len(tree) if arena else count_nodes(tree)
+    # time without tracemalloc running
+    del tree
+    gc.collect()
+    tree, seconds = build(tokens, arena)
+    start = time.perf_counter()
+    gc.collect()
+    collect = time.perf_counter() - start
+    return nodes, size, seconds, collect, tree
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('-n', '--statements', help='Number of times the play block body is repeated', type=int, default=5000)
+    args = parse.parse_args()
+
+    source = HEADER + BODY * args.statements + '}\n'
+    tokens = [Token((tok.type, tok.value, tok.lineno, tok.lexpos)) for tok in lexer.tokenize(source, engine='scanner') if tok.type != 'COMMENT']
+    tokens.append(Token(['EOF', 'EOF', 'EOF', 'EOF']))
+    print(f'{source.count(chr(10))} lines, {len(tokens)} tokens')
+
+    renderings = {}
+    for label, arena in (('TreeNode', False), ('CSTArena', True)):
+        nodes, size, seconds, collect, tree = measure(tokens, arena)
+        print(f'{label:<9} {nodes:>9} nodes  {size / nodes:7.1f} bytes/node  build {seconds:6.3f} s  gc.collect {collect * 1000:7.2f} ms')
+        renderings[label] = str(tree.root if arena else tree)
+        del tree
+    # the two trees must render identically
+    if renderings['TreeNode'] != renderings['CSTArena']:
+        print('MISMATCH between the TreeNode and CSTArena trees')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Compare the two lexer backends: first check that they produce the same token stream,
+# then report the throughput of each one in tokens per second
+
+import os
+import sys
+import glob
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lexer
+
+# Fragments the random inputs are made of, including the awkward cases for the lexer:
+# identifiers longer than 16 characters, ignored characters, unterminated comments, lone '!'
+FRAGMENTS = [
+    'move', 'north', 'while', 'and', 'or', 'true', 'const', 'place_wumpus', 'sense_glitter',
+    'x', 'counter_', 'abcdefghijklmnopqrstuvwxyz', 'Rover', 'aR', '_x', '0', '42', '007',
+    '(', ')', '{', '}', '[', ']', ',', '+', '-', '*', '/', '=', '==', '!=', '!', '<', '<=', '>', '>=',
+    '$ note $', '$$$', '$ open', '$', ' ', '  ', '\t', '\n', '\n\n', '|', '\\', '#', '.', '"', 'é',
+]
+
+def random_source(rng, size):
+    return ''.join(rng.choice(FRAGMENTS) for _ in range(size))
+
+def signature(tokens):
+    return [(tok.type, tok.value, tok.lineno, tok.lexpos) for tok in tokens]
+
+def check_equivalence(sources, ply_lexer):
+    for name, source in sources:
+        expected = signature(lexer.tokenize(source, ply_lexer, 'ply'))
+        actual = signature(lexer.tokenize(source, engine='scanner'))
+        if expected != actual:
+            for i, (a, b) in enumerate(zip(expected, actual)):
+                if a != b:
+                    break
+            else:
+                i = min(len(expected), len(actual))
+            print(f'MISMATCH in {name} at token {i}: ply {expected[i:i + 1]} scanner {actual[i:i + 1]}')
+            return False
+    return True
+
+def throughput(source, engine, ply_lexer, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in lexer.tokenize(source, ply_lexer, engine))
+        best = min(best, time.perf_counter() - start)
+    return count, best
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('-n', '--cases', help='Number of random inputs to compare', type=int, default=500)
+    parse.add_argument('-r', '--repeat', help='Timing repetitions per engine', type=int, default=5)
+    parse.add_argument('--seed', type=int, default=0)
+    args = parse.parse_args()
+
+    rng = random.Random(args.seed)
+    ply_lexer = lexer.build_lexer()
+    sources = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'tests', '*.txt'))):
+        with open(path, 'r') as file:
+            sources.append((os.path.relpath(path, ROOT), file.read()))
+    sources += [(f'random #{i}', random_source(rng, rng.randint(1, 200))) for i in range(args.cases)]
+    if not check_equivalence(sources, ply_lexer):
+        sys.exit(1)
+    print(f'Token streams identical on {len(sources)} inputs')
+
+    # a large input for the timing: the test programs repeated
+    corpus = '\n'.join(source for name, source in sources if name.startswith('tests'))
+    corpus = corpus * max(1, 2_000_000 // max(1, len(corpus)))
+    for engine in lexer.ENGINES:
+        count, seconds = throughput(corpus, engine, ply_lexer, args.repeat)
+        print(f'{engine:<8} {count:>9} tokens  {seconds:7.3f} s  {count / seconds:12,.0f} tokens/s')
+
+if __name__ == '__main__':
+    main()
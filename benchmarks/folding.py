@@ -0,0 +1,94 @@
+# Executed instructions and run time of the VM with and without constant folding (wumpus_optimize)
+# The agent below does constant arithmetic in its loops and has branches on constants; both builds
+# are run over the same random worlds and must agree on outcome, score, actions and printed positions
+
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import table_parser
+import wumpus_ast
+from lexer import tokenize
+from wumpus_parser import LexerTokenStream
+from wumpus_vm import VM, compile_program
+from wumpus_optimize import fold, count_nodes
+from wumpus_batch import WorldBatch
+
+SOURCE = '''const int size = 8
+const int rooms = 64
+const int scale = 4
+const bool careful = true
+const bool verbose = false
+function int cost(int steps) {
+  penalty = (steps * (scale * 2 + 1 - 1)) / (scale * 2)
+  return penalty + 0
+}
+init {
+  grid_size(8, 8)
+  place_agent(0, 0)
+  place_wumpus(5, 5)
+  place_gold(7, 7)
+}
+play {
+  spent = 0
+  i = 0
+  while (i < {iterations} * ((rooms / size) / size)) {
+    spent = spent + (size * size - rooms + 1) * (scale - 3)
+    if (verbose and spent > 10) { print_position() }
+    if (careful or sense_breeze()) { i = i + 1 * 1 } else { i = i + 2 }
+  }
+  total = cost(spent)
+  row = 0
+  while (row < size - 1) {
+    if (sense_glitter()) { grab() }
+    if (sense_breeze() and careful) {
+      row = size
+    } else {
+      move(north)
+      row = row + (scale - scale + 1)
+    }
+    if (-(-row) == size / 2 and careful == true) { print_position() }
+  }
+  if (false) { move(south) }
+}
+'''
+
+def build(iterations):
+    program = wumpus_ast.lower(table_parser.parse(LexerTokenStream(tokenize(SOURCE.replace('{iterations}', str(iterations)), engine='scanner'))))
+    return program, fold(program)
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('-n', '--iterations', help='Iterations of the constant arithmetic loop', type=int, default=100000)
+    parse.add_argument('-w', '--worlds', help='Random worlds both builds are compared on, with 100 iterations', type=int, default=200)
+    parse.add_argument('-s', '--seed', type=int, default=1)
+    args = parse.parse_args()
+
+    program, folded = build(100)
+    plain = VM(compile_program(program))
+    optimized = VM(compile_program(folded))
+    worlds = WorldBatch.random(program.world, args.worlds, seed=args.seed)
+    for i in range(args.worlds):
+        expected = plain.run(worlds.world(i))
+        got = optimized.run(worlds.world(i))
+        if (got.outcome, got.score, got.actions, got.positions) != (expected.outcome, expected.score, expected.actions, expected.positions):
+            print(f'MISMATCH in world {i}: folded {got.outcome} {got.score} {got.actions}, plain {expected.outcome} {expected.score} {expected.actions}')
+            sys.exit(1)
+
+    start = time.perf_counter()
+    program, folded = build(args.iterations)
+    seconds = time.perf_counter() - start
+    print(f'parse and fold {seconds * 1000:8.2f} ms  {count_nodes(program)} nodes -> {count_nodes(folded)}')
+    for name, tree in (('plain', program), ('folded', folded)):
+        vm = VM(compile_program(tree))
+        start = time.perf_counter()
+        result = vm.run(worlds.world(0), max_steps=sys.maxsize)
+        seconds = time.perf_counter() - start
+        print(f'{name:<7} {result.steps:>10} instructions  {seconds:8.3f} s  ({result.outcome}, score {result.score})')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+# Latency of incremental.Document.edit against lexing and parsing the whole edited source again
+# Random edits are applied to a generated program first, and after each one the incremental tokens and tree
+# are checked against a full re-lex and re-parse (token values and positions included), then edits that keep
+# the program valid, which patch the tree in place. Edits are timed at two sizes, typing should cost the same at both.
+# Last, two edits next to statement boundaries of generated programs (a digit typed into the last token of a
+# statement, a statement inserted at the top of the play block) are timed at a small and a large size, and the
+# run fails when their median latency grows with the size of the program
+
+import os
+import sys
+import re
+import time
+import random
+import statistics
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lexer
+import table_parser
+import wumpus_generator
+from incremental import Document, DocumentTokenStream, make_token
+
+FUNCTION = '''function int add{n}(int a, int b) {{
+  $ adds {n} $
+  while (a < b) {{
+    if (sense_breeze() or a == {n}) {{ shoot(east) }} else {{ move(north) }}
+    a = a + 1
+  }}
+  return a + b * 2
+}}
+
+'''
+
+INIT = '''init {
+  grid_size(6, 6)
+  place_agent(0, 0)
+  place_wumpus(4, 4)
+  place_gold(3, 3)
+}
+play {
+'''
+
+BODY = '''  x = add{n}(size, size)
+  if (x <= 3) {{ grab() print_position() }}
+'''
+
+# snippets typed into the source by the random edits, some of them break the syntax for a while
+SNIPPETS = ['x', '1', ' ', '\n', '(', ')', '{', '}', '$ note $', 'move(west)\n', 'y = 2\n', '+ 3', 'and', '==', 'ab']
+
+def generate(copies):
+    source = 'const int size = 6\n'
+    source += ''.join(FUNCTION.format(n=n) for n in range(copies))
+    return source + INIT + ''.join(BODY.format(n=n) for n in range(copies)) + '}\n'
+
+def full_parse(source):
+    starts = lexer.LineIndex(source).starts
+    tokens = [make_token(tok, starts[tok.lineno - 1]) for tok in lexer.scan(source)]
+    try:
+        return tokens, table_parser.parse(DocumentTokenStream(tokens))
+    except (table_parser.ExpectationError, table_parser.MissingTokenError):
+        return tokens, None
+
+def describe(token):
+    return (token.token_type, token.token_value, token.token_line, token.token_offset, token.token_column)
+
+def same_tree(left, right):
+    stack = [(left, right)]
+    while stack:
+        a, b = stack.pop()
+        if a.val != b.val or (a.token is None) != (b.token is None):
+            return False
+        if a.token is not None:
+            if describe(a.token) != describe(b.token):
+                return False
+            continue
+        if len(a.children) != len(b.children):
+            return False
+        stack.extend(zip(a.children, b.children))
+    return True
+
+def random_edit(rng, length):
+    start = rng.randrange(length)
+    end = min(length, start + rng.choice((0, 0, 1, 2, 5)))
+    return start, end, rng.choice(SNIPPETS)
+
+# allowed growth of the median edit latency from the smallest to the largest program of --scaling, as a factor
+# plus a slack that keeps timer noise on sub-millisecond edits from failing the run
+SCALING_FACTOR = 3
+SCALING_SLACK = 0.5e-3
+
+# token types a statement can start with, grab() is inserted before them by valid_edit
+STATEMENT_STARTS = frozenset(('MOVE', 'SHOOT', 'GRAB', 'IF', 'WHILE', 'PRINT_POSITION'))
+
+def valid_edit(rng, document):
+    # an edit that keeps the program valid, so that the document's tree is patched in place
+    token = rng.choice(document.tokens)
+    start = token.token_offset
+    choice = rng.random()
+    if token.token_type in ('ID', 'INTEGER') and choice < 0.5:
+        position = start + rng.randrange(len(token.token_value) + 1)
+        if len(token.token_value) > 1 and choice < 0.2:
+            return position - (position == start + len(token.token_value)), position + (position == start), ''
+        return position, position, 'q' if token.token_type == 'ID' else '7'
+    if token.token_type in STATEMENT_STARTS and choice < 0.8:
+        return start, start, 'grab() '
+    return start, start, rng.choice(('\n', '  ', '\n$ note $\n'))
+
+def check(source, edits, seed, valid=False):
+    # apply edits one after the other and compare with full re-parses
+    rng = random.Random(seed)
+    document = Document(source)
+    for n in range(edits):
+        start, end, text = valid_edit(rng, document) if valid else random_edit(rng, document.length)
+        update = document.edit(start, end, text)
+        tokens, tree = full_parse(document.source)
+        if [describe(token) for token in document.tokens] != [describe(token) for token in tokens]:
+            print(f'edit {n}: token MISMATCH after replacing [{start}:{end}] with {text!r}')
+            return False
+        if (tree is None) != (update.tree is None) or (tree is not None and not same_tree(tree, update.tree)):
+            print(f'edit {n}: tree MISMATCH after replacing [{start}:{end}] with {text!r}')
+            return False
+    return True
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('-n', '--copies', help='Number of functions and play body repetitions, timed at this size and five times it', type=int, default=1000)
+    parse.add_argument('-e', '--edits', help='Random edits checked against a full re-parse', type=int, default=300)
+    parse.add_argument('-s', '--seed', type=int, default=1)
+    parse.add_argument('--scaling', help='Comma separated line counts of generated programs the edit latency must not grow across', type=str, default='1000,50000')
+    parse.add_argument('-r', '--repeat', help='Timed runs of every scaling edit, the median is kept', type=int, default=21)
+    args = parse.parse_args()
+
+    if not check(generate(20), args.edits, args.seed) or not check(generate(20), args.edits, args.seed, valid=True):
+        sys.exit(1)
+    print(f'{args.edits} random edits and {args.edits} edits that keep the program valid match a full re-lex and re-parse')
+
+    for copies in (args.copies, args.copies * 5):
+        time_edits(copies)
+
+    sizes = [int(size) for size in args.scaling.split(',')]
+    timings = {size: time_scaling(size, args.seed, args.repeat) for size in sizes}
+    failed = False
+    for edit in SCALING_EDITS:
+        small, large = timings[sizes[0]][edit], timings[sizes[-1]][edit]
+        if large > small * SCALING_FACTOR + SCALING_SLACK:
+            print(f'SLOWER: {edit} takes {large * 1000:.2f} ms at {sizes[-1]} lines against {small * 1000:.2f} ms at {sizes[0]}')
+            failed = True
+    if failed:
+        sys.exit(1)
+    print(f'edit latency does not grow from {sizes[0]} to {sizes[-1]} lines')
+
+def time_edits(copies):
+    source = generate(copies)
+    document = Document(source)
+    print(f'{source.count(chr(10))} lines, {len(document.tokens)} tokens')
+    # type one character into the middle of a function body, then take it out again; the first edit
+    # also moves the document's gap from the end of the tokens to the edit
+    position = source.index('a = a + 1', len(source) // 3)
+    start = time.perf_counter()
+    full_parse(source[:position] + 'b' + source[position:])
+    full = time.perf_counter() - start
+    start = time.perf_counter()
+    update = document.edit(position, position, 'b')
+    insert = time.perf_counter() - start
+    start = time.perf_counter()
+    document.edit(position, position + 1, '')
+    delete = time.perf_counter() - start
+    # then keep typing there, timing the re-lex apart from the re-parse
+    word = 'counter'
+    relexing = editing = 0
+    for i, char in enumerate(word):
+        start = time.perf_counter()
+        first, old_stop, new_stop = document.relex(position + i, position + i, char)
+        relexing += time.perf_counter() - start
+        document.reuse.replaced(first, old_stop, new_stop)
+        start = time.perf_counter()
+        document.parse()
+        editing += time.perf_counter() - start
+    editing += relexing
+    print(f'  full re-lex and re-parse {full * 1000:8.2f} ms')
+    print(f'  first insert             {insert * 1000:8.2f} ms  ({update.reused} subtrees reused, {update.tokens[1] - update.tokens[0]} tokens re-lexed)')
+    print(f'  delete                   {delete * 1000:8.2f} ms')
+    print(f'  typing, per character    {editing / len(word) * 1000:8.2f} ms  (re-lex {relexing / len(word) * 1000:.3f} ms)')
+
+# the edits timed by time_scaling, each undone after it is timed
+SCALING_EDITS = ('digit after a statement', 'statement at the top')
+
+def time_scaling(lines, seed, repeat):
+    # median latency of every edit of SCALING_EDITS on a generated program of that many lines
+    source = wumpus_generator.generate(lines, seed=seed)
+    document = Document(source)
+    # an assignment of 0 just before a while statement, halfway down the play block: the digit typed
+    # after it lies outside the statement, which is followed by the unchanged while
+    play = source.index('play {')
+    assignments = list(re.finditer(r'i\d+ = 0()\n *while', source[play:]))
+    digit = play + assignments[len(assignments) // 2].start(1)
+    top = play + len('play {\n')
+    edits = {'digit after a statement': (digit, '5'), 'statement at the top': (top, '  grab()\n')}
+    timings = {}
+    for edit in SCALING_EDITS:
+        position, text = edits[edit]
+        # the first edit also moves the document's gap there
+        document.edit(position, position, text)
+        document.edit(position, position + len(text), '')
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            update = document.edit(position, position, text)
+            latencies.append(time.perf_counter() - start)
+            if update.tree is None:
+                print(f'{edit}: syntax error {update.error}')
+                sys.exit(1)
+            document.edit(position, position + len(text), '')
+        timings[edit] = statistics.median(latencies)
+    print(f'{lines} lines: ' + ', '.join(f'{edit} {timings[edit] * 1000:.3f} ms' for edit in SCALING_EDITS))
+    return timings
+
+if __name__ == '__main__':
+    main()
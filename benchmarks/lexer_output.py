@@ -0,0 +1,52 @@
+# Cost of the lexer's output modes on a generated program: the colored token table against the streaming
+# plain, JSON Lines and CSV writers, all on tokens lexed beforehand so only the output is timed
+
+import os
+import io
+import sys
+import time
+import contextlib
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lexer
+import wumpus_generator
+
+def best_of(repeat, function):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('-n', '--lines', help='Lines of the generated program', type=int, default=20000)
+    parse.add_argument('-r', '--repeat', help='Runs of every mode, the fastest is kept', type=int, default=3)
+    parse.add_argument('--engine', choices=lexer.ENGINES, default='scanner')
+    parse.add_argument('-s', '--seed', type=int, default=0)
+    args = parse.parse_args()
+
+    source = wumpus_generator.generate(args.lines, seed=args.seed)
+    toks = list(lexer.tokenize(source, engine=args.engine))
+    lexing = best_of(args.repeat, lambda: list(lexer.tokenize(source, engine=args.engine)))
+    print(f'{args.lines} lines, {len(toks)} tokens, lexing {lexing:.3f} s')
+
+    def table():
+        with open(os.devnull, 'w', encoding='utf8') as output_file, contextlib.redirect_stdout(output_file):
+            lexer.write_plain_tokens(lexer.run_lexer(source, None, args.engine, toks), output_file)
+    timings = {'table': best_of(args.repeat, table)}
+    for output_format, writer in lexer.TOKEN_WRITERS.items():
+        if output_format == 'binary':
+            timings[output_format] = best_of(args.repeat, lambda: writer(lexer.token_records(toks, source), io.BytesIO()))
+        else:
+            with open(os.devnull, 'w', encoding='utf8', newline='') as output_file:
+                timings[output_format] = best_of(args.repeat, lambda: writer(lexer.token_records(toks, source), output_file))
+    for mode, seconds in timings.items():
+        print(f'{mode:<8}{seconds:>8.3f} s  {len(toks) / seconds:>12,.0f} tokens/s  {seconds / lexing:6.2f}x lexing')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# Node count and full-walk time of the CST against the AST produced by wumpus_ast.lower
+# The input is tests/code3.txt rewritten to what the grammar accepts (no local declarations, calls only
+# on the right of an assignment), with its functions and play body repeated
+
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lexer
+import table_parser
+import wumpus_ast
+from wumpus_parser import Token
+
+FUNCTIONS = '''function int add{n}(int a, int b) {{
+  return a + b
+}}
+
+function bool either{n}(bool a, bool b) {{
+  return a
+}}
+
+function void walk{n}(int a) {{
+  while (i < a) {{
+    move(north)
+    i = i + 1
+  }}
+}}
+
+'''
+
+INIT = '''init {
+  grid_size(6, 6)
+  place_agent(0, 0)
+  place_wumpus(4, 4)
+  place_gold(3, 3)
+  place_pit(1, 4)
+  place_pit(3, 2)
+}
+
+play {
+'''
+
+BODY = '''  found = either{n}(myFlag, myFlag)
+  if (found == true and sense_glitter()) {{
+    grab()
+    done = walk{n}(size)
+  }}
+  sum = add{n}(size, size)
+  i = 0
+  while (i < sum) {{
+    move(east)
+    i = i + 1
+  }}
+'''
+
+class ListTokenStream:
+    # peek/pop over tokens that were lexed beforehand
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.index = 0
+
+    def pop(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.index + offset, len(self.tokens) - 1)]
+
+def walk_cst(root):
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if node.children:
+            stack.extend(node.children)
+    return count
+
+def walk_ast(root):
+    count = 0
+    for _ in wumpus_ast.walk(root):
+        count += 1
+    return count
+
+def best_of(repeat, function, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('-n', '--copies', help='Number of copies of the functions and the play body', type=int, default=500)
+    parse.add_argument('-r', '--repeat', help='Timing runs, the best one is reported', type=int, default=5)
+    args = parse.parse_args()
+
+    source = 'const int size = 6\nconst bool myFlag = true\n\n'
+    source += ''.join(FUNCTIONS.format(n=n) for n in range(args.copies))
+    source += INIT + ''.join(BODY.format(n=n) for n in range(args.copies)) + '}\n'
+    tokens = [Token((tok.type, tok.value, tok.lineno, tok.lexpos)) for tok in lexer.tokenize(source, engine='scanner') if tok.type != 'COMMENT']
+    tokens.append(Token(['EOF', 'EOF', 'EOF', 'EOF']))
+    print(f'{source.count(chr(10))} lines, {len(tokens)} tokens')
+
+    cst = table_parser.parse(ListTokenStream(tokens))
+    ast, lowering = best_of(args.repeat, wumpus_ast.lower, cst)
+    cst_nodes, cst_walk = best_of(args.repeat, walk_cst, cst)
+    ast_nodes, ast_walk = best_of(args.repeat, walk_ast, ast)
+    print(f'CST {cst_nodes:>9} nodes  walk {cst_walk * 1000:8.2f} ms')
+    print(f'AST {ast_nodes:>9} nodes  walk {ast_walk * 1000:8.2f} ms  lowering {lowering * 1000:8.2f} ms')
+    print(f'AST/CST nodes {ast_nodes / cst_nodes:.2f}  walk {ast_walk / cst_walk:.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Parallel lexing against sequential lexing: the token files must be byte-identical, for both engines
+# and every token file format, on generated programs and on inputs full of comments, blank line runs
+# and the lexer's awkward cases; then the time of each on a large generated program
+
+import os
+import io
+import sys
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lexer
+import wumpus_generator
+
+FRAGMENTS = [
+    'move', 'north', 'while', 'and', 'x', 'abcdefghijklmnopqrstuvwxyz', '0', '42', '(', ')', '{', '}',
+    '=', '==', '!=', '!', '<', '>=', '$ note $', '$ open', '$$ $', '$', ' ', '\t', '\r', '\n', '\n\n\n', '#', 'é',
+]
+
+def sequential(source, output_format, engine):
+    # the token file lexer.main writes without -j
+    stream = lexer.token_records(lexer.tokenize(source, engine=engine), source)
+    if output_format == 'binary':
+        output_file = io.BytesIO()
+        lexer.write_binary_tokens(stream, output_file)
+        return output_file.getvalue()
+    output_file = io.StringIO(newline='')
+    lexer.TOKEN_WRITERS[output_format](stream, output_file)
+    return output_file.getvalue().encode('utf8')
+
+def parallel(source, output_format, engine, workers, chunk_size):
+    if output_format == 'binary':
+        output_file = io.BytesIO()
+        lexer.write_tokens_parallel(source, output_file, output_format, engine, workers, chunk_size)
+        return output_file.getvalue()
+    output_file = io.StringIO(newline='')
+    lexer.write_tokens_parallel(source, output_file, output_format, engine, workers, chunk_size)
+    return output_file.getvalue().encode('utf8')
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('-n', '--lines', help='Lines of the generated program that is timed', type=int, default=200000)
+    parse.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    parse.add_argument('--cases', help='Random inputs to compare', type=int, default=50)
+    parse.add_argument('--seed', type=int, default=0)
+    args = parse.parse_args()
+
+    rng = random.Random(args.seed)
+    sources = [('generated', wumpus_generator.generate(3000, seed=args.seed))]
+    sources += [(f'random {i}', ''.join(rng.choice(FRAGMENTS) for _ in range(2000))) for i in range(args.cases)]
+    for name, source in sources:
+        for engine in lexer.ENGINES:
+            for output_format in lexer.TOKEN_WRITERS:
+                expected = sequential(source, output_format, engine)
+                # tiny chunks put a boundary after almost every newline
+                for chunk_size in (1, 97, 4096):
+                    if parallel(source, output_format, engine, args.workers, chunk_size) != expected:
+                        print(f'MISMATCH in {name}, {engine} engine, {output_format} format, chunks of {chunk_size}')
+                        sys.exit(1)
+    print(f'{len(sources)} inputs lex identically in parallel, for both engines and every format')
+
+    source = wumpus_generator.generate(args.lines, seed=args.seed)
+    print(f'{args.lines} lines, {len(source) / 1e6:.1f} MB')
+    for engine in lexer.ENGINES:
+        start = time.perf_counter()
+        sequential(source, 'plain', engine)
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        parallel(source, 'plain', engine, args.workers, lexer.PARALLEL_CHUNK_SIZE)
+        parallel_elapsed = time.perf_counter() - start
+        print(f'{engine:<8} sequential {elapsed:7.3f} s   {args.workers} workers {parallel_elapsed:7.3f} s')
+
+if __name__ == '__main__':
+    main()
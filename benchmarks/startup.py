@@ -0,0 +1,53 @@
+# Startup benchmark for the lexer: how long it takes to import the module and to build the lexer tables
+# Every measurement runs in a fresh interpreter, since that is how the lexer is invoked in grading batches
+
+import os
+import sys
+import subprocess
+import tempfile
+import statistics
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter and prints the import time and the table build time in seconds
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+import lexer
+imported = time.perf_counter()
+lexer.LEXTAB_DIR = sys.argv[1]
+lexer.build_lexer(optimize=sys.argv[2] == '1')
+built = time.perf_counter()
+print(imported - start, built - imported)
+'''
+
+def probe(lextab_dir, optimize):
+    result = subprocess.run([sys.executable, '-c', PROBE, lextab_dir, '1' if optimize else '0'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    import_time, build_time = map(float, result.stdout.split())
+    return import_time, build_time
+
+def measure(label, runs, lextab_dir, optimize, clear=False):
+    imports, builds = [], []
+    for _ in range(runs):
+        if clear:
+            for name in os.listdir(lextab_dir):
+                os.remove(os.path.join(lextab_dir, name))
+        import_time, build_time = probe(lextab_dir, optimize)
+        imports.append(import_time)
+        builds.append(build_time)
+    print(f'{label:<28} import {statistics.median(imports) * 1000:8.2f} ms   tables {statistics.median(builds) * 1000:8.2f} ms')
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('-n', '--runs', help='Number of interpreter launches per measurement', type=int, default=10)
+    args = parse.parse_args()
+
+    with tempfile.TemporaryDirectory() as lextab_dir:
+        measure('rebuild from rules', args.runs, lextab_dir, optimize=False)
+        measure('optimized, no cached lextab', args.runs, lextab_dir, optimize=True, clear=True)
+        measure('optimized, cached lextab', args.runs, lextab_dir, optimize=True)
+
+if __name__ == '__main__':
+    main()
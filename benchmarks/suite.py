@@ -0,0 +1,183 @@
+# Scalable benchmark of the front end on synthetic programs from wumpus_generator
+# For every size (1K, 100K and 1M lines by default) the lex, parse and render stages run in a fresh
+# interpreter, which reports tokens/s, nodes/s, seconds and the peak RSS after each stage. The results
+# are written as JSON and checked against benchmarks/baseline.json (or --baseline): any stage slower or
+# bigger than the baseline by more than the tolerance is reported and the suite exits with status 1.
+# --update-baseline stores the results instead, --no-baseline skips the check. Every stage runs --repeat
+# times and the fastest run is kept, so a single slow run does not count as a regression. A size with no
+# entry in the baseline is reported too, so every size measured is checked.
+
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import subprocess
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import wumpus_generator
+
+STAGES = ('lex', 'parse', 'render')
+DEFAULT_SIZES = '1000,100000,1000000'
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+# differences below these are timer and allocator noise, not regressions
+NOISE_SECONDS = 0.005
+NOISE_MB = 2.0
+
+def peak_mb():
+    # peak resident set size of this process so far, None where the resource module is missing
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def measure(path, parser, repeat):
+    # runs in the child interpreter: every stage repeat times, keeping the fastest run
+    import lexer
+    import table_parser
+    import wumpus_parser
+    from wumpus_parser import LexerTokenStream, render_tree, count_nodes
+    parse_tokens = table_parser.parse if parser == 'table' else wumpus_parser.parse_program
+
+    with open(path, 'r') as file:
+        source = file.read()
+    stages = {}
+    start_mb = peak_mb()
+
+    best = float('inf')
+    for _ in range(repeat):
+        tokens = None
+        start = time.perf_counter()
+        tokens = list(lexer.tokenize(source, engine='scanner'))
+        best = min(best, time.perf_counter() - start)
+    stages['lex'] = {'seconds': best, 'tokens_per_second': len(tokens) / best, 'peak_mb': peak_mb()}
+
+    best = float('inf')
+    for _ in range(repeat):
+        cst = None
+        start = time.perf_counter()
+        cst = parse_tokens(LexerTokenStream(tokens))
+        best = min(best, time.perf_counter() - start)
+    nodes = count_nodes(cst)
+    stages['parse'] = {'seconds': best, 'tokens_per_second': len(tokens) / best, 'nodes_per_second': nodes / best, 'peak_mb': peak_mb()}
+
+    best = float('inf')
+    for _ in range(repeat):
+        with open(os.devnull, 'w', encoding='utf8') as output_file:
+            start = time.perf_counter()
+            render_tree(cst, output_file)
+            best = min(best, time.perf_counter() - start)
+    stages['render'] = {'seconds': best, 'nodes_per_second': nodes / best, 'peak_mb': peak_mb()}
+
+    return {'lines': source.count('\n'), 'bytes': len(source), 'tokens': len(tokens), 'nodes': nodes, 'start_mb': start_mb, 'stages': stages}
+
+def run_size(path, parser, repeat):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', path, '--parser', parser, '--repeat', str(repeat)],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f'Benchmark of {path} failed:\n{result.stderr}')
+    return json.loads(result.stdout)
+
+def source_file(directory, lines, shape, seed):
+    # the generated program for a size, written once and reused while its shape and seed stay the same
+    name = f'wumpus_{lines}_{seed}_{"_".join(str(value) for value in vars(shape).values())}.txt'
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        with open(path, 'w', encoding='utf8') as file:
+            file.write(wumpus_generator.generate(lines, shape, seed))
+    return path
+
+def compare(results, baseline, tolerance):
+    # the regressions of results against baseline, as messages
+    regressions = []
+    if baseline.get('parser') != results['parser'] or baseline.get('shape') != results['shape']:
+        regressions.append('The baseline was measured with another parser or program shape, rerun with --update-baseline')
+        return regressions
+    for size, measured in results['sizes'].items():
+        expected = baseline['sizes'].get(size)
+        if expected is None:
+            # a size measured but never checked would pass whatever it costs
+            regressions.append(f'{size} lines has no baseline, rerun with --update-baseline or leave it out of --sizes')
+            continue
+        for stage in STAGES:
+            now = measured['stages'][stage]
+            before = expected['stages'][stage]
+            if now['seconds'] > before['seconds'] * (1 + tolerance) and now['seconds'] - before['seconds'] > NOISE_SECONDS:
+                regressions.append(f'{stage} at {size} lines took {now["seconds"]:.3f} s, the baseline is {before["seconds"]:.3f} s')
+            if now['peak_mb'] is not None and before['peak_mb'] is not None:
+                if now['peak_mb'] > before['peak_mb'] * (1 + tolerance) and now['peak_mb'] - before['peak_mb'] > NOISE_MB:
+                    regressions.append(f'{stage} at {size} lines peaked at {now["peak_mb"]:.1f} MB, the baseline is {before["peak_mb"]:.1f} MB')
+    return regressions
+
+def report(size, measured):
+    print(f'{size} lines: {measured["tokens"]} tokens, {measured["nodes"]} nodes')
+    for stage in STAGES:
+        stats = measured['stages'][stage]
+        rates = '  '.join(f'{stats[key]:>12,.0f} {key.split("_")[0]}/s' for key in ('tokens_per_second', 'nodes_per_second') if key in stats)
+        peak = '' if stats['peak_mb'] is None else f'{stats["peak_mb"]:>9.1f} MB peak'
+        print(f'  {stage:<8}{stats["seconds"]:>10.3f} s  {peak}  {rates}')
+
+def main():
+    parse = argparse.ArgumentParser(description='Benchmark lexing, parsing and rendering of generated programs at several sizes')
+    parse.add_argument('-n', '--sizes', help='Comma separated program sizes in lines', type=str, default=DEFAULT_SIZES)
+    parse.add_argument('--parser', help='Parser to benchmark', choices=('recursive', 'table'), default='recursive')
+    parse.add_argument('-r', '--repeat', help='Runs of every stage, the fastest is kept', type=int, default=5)
+    parse.add_argument('-s', '--seed', type=int, default=0)
+    parse.add_argument('-o', '--output', help='File the results are written to as JSON', type=str, default='benchmark_results.json')
+    parse.add_argument('--baseline', help='Baseline JSON to check the results against', type=str, default=DEFAULT_BASELINE)
+    parse.add_argument('--update-baseline', help='Write the results as the new baseline', action='store_true')
+    parse.add_argument('--no-baseline', help='Do not check the results against the baseline', action='store_true')
+    parse.add_argument('--tolerance', help='Slowdown or growth over the baseline that counts as a regression', type=float, default=0.25)
+    parse.add_argument('--source-dir', help='Directory the generated programs are kept in', type=str,
+                       default=os.path.join(tempfile.gettempdir(), 'wumpus_benchmark_sources'))
+    parse.add_argument('--child', help=argparse.SUPPRESS, type=str)
+    args = parse.parse_args()
+
+    if args.child:
+        json.dump(measure(args.child, args.parser, args.repeat), sys.stdout)
+        return
+
+    shape = wumpus_generator.Shape()
+    os.makedirs(args.source_dir, exist_ok=True)
+    results = {
+        'parser': args.parser,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'shape': dict(vars(shape), seed=args.seed),
+        'sizes': {},
+    }
+    for lines in (int(size) for size in args.sizes.split(',')):
+        path = source_file(args.source_dir, lines, shape, args.seed)
+        measured = results['sizes'][str(lines)] = run_size(path, args.parser, args.repeat)
+        report(lines, measured)
+
+    with open(args.output, 'w', encoding='utf8') as file:
+        json.dump(results, file, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf8') as file:
+            json.dump(results, file, indent=2)
+        print(f'Baseline written to {args.baseline}')
+    elif not args.no_baseline:
+        if not os.path.exists(args.baseline):
+            print(f'No baseline at {args.baseline}, run with --update-baseline to create one')
+            sys.exit(1)
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION: {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'No stage regressed by more than {args.tolerance:.0%} against {args.baseline}')
+
+if __name__ == '__main__':
+    main()
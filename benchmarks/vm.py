@@ -0,0 +1,61 @@
+# Throughput of the bytecode VM on a tight while loop, with a recursive call chain and agent actions
+# Reports compile time and executed instructions per second
+
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import table_parser
+from lexer import tokenize
+from wumpus_parser import LexerTokenStream
+from wumpus_vm import VM, compile_program
+
+SOURCE = '''const int limit = {iterations}
+function int depth(int n) {{
+  if (n == 0) {{ return 0 }}
+  m = n - 1
+  r = depth(m)
+  return r + 1
+}}
+init {{
+  grid_size(8, 8)
+  place_agent(0, 0)
+  place_wumpus(7, 7)
+  place_gold(7, 0)
+}}
+play {{
+  i = 0
+  total = 0
+  while (i < limit) {{
+    total = total + i * 2 - (i / 3)
+    if (total > 1000000 or sense_stench()) {{ total = 0 }}
+    i = i + 1
+  }}
+  tenth = limit / 10
+  d = depth(tenth)
+  move(east)
+}}
+'''
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('-n', '--iterations', help='Loop iterations, a tenth of it is the recursion depth', type=int, default=100000)
+    args = parse.parse_args()
+
+    start = time.perf_counter()
+    cst = table_parser.parse(LexerTokenStream(tokenize(SOURCE.format(iterations=args.iterations), engine='scanner')))
+    bytecode = compile_program(cst)
+    compiled = time.perf_counter() - start
+    vm = VM(bytecode)
+    start = time.perf_counter()
+    result = vm.run(max_steps=sys.maxsize)
+    seconds = time.perf_counter() - start
+    print(f'parse and compile {compiled * 1000:8.2f} ms')
+    print(f'run {seconds:8.3f} s  {result.steps} instructions  {result.steps / seconds:,.0f} instructions/s  ({result.outcome})')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# Array-backed storage for the CST
+# Instead of one TreeNode object per node (with its __dict__, children list and parent cycle),
+# every node is a row in a few parallel typed arrays, and node names are interned to small ids.
+
+import io
+from array import array
+from wumpus_parser import render_tree
+
+NO_NODE = -1
+
+class CSTArena:
+    '''
+    A CST stored as parallel columns, one row per node
+    kind:         interned id of the node's name (kinds[kind] is the name)
+    token:        index of the node's token in tokens, NO_NODE for inner nodes
+    first_child:  row of the first child, NO_NODE if there is none
+    next_sibling: row of the next child of the same parent, NO_NODE for the last one
+    last_child:   row of the last child, so that children can be appended in O(1) while building
+    Row 0 is the root once the tree is built
+    '''
+    def __init__(self):
+        self.kind = array('H')
+        self.token = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.last_child = array('i')
+        self.kinds = []
+        self.kind_ids = {}
+        self.tokens = []
+
+    def __len__(self):
+        return len(self.kind)
+
+    def intern(self, val):
+        kind = self.kind_ids.get(val)
+        if kind is None:
+            kind = self.kind_ids[val] = len(self.kinds)
+            self.kinds.append(val)
+        return kind
+
+    def add_node(self, val, parent=NO_NODE, token=None):
+        # append a node as the last child of parent and return its row
+        index = len(self.kind)
+        self.kind.append(self.intern(val))
+        if token is None:
+            self.token.append(NO_NODE)
+        else:
+            self.token.append(len(self.tokens))
+            self.tokens.append(token)
+        self.first_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        self.last_child.append(NO_NODE)
+        if parent != NO_NODE:
+            last = self.last_child[parent]
+            if last == NO_NODE:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[last] = index
+            self.last_child[parent] = index
+        return index
+
+    @classmethod
+    def from_tree(cls, root):
+        # copy a TreeNode tree into a new arena, without recursion
+        arena = cls()
+        stack = [(root, NO_NODE)]
+        while stack:
+            node, parent = stack.pop()
+            index = arena.add_node(node.val, parent, node.token)
+            if node.children:
+                for child in reversed(node.children):
+                    stack.append((child, index))
+        return arena
+
+    def children_of(self, index):
+        rows = []
+        child = self.first_child[index]
+        while child != NO_NODE:
+            rows.append(child)
+            child = self.next_sibling[child]
+        return rows
+
+    def node(self, index=0):
+        return NodeView(self, index)
+
+    @property
+    def root(self):
+        return NodeView(self, 0)
+
+class NodeView:
+    '''
+    Read-only view of one arena row with the TreeNode attributes consumers use: val, children and token
+    Like TreeNode, a node with a token has children None
+    '''
+    __slots__ = ('arena', 'index')
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    @property
+    def val(self):
+        return self.arena.kinds[self.arena.kind[self.index]]
+
+    @property
+    def token(self):
+        token = self.arena.token[self.index]
+        return None if token == NO_NODE else self.arena.tokens[token]
+
+    @property
+    def children(self):
+        if self.arena.token[self.index] != NO_NODE:
+            return None
+        arena = self.arena
+        return [NodeView(arena, child) for child in arena.children_of(self.index)]
+
+    def __eq__(self, other):
+        return isinstance(other, NodeView) and self.arena is other.arena and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.arena), self.index))
+
+    def __str__(self):
+        buffer = io.StringIO()
+        render_tree(self, buffer)
+        return buffer.getvalue()
@@ -0,0 +1,617 @@
+# Incremental re-lexing and re-parsing of a source that is edited in place
+# An edit is re-lexed from the start of its line (comments never span lines, so every line start
+# is a safe restart point) until the new tokens line up with the old ones again, and the tokens
+# after that point are kept. The table parser then splices in every function_declaration,
+# init_block, block and statement subtree whose tokens did not change.
+# The source is kept as a list of lines and the tokens after the last edit hold their offset and
+# line counted from the end of the document, like the text after the gap of a gap buffer, so an
+# edit touches the lines and tokens it re-lexes and the tokens between it and the previous edit,
+# not everything up to the end of the file. When the re-lexed tokens lie well inside one reusable
+# subtree, only that subtree is parsed again and put in place of the old one; otherwise the statements
+# (or declarations) of the enclosing list are parsed again from the edit until one starts where an old
+# one did past it. Only when neither applies is the whole program parsed again, with subtree reuse.
+
+import sys
+from bisect import bisect_right
+
+import table_parser
+from lexer import scan, LineIndex, TOKEN_KIND
+from wumpus_parser import Token, UNKNOWN_KIND, edge_token
+
+COMMENT_KIND = TOKEN_KIND['COMMENT']
+# subtrees that are reused when none of their tokens changed
+# statements are included so that a long play block is not re-parsed in full for a one-statement edit
+REUSABLE = frozenset(('function_declaration', 'init_block', 'block', 'statement'))
+# nodes holding a list of items, which can be parsed again item by item, and the symbols of those items
+SEQUENCES = {
+    'play_block': ('statement',),
+    'block': ('statement',),
+    'declarations': ('function_declaration', 'constant_declaration'),
+    'init_block': ('init_statement',),
+}
+# lists that must keep at least one item
+NONEMPTY_SEQUENCES = frozenset(('play_block', 'block'))
+# lines scanned past the edit before the window is doubled, when the tokens have not lined up yet
+RESYNC_LINES = 4
+
+def make_token(tok, line_start):
+    # line_start is the offset of the first character of the token's line
+    return Token((tok.type, tok.value, tok.lineno, tok.lexpos), None, tok.lexpos - line_start + 1)
+
+def token_end(token):
+    return token.token_offset + len(token.token_value)
+
+def split_lines(text):
+    # text as lines that keep their newline, the last one (possibly empty) without
+    pieces = text.split('\n')
+    lines = [piece + '\n' for piece in pieces[:-1]]
+    lines.append(pieces[-1])
+    return lines
+
+def first_at(tokens, offset):
+    # index of the first token that starts at or after offset
+    low, high = 0, len(tokens)
+    while low < high:
+        middle = (low + high) // 2
+        if tokens[middle].token_offset < offset:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+def child_index(node, offset):
+    # index of the last child of node that starts at or before offset, None if there is none
+    # children without tokens (an empty <declarations>) are passed over
+    children = node.children
+    low, high = 0, len(children)
+    while low < high:
+        middle = (low + high) // 2
+        first = None
+        start = middle
+        while start < high:
+            first = edge_token(children[start])
+            if first is not None:
+                break
+            start += 1
+        if first is None:
+            high = middle
+        elif first.token_offset <= offset:
+            low = start + 1
+        else:
+            high = middle
+    while low and edge_token(children[low - 1]) is None:
+        low -= 1
+    return low - 1 if low else None
+
+class DocumentToken(Token):
+    '''
+    A token of a Document, whose offset and line are read through the document
+    While tail is set they are stored counted from the end of the document (its length and its
+    line count), so they stay right when text before the token is edited
+    '''
+    def __init__(self, tok, column, document):
+        self.token_type = tok.type
+        self.token_value = tok.value
+        self.token_column = column
+        self.kind = TOKEN_KIND.get(tok.type, UNKNOWN_KIND)
+        self.document = document
+        self.offset = tok.lexpos
+        self.line = tok.lineno
+        self.tail = False
+
+    @property
+    def token_offset(self):
+        return self.document.length - self.offset if self.tail else self.offset
+
+    @property
+    def token_line(self):
+        return self.document.line_count - self.line if self.tail else self.line
+
+    def move_to_tail(self):
+        if not self.tail:
+            self.offset = self.document.length - self.offset
+            self.line = self.document.line_count - self.line
+            self.tail = True
+
+    def move_to_head(self):
+        if self.tail:
+            self.offset = self.document.length - self.offset
+            self.line = self.document.line_count - self.line
+            self.tail = False
+
+class DocumentTokenStream:
+    '''
+    Token stream over the document's token list, which still holds the COMMENT tokens
+    index is the position of the next token in that list, last the position of the last one popped
+    '''
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.eof = Token(['EOF', 'EOF', 'EOF', 'EOF'])
+        self.last = -1
+        # syntax errors collected by wumpus_parser.parse_recovering, None when they are raised
+        self.diagnostics = None
+        self.seek(0)
+
+    def seek(self, index):
+        tokens = self.tokens
+        while index < len(tokens) and tokens[index].kind == COMMENT_KIND:
+            index += 1
+        self.index = index
+
+    def pop(self):
+        token = self.peek()
+        if self.index < len(self.tokens):
+            self.last = self.index
+            self.seek(self.index + 1)
+        return token
+
+    def peek(self, offset=0):
+        tokens = self.tokens
+        index = self.index
+        while offset and index < len(tokens):
+            index += 1
+            while index < len(tokens) and tokens[index].kind == COMMENT_KIND:
+                index += 1
+            offset -= 1
+        return tokens[index] if index < len(tokens) else self.eof
+
+class SubtreeReuse:
+    '''
+    The table parser's reuse hook
+    entries maps id(first token) -> (node, first token, last token, token count) for the REUSABLE nodes
+    of the current tree. A node can be spliced into a new parse when its first and last tokens are
+    still the same objects at the same distance, and that range, plus the one token after it the parser
+    may have peeked at, does not overlap a dirty range, i.e. a range of token positions that was
+    re-lexed since the tree was built.
+    '''
+    symbols = REUSABLE
+
+    def __init__(self):
+        self.entries = {}
+        self.dirty = []
+        self.begin()
+
+    def begin(self):
+        # state of one parse
+        self.fresh = {}
+        self.starts = []
+        self.reused = []
+
+    def lookup(self, symbol, token_stream):
+        tokens = token_stream.tokens
+        index = token_stream.index
+        if index >= len(tokens):
+            return None
+        entry = self.entries.get(id(tokens[index]))
+        if entry is None:
+            return None
+        node, first, last, count = entry
+        end = index + count
+        if node.val != symbol or first is not tokens[index] or end > len(tokens) or tokens[end - 1] is not last:
+            return None
+        # the dirty ranges are sorted and disjoint, so only the last one starting at or before end can overlap
+        dirty = self.dirty
+        overlap = bisect_right(dirty, (end, sys.maxsize))
+        if overlap and dirty[overlap - 1][1] > index:
+            return None
+        token_stream.last = end - 1
+        token_stream.seek(end)
+        self.reused.append((node, node.parent))
+        # add_child only sets the parent (and depth) of an orphan; depth is not refreshed further down
+        node.parent = None
+        return node
+
+    def start(self, node, token_stream):
+        self.starts.append(token_stream.index)
+
+    def finish(self, node, token_stream):
+        tokens = token_stream.tokens
+        first = self.starts.pop()
+        self.fresh[id(tokens[first])] = (node, tokens[first], tokens[token_stream.last], token_stream.last - first + 1)
+
+    def commit(self, *old_trees):
+        # the parse succeeded: forget the old nodes (under old_trees) that did not make it into the new tree
+        reused = {id(node) for node, _ in self.reused}
+        entries = self.entries
+        stack = [tree for tree in old_trees if tree is not None]
+        while stack:
+            node = stack.pop()
+            if id(node) in reused or not node.children:
+                continue
+            if node.val in REUSABLE:
+                first = node.children[0]
+                while first.token is None:
+                    first = first.children[0]
+                key = id(first.token)
+                entry = entries.get(key)
+                if entry is not None and entry[0] is node:
+                    del entries[key]
+            stack.extend(node.children)
+        entries.update(self.fresh)
+        self.dirty = []
+        self.begin()
+
+    def rollback(self):
+        # the parse failed: the old tree stays current, so give its subtrees their parents back
+        for node, parent in self.reused:
+            node.parent = parent
+        self.begin()
+
+    def replaced(self, start, old_end, new_end):
+        # tokens[start:old_end] were replaced by tokens[start:new_end]
+        shift = new_end - old_end
+        dirty = []
+        for first, stop in self.dirty:
+            if first >= old_end:
+                dirty.append((first + shift, stop + shift))
+            elif stop <= start:
+                dirty.append((first, stop))
+            else:
+                start = min(start, first)
+                new_end = max(new_end, stop + shift)
+        dirty.append((start, new_end))
+        dirty.sort()
+        self.dirty = dirty
+
+    def register(self, node, tokens, first, last):
+        # node was parsed from tokens[first:last + 1] outside of a parse that reports it through finish()
+        self.entries[id(tokens[first])] = (node, tokens[first], tokens[last], last - first + 1)
+
+class Update:
+    '''
+    The outcome of Document.edit
+    tree:    the new CST, or None when the edited source has a syntax error (Document.tree keeps the last good one)
+    error:   the syntax error, if any
+    text:    (start, end) character range of the new source covered by the re-lexed tokens
+    tokens:  (start, end) range of the new token list that was re-lexed
+    removed: number of old tokens those replaced
+    reused:  number of subtrees spliced in from the previous tree by the re-parse (the nodes around a patched
+             subtree are kept as they are and not counted)
+    '''
+    def __init__(self, tree, error, text, tokens, removed, reused):
+        self.tree = tree
+        self.error = error
+        self.text = text
+        self.tokens = tokens
+        self.removed = removed
+        self.reused = reused
+
+class Document:
+    '''
+    A source, its tokens (COMMENT included) and its CST, kept up to date through edit()
+    lines is the source split after every newline. tokens[:gap] hold absolute positions and
+    tokens[gap:] positions counted from the end (see DocumentToken), the gap follows the edits.
+    '''
+    def __init__(self, source):
+        self.lines = split_lines(source)
+        self.length = len(source)
+        self.line_count = len(self.lines)
+        starts = LineIndex(source).starts
+        self.tokens = [DocumentToken(tok, tok.lexpos - starts[tok.lineno - 1] + 1, self) for tok in scan(source)]
+        self.gap = len(self.tokens)
+        self.reuse = SubtreeReuse()
+        self.tree = None
+        self.error = None
+        # length of the token list when the tree was last brought up to date
+        self.parsed_length = len(self.tokens)
+        self.parse()
+
+    @property
+    def source(self):
+        # the whole text, joined on every call
+        return ''.join(self.lines)
+
+    def parse(self):
+        # returns the number of subtrees reused, None on a syntax error
+        reused = self.patch()
+        if reused is not None:
+            return reused
+        try:
+            tree = table_parser.parse(DocumentTokenStream(self.tokens), reuse=self.reuse)
+        except (table_parser.ExpectationError, table_parser.MissingTokenError) as e:
+            self.reuse.rollback()
+            self.error = e
+            return None
+        reused = len(self.reuse.reused)
+        self.reuse.commit(self.tree)
+        self.tree = tree
+        self.error = None
+        self.parsed_length = len(self.tokens)
+        return reused
+
+    def index_of(self, token):
+        # position of token in the token list, None when an edit removed it
+        tokens = self.tokens
+        index = first_at(tokens, token.token_offset)
+        return index if index < len(tokens) and tokens[index] is token else None
+
+    def next_significant(self, index):
+        # position of the first token at or after index that is not a COMMENT
+        tokens = self.tokens
+        while index < len(tokens) and tokens[index].kind == COMMENT_KIND:
+            index += 1
+        return index
+
+    def holds(self, node, stop):
+        # node still ends on a token at or after tokens[stop]
+        last = self.index_of(edge_token(node, last=True))
+        return last is not None and last >= stop
+
+    def enclosing(self, first, stop):
+        # the smallest REUSABLE node of the tree whose re-parse cannot differ outside it from a full one:
+        # it holds the token before tokens[first:stop] and the one after, and its first two tokens
+        # (all the lookahead of the nodes above it) are before the range
+        tokens = self.tokens
+        low = tokens[first - 1].token_offset
+        node = self.tree
+        found = None
+        while True:
+            index = child_index(node, low)
+            if index is None:
+                return found
+            child = node.children[index]
+            if child.token is not None or not self.holds(child, stop):
+                return found
+            node = child
+            if node.val in REUSABLE:
+                index = first_at(tokens, edge_token(node).token_offset)
+                significant = 0
+                while index < first and significant < 2:
+                    significant += tokens[index].kind != COMMENT_KIND
+                    index += 1
+                if significant == 2:
+                    found = node
+
+    def sequence(self, first, stop):
+        # the deepest SEQUENCES node of the tree holding the token before tokens[first:stop] and the one after
+        low = self.tokens[first - 1].token_offset
+        node = self.tree
+        found = None
+        while True:
+            index = child_index(node, low)
+            if index is None:
+                return found
+            child = node.children[index]
+            if child.token is not None or not self.holds(child, stop):
+                return found
+            node = child
+            if node.val in SEQUENCES:
+                found = node
+
+    def grow(self, node):
+        # node and the nodes above it hold the dirty range, so their entries now span as many more
+        # tokens as the token list grew by since the last parse
+        growth = len(self.tokens) - self.parsed_length
+        entries = self.reuse.entries
+        while node is not None:
+            if node.val in REUSABLE:
+                key = id(edge_token(node))
+                entry = entries.get(key)
+                if entry is not None and entry[0] is node:
+                    entries[key] = entry[:3] + (entry[3] + growth,)
+            node = node.parent
+
+    def patch(self):
+        # re-parse only around the re-lexed tokens, returns the number of subtrees reused, None when
+        # neither the enclosing node nor the enclosing list can be parsed again on its own
+        dirty = self.reuse.dirty
+        tokens = self.tokens
+        if self.tree is None or not dirty:
+            return None
+        first = dirty[0][0]
+        stop = dirty[-1][1]
+        if first < 1 or stop >= len(tokens):
+            return None
+        reused = self.patch_node(first, stop)
+        if reused is None:
+            reused = self.patch_sequence(first, stop)
+        if reused is not None:
+            self.error = None
+            self.parsed_length = len(tokens)
+        return reused
+
+    def patch_node(self, first, stop):
+        # re-parse the enclosing node of tokens[first:stop] and put it in place of the old one, None when
+        # there is no such node or its re-parse fails or does not end on the old node's last token
+        old = self.enclosing(first, stop)
+        if old is None:
+            return None
+        tokens = self.tokens
+        last_token = edge_token(old, last=True)
+        token_stream = DocumentTokenStream(tokens)
+        token_stream.seek(self.index_of(edge_token(old)))
+        start = token_stream.index
+        try:
+            node = table_parser.parse(token_stream, start=old.val, reuse=self.reuse)
+        except (table_parser.ExpectationError, table_parser.MissingTokenError):
+            self.reuse.rollback()
+            return None
+        if tokens[token_stream.last] is not last_token:
+            self.reuse.rollback()
+            return None
+        reused = len(self.reuse.reused)
+        self.reuse.commit(old)
+        self.reuse.register(node, tokens, start, token_stream.last)
+        parent = old.parent
+        parent.children[parent.children.index(old)] = node
+        node.parent = parent
+        node.depth = old.depth
+        self.grow(parent)
+        return reused
+
+    def patch_sequence(self, first, stop):
+        # re-parse the items of the list enclosing tokens[first:stop], from the last one before the range
+        # whose lookahead did not change, until one starts on the first token of an old child past the
+        # range, and put them in place of the old children in between; None when there is no such list,
+        # or the items stop before lining up, or one of them fails to parse
+        parent = self.sequence(first, stop)
+        if parent is None:
+            return None
+        tokens = self.tokens
+        items = SEQUENCES[parent.val]
+        table = table_parser.load_grammar().table
+        children = parent.children
+        begin = child_index(parent, tokens[first - 1].token_offset)
+        child = children[begin]
+        last = self.index_of(edge_token(child, last=True))
+        if child.val in items and (last is None or self.next_significant(last + 1) >= first):
+            # the edit may extend the item before it (or it holds the edit): parse that one again too
+            position = self.index_of(edge_token(child))
+        elif last is not None and last < first:
+            begin += 1
+            position = last + 1
+        else:
+            return None
+        token_stream = DocumentTokenStream(tokens)
+        token_stream.seek(position)
+        nodes = []
+        spans = []
+        end = begin
+        while True:
+            index = token_stream.index
+            if index >= stop:
+                # line up with the first old child starting at or after this token
+                while end < len(children):
+                    start = self.index_of(edge_token(children[end]))
+                    if start is not None and start >= index:
+                        break
+                    end += 1
+                if end < len(children) and start == index:
+                    break
+            kind = token_stream.peek().kind
+            symbol = next((item for item in items if kind in table[item]), None)
+            if symbol is None or index >= len(tokens):
+                self.reuse.rollback()
+                return None
+            try:
+                nodes.append(table_parser.parse(token_stream, start=symbol, reuse=self.reuse))
+            except (table_parser.ExpectationError, table_parser.MissingTokenError):
+                self.reuse.rollback()
+                return None
+            spans.append((index, token_stream.last))
+        if parent.val in NONEMPTY_SEQUENCES and not nodes and not (
+                begin and children[begin - 1].val in items or end < len(children) and children[end].val in items):
+            self.reuse.rollback()
+            return None
+        reused = len(self.reuse.reused)
+        self.reuse.commit(*children[begin:end])
+        for node, (start, last) in zip(nodes, spans):
+            if node.val in REUSABLE:
+                self.reuse.register(node, tokens, start, last)
+            node.parent = parent
+            node.depth = parent.depth + 1
+        children[begin:end] = nodes
+        self.grow(parent)
+        return reused
+
+    def locate(self, offset):
+        # (index in lines, offset of that line's start) of the line holding offset, walked from the
+        # line of the last token before it, so only the blank lines in between are visited
+        index = first_at(self.tokens, offset + 1) - 1
+        if index < 0:
+            line, line_start = 0, 0
+        else:
+            token = self.tokens[index]
+            line, line_start = token.token_line - 1, token.token_offset - token.token_column + 1
+        lines = self.lines
+        last = len(lines) - 1
+        while line < last and line_start + len(lines[line]) <= offset:
+            line_start += len(lines[line])
+            line += 1
+        return line, line_start
+
+    def move_gap(self, index):
+        tokens = self.tokens
+        for i in range(index, self.gap):
+            tokens[i].move_to_tail()
+        for i in range(self.gap, index):
+            tokens[i].move_to_head()
+        self.gap = index
+
+    def resync(self, window, restart, lineno, start, new_end, delta, complete):
+        # re-lex window (lines of the new source from the one at restart) from its start, returns
+        # (first, stop, fresh, sync) where tokens[first:stop] are replaced by fresh, a list of
+        # (LexToken, window offset of its line start), and sync is the window position of the old token
+        # the scan lined up with; None when the window ended before they lined up and complete,
+        # the window reaching the end of the source, is not set
+        tokens = self.tokens
+        first = first_at(tokens, restart)
+        fresh = []
+        old_index = first
+        for tok in scan(window, 0, lineno):
+            position = restart + tok.lexpos
+            if position >= new_end:
+                # back in unchanged text: stop once a token starts where an old one did
+                while old_index < len(tokens) and tokens[old_index].token_offset < position - delta:
+                    old_index += 1
+                if old_index < len(tokens) and tokens[old_index].token_offset == position - delta:
+                    return first, old_index, fresh, tok.lexpos
+            elif not fresh and first < len(tokens):
+                # tokens before the edit that came out the same keep their old objects
+                token = tokens[first]
+                if token.token_offset == position and token.token_type == tok.type and token.token_value == tok.value and position + len(tok.value) < start:
+                    first += 1
+                    old_index = first
+                    continue
+            fresh.append((tok, window.rfind('\n', 0, tok.lexpos) + 1))
+        return (first, len(tokens), fresh, None) if complete else None
+
+    def relex(self, start, end, text):
+        # replace source[start:end] with text and update the token list, returns the replaced token range
+        lines = self.lines
+        line, restart = self.locate(start)
+        last, last_start = line, restart
+        while last < len(lines) - 1 and last_start + len(lines[last]) <= end:
+            last_start += len(lines[last])
+            last += 1
+        edited = split_lines(lines[line][:start - restart] + text + lines[last][end - last_start:])
+        if last < len(lines) - 1:
+            # the edited text ends with the newline of lines[last]
+            edited.pop()
+        lines[line:last + 1] = edited
+        delta = len(text) - (end - start)
+        line_delta = len(edited) - (last + 1 - line)
+        new_end = start + len(text)
+        extra = RESYNC_LINES
+        while True:
+            window = ''.join(lines[line:line + len(edited) + extra])
+            complete = line + len(edited) + extra >= len(lines)
+            result = self.resync(window, restart, line + 1, start, new_end, delta, complete)
+            if result is not None:
+                break
+            extra *= 2
+        first, stop, fresh, sync = result
+        tokens = self.tokens
+        self.move_gap(first)
+        # the removed tokens keep the offsets they had, so they still sort after the tokens before the edit
+        for i in range(first, stop):
+            tokens[i].move_to_head()
+        tokens[first:stop] = [DocumentToken(tok, tok.lexpos - line_start + 1, self) for tok, line_start in fresh]
+        for token in tokens[first:first + len(fresh)]:
+            token.offset += restart
+        after = self.gap = first + len(fresh)
+        # the tokens after the gap move with the end of the document
+        self.length += delta
+        self.line_count += line_delta
+        if sync is not None:
+            # and only those on the line the re-lexed range ends on change columns
+            line_start = window.rfind('\n', 0, sync) + 1
+            column_delta = sync - line_start + 1 - tokens[after].token_column
+            line = tokens[after].token_line
+            for i in range(after, len(tokens)):
+                token = tokens[i]
+                if token.token_line != line:
+                    break
+                token.token_column += column_delta
+        return first, stop, after
+
+    def edit(self, start, end, text):
+        # replace source[start:end] with text, re-lex and re-parse what changed
+        first, old_stop, new_stop = self.relex(start, end, text)
+        self.reuse.replaced(first, old_stop, new_stop)
+        if first < new_stop:
+            region = (self.tokens[first].token_offset, token_end(self.tokens[new_stop - 1]))
+        else:
+            region = (start, start + len(text))
+        reused = self.parse()
+        return Update(self.tree if self.error is None else None, self.error, region, (first, new_stop), old_stop - first, reused or 0)
@@ -1,11 +1,22 @@
 import ply.lex as lex
-from prettytable import PrettyTable
+import re
 import os
-from colorama import Fore, Style, init
+import sys
+import csv
+import json
+import struct
+import hashlib
+import threading
+import importlib.util
 import argparse
+from bisect import bisect_right
 
+# prettytable and colorama are only imported by the functions that print, so that
+# importing the lexer (e.g. from the parser) does not pay for them
 
-init(autoreset=True)
+# Where the optimized lexer tables are persisted between runs
+LEXTAB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lextab_cache')
+LEXTAB_PREFIX = 'wumpus_lextab_'
 
 def print_fancy(text, width=80, fill_char='-'):
     print(text.center(width, fill_char))
@@ -58,8 +69,15 @@ tokens = (
     'PLACE_AGENT', 'MINUS', 'PLUS', 'MULTIPLY', 'DIVIDE'
 )
 
-# Characters to ignore while lexing
-t_ignore = r' \t | \R'
+# Integer ids of the token types, shared by the lexer, the token files and the parser
+# EOF is the parser's end of input marker, VOID is only listed once
+TOKEN_KINDS = ('EOF',) + tuple(dict.fromkeys(tokens))
+TOKEN_KIND = {name: kind for kind, name in enumerate(TOKEN_KINDS)}
+# the same ids as attributes, e.g. Kind.ID
+Kind = type('Kind', (), dict(TOKEN_KIND))
+
+# Characters to ignore while lexing: spaces, tabs and the carriage returns of CRLF files
+t_ignore = ' \t\r'
 
 # Regular expressions for tokens
 t_LPAREN = r'\('
@@ -93,19 +111,388 @@ def t_newline(t):
     r'(\n)+'
     t.lexer.lineno += len(t.value)
 
-# Function to test lexer with a given input string
-def run_lexer(input_string, lexer):
+# Hand-written scanner engine
+# It dispatches on the first character of each token instead of trying the ply master regex,
+# and resolves keywords with a single lookup in reserved, so no rule function runs per token.
+# The multi-character rules reuse the regular expressions of the ply rules above, anchored at the
+# current position, so both engines always agree on what a token is.
+SCAN_ID = 1
+SCAN_INTEGER = 2
+SCAN_NEWLINE = 3
+SCAN_COMMENT = 4
+SCAN_EQUAL = 5
+SCAN_BANG = 6
+SCAN_LESS = 7
+SCAN_GREATER = 8
+
+scan_id = re.compile(t_ID.__doc__, re.VERBOSE).match
+scan_integer = re.compile(t_INTEGER, re.VERBOSE).match
+scan_newline = re.compile(t_newline.__doc__, re.VERBOSE).match
+scan_comment = re.compile(t_COMMENT, re.VERBOSE).match
+
+# first character -> token type for the single character tokens, or one of the SCAN_ actions
+scan_dispatch = {
+    '(': 'LPAREN', ')': 'RPAREN', '{': 'LBRACE', '}': 'RBRACE', '[': 'LEFTBRACKET', ']': 'RIGHTBRACKET',
+    ',': 'COMMA', '+': 'PLUS', '-': 'MINUS', '*': 'MULTIPLY', '/': 'DIVIDE',
+    '\n': SCAN_NEWLINE, '$': SCAN_COMMENT, '=': SCAN_EQUAL, '!': SCAN_BANG, '<': SCAN_LESS, '>': SCAN_GREATER,
+}
+for char in 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ':
+    scan_dispatch[char] = SCAN_ID
+for char in '0123456789':
+    scan_dispatch[char] = SCAN_INTEGER
+# ignored characters are skipped before any rule is tried, like ply does with t_ignore
+for char in t_ignore:
+    scan_dispatch.pop(char, None)
+
+def scan(input_string, pos=0, lineno=1):
+    # pos and lineno let a caller resume scanning at a line start in the middle of the input
+    data = input_string
+    length = len(data)
+    while pos < length:
+        char = data[pos]
+        action = scan_dispatch.get(char)
+        if action is None:
+            # ignored or illegal character, t_error skips those one at a time
+            pos += 1
+            continue
+        end = pos + 1
+        if action.__class__ is str:
+            token_type = action
+            value = char
+        elif action == SCAN_ID:
+            end = scan_id(data, pos).end()
+            value = data[pos:end]
+            token_type = reserved.get(value, 'ID')
+        elif action == SCAN_NEWLINE:
+            end = scan_newline(data, pos).end()
+            lineno += end - pos
+            pos = end
+            continue
+        elif action == SCAN_INTEGER:
+            end = scan_integer(data, pos).end()
+            value = data[pos:end]
+            token_type = 'INTEGER'
+        elif action == SCAN_COMMENT:
+            match = scan_comment(data, pos)
+            if match is None:
+                pos += 1
+                continue
+            end = match.end()
+            value = data[pos:end]
+            token_type = 'COMMENT'
+        else:
+            # = == != < <= > >=
+            if data[pos + 1:pos + 2] == '=':
+                end = pos + 2
+                token_type = 'COMPARISON'
+            elif action == SCAN_EQUAL:
+                token_type = 'ASSIGNMENT'
+            elif action == SCAN_BANG:
+                pos += 1
+                continue
+            else:
+                token_type = 'COMPARISON'
+            value = data[pos:end]
+        tok = lex.LexToken()
+        tok.type = token_type
+        tok.value = value
+        tok.lineno = lineno
+        tok.lexpos = pos
+        yield tok
+        pos = end
+
+ENGINES = ('ply', 'scanner')
+
+class LineIndex:
+    '''
+    The offsets at which the lines of a source start, found in one pass over the source
+    Tokens only carry lexpos (and lineno); position() maps any offset to its line and column by
+    bisection over the line starts, in O(log lines). Lines and columns are 1-based, columns count characters.
+    '''
+    def __init__(self, source):
+        starts = [0]
+        find = source.find
+        newline = find('\n')
+        while newline != -1:
+            starts.append(newline + 1)
+            newline = find('\n', newline + 1)
+        self.starts = starts
+        self.length = len(source)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def line(self, offset):
+        return bisect_right(self.starts, offset)
+
+    def column(self, offset, line=None):
+        # line can be given when it is known, e.g. a token's lineno, which saves the bisection
+        if line is None:
+            line = bisect_right(self.starts, offset)
+        return offset - self.starts[line - 1] + 1
+
+    def position(self, offset):
+        line = bisect_right(self.starts, offset)
+        return line, offset - self.starts[line - 1] + 1
+
+    def span(self, start, end):
+        # (line, column, end line, end column) of the characters start to end (excluded)
+        return self.position(start) + self.position(end)
+
+    def offset(self, line, column):
+        return self.starts[line - 1] + column - 1
+
+# Hash of everything the master regex is built from, so a persisted lextab is rebuilt when a rule changes
+def rules_signature():
+    digest = hashlib.sha1(lex.__tabversion__.encode())
+    digest.update(repr((tokens, t_ignore)).encode('utf8'))
+    rules = sorted(name for name in globals() if name.startswith('t_'))
+    for name in rules:
+        rule = globals()[name]
+        if callable(rule):
+            # function rules are ordered by definition line, and their regex is the docstring
+            digest.update(repr((name, rule.__code__.co_firstlineno, rule.__doc__)).encode('utf8'))
+        else:
+            digest.update(repr((name, rule)).encode('utf8'))
+    return digest.hexdigest()[:16]
+
+# Build the lexer from the rules of this module, even when called from another module
+# In optimized mode the master regex comes from a lextab persisted in LEXTAB_DIR instead of being
+# rebuilt (and validated) from the rules on every run. Processes may share LEXTAB_DIR: a table is
+# written under a name of its own and renamed into place, so it is never read half-written, and a
+# table that cannot be loaded anyway is rebuilt from the rules
+def build_lexer(debug=False, optimize=True):
+    module = sys.modules[__name__]
+    if debug or not optimize:
+        return lex.lex(module=module, debug=debug)
+    tabname = LEXTAB_PREFIX + rules_signature()
+    tabfile = os.path.join(LEXTAB_DIR, tabname + '.py')
+    if os.path.exists(tabfile):
+        try:
+            spec = importlib.util.spec_from_file_location(tabname, tabfile)
+            lextab = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(lextab)
+            # ply would rebuild a table of another version (or an empty file) itself, but not replace it
+            if getattr(lextab, '_tabversion', None) == lex.__tabversion__:
+                return lex.lex(module=module, optimize=True, lextab=lextab)
+        except Exception:
+            # a damaged table: it is replaced below
+            pass
+    try:
+        os.makedirs(LEXTAB_DIR, exist_ok=True)
+        # drop the tables (and unfinished writes) of other versions of the rules, the current ones may be
+        # in use by other processes
+        for name in os.listdir(LEXTAB_DIR):
+            if name.startswith(LEXTAB_PREFIX) and not name.startswith(tabname):
+                try:
+                    os.remove(os.path.join(LEXTAB_DIR, name))
+                except FileNotFoundError:
+                    pass
+    except OSError:
+        return lex.lex(module=module)
+    temporary = f'{tabname}_{os.getpid()}_{threading.get_ident()}'
+    lexer = lex.lex(module=module, optimize=True, lextab=temporary, outputdir=LEXTAB_DIR)
+    try:
+        os.replace(os.path.join(LEXTAB_DIR, temporary + '.py'), tabfile)
+    except OSError:
+        # ply could not write the table, the lexer is still good
+        pass
+    return lexer
+
+# Generator over the LexTokens of a source string, with no formatting or table
+# This is what the parser consumes when lexing and parsing run in the same process
+def tokenize(input_string, lexer=None, engine='ply'):
+    if engine == 'scanner':
+        return scan(input_string)
+    return tokenize_ply(input_string, lexer)
+
+def tokenize_ply(input_string, lexer=None):
+    if lexer is None:
+        lexer = build_lexer()
     lexer.input(input_string)
-    table = PrettyTable(["Token Type", "Value", "Line", "Position"])
-    stream = []
+    # input() does not reset the line count of a reused lexer
+    lexer.lineno = 1
     while True:
         tok = lexer.token()
-        
         if not tok:
             break
-        token_type = tok.type
-        token_value = tok.value
-        values = [token_type, token_value, tok.lineno, tok.lexpos]
+        yield tok
+
+# Parallel lexing
+# No rule matches across a newline: t_COMMENT's . stops at one, and every other token is a single
+# line construct. So every newline is outside any comment, and chunks cut right after one lex to
+# the tokens of the whole input once their lines and positions are offset by where the chunk starts.
+# Workers lex the chunks and the results come back in chunk order.
+PARALLEL_CHUNK_SIZE = 4 << 20
+# guards the reasoning above against a later change to the comment rule; a comment that can span
+# lines makes newlines unsafe, and the input is then lexed as a single chunk
+COMMENTS_SPAN_LINES = scan_comment('$\n$', 0) is not None or re.match(t_COMMENT, '$\n$') is not None
+
+def split_chunks(input_string, chunk_size=PARALLEL_CHUNK_SIZE):
+    # (text, position, line) of the chunks, each of at least chunk_size characters (but the last) and ending after a newline
+    if COMMENTS_SPAN_LINES:
+        return [(input_string, 0, 1)]
+    chunks = []
+    length = len(input_string)
+    start = 0
+    lineno = 1
+    while start < length:
+        end = input_string.find('\n', start + max(chunk_size, 1) - 1)
+        end = length if end == -1 else end + 1
+        chunks.append((input_string[start:end], start, lineno))
+        lineno += input_string.count('\n', start, end)
+        start = end
+    return chunks
+
+# the engine and ply lexer of a worker process, set by init_chunk_worker
+chunk_engine = 'ply'
+chunk_lexer = None
+
+def init_chunk_worker(engine):
+    global chunk_engine, chunk_lexer
+    chunk_engine = engine
+    chunk_lexer = build_lexer() if engine == 'ply' else None
+
+def lex_chunk(chunk):
+    # [type, value, line, position, column] of the tokens of a chunk, with the positions of the whole input
+    # a chunk starts on a line start, so the columns are the same as in the whole input
+    text, start, lineno = chunk
+    if chunk_engine == 'scanner':
+        toks = scan(text, 0, lineno)
+    else:
+        chunk_lexer.input(text)
+        chunk_lexer.lineno = lineno
+        toks = iter(chunk_lexer.token, None)
+    return [[token_type, value, line, position + start, column] for token_type, value, line, position, column in token_records(toks, text)]
+
+def format_chunk(chunk):
+    # the chunk's lines of the plain token file, formatted in the worker
+    return ''.join(f"{token[0]} {token[1]} {token[2]} {token[3]} {token[4]}\n" for token in lex_chunk(chunk))
+
+def map_chunks(function, input_string, engine='ply', workers=None, chunk_size=PARALLEL_CHUNK_SIZE):
+    # function's result for every chunk of the input, in order, computed by a pool of workers
+    chunks = split_chunks(input_string, chunk_size)
+    if len(chunks) == 1 or workers == 1:
+        init_chunk_worker(engine)
+        for chunk in chunks:
+            yield function(chunk)
+        return
+    from multiprocessing import Pool
+    with Pool(workers, initializer=init_chunk_worker, initargs=(engine,)) as pool:
+        yield from pool.imap(function, chunks)
+
+def tokenize_parallel(input_string, engine='ply', workers=None, chunk_size=PARALLEL_CHUNK_SIZE):
+    # the LexTokens of tokenize(input_string, engine=engine), lexed in worker processes
+    for records in map_chunks(lex_chunk, input_string, engine, workers, chunk_size):
+        for token_type, value, lineno, lexpos, _ in records:
+            tok = lex.LexToken()
+            tok.type = token_type
+            tok.value = value
+            tok.lineno = lineno
+            tok.lexpos = lexpos
+            yield tok
+
+def write_tokens_parallel(input_string, output_file, output_format='plain', engine='ply', workers=None, chunk_size=PARALLEL_CHUNK_SIZE):
+    # the token file run_lexer_with_file writes, with the chunks lexed (and, for plain text, formatted) in worker processes
+    if output_format == 'plain':
+        for text in map_chunks(format_chunk, input_string, engine, workers, chunk_size):
+            output_file.write(text)
+    else:
+        records = map_chunks(lex_chunk, input_string, engine, workers, chunk_size)
+        TOKEN_WRITERS[output_format]((token for chunk in records for token in chunk), output_file)
+
+# Streaming token writers
+# Each writes [type, value, line, position, column] tokens as they are produced, with no table and no color,
+# so the first tokens reach the file (or a pipe) before the source is lexed to the end
+# The column is 1-based, so the parser can report where an error is without the source
+
+def token_records(toks, source):
+    # toks are the LexTokens of source, in order; a line's start is only looked up for its first token
+    line, line_start = 0, 0
+    for tok in toks:
+        if tok.lineno != line:
+            line = tok.lineno
+            line_start = source.rfind('\n', 0, tok.lexpos) + 1
+        yield [tok.type, tok.value, tok.lineno, tok.lexpos, tok.lexpos - line_start + 1]
+
+# One "TYPE value line position column" line per token, the format the parser's TokenStream reads
+def write_plain_tokens(stream, output_file):
+    write = output_file.write
+    for token_type, token_value, line, position, column in stream:
+        write(f"{token_type} {token_value} {line} {position} {column}\n")
+
+# One JSON object per line
+def write_jsonl_tokens(stream, output_file):
+    write = output_file.write
+    # type names are identifiers and need no escaping, values do
+    quote = json.encoder.encode_basestring
+    for token_type, token_value, line, position, column in stream:
+        write(f'{{"type": "{token_type}", "value": {quote(token_value)}, "line": {line}, "position": {position}, "column": {column}}}\n')
+
+# A header row then one row per token; output_file should be opened with newline=''
+def write_csv_tokens(stream, output_file):
+    writer = csv.writer(output_file)
+    writer.writerow(['type', 'value', 'line', 'position', 'column'])
+    writer.writerows(stream)
+
+# Binary token file layout, all little-endian:
+#   header:  magic, version, flags, record count, string table offset, kind table offset
+#   records: one fixed-width record per token (kind id, line, column, lexpos, value offset, value length)
+#   strings: every distinct token value once, utf8 encoded, addressed by the records
+#   kinds:   the token type names, newline separated, indexed by the records' kind id (TOKEN_KINDS when written)
+TOKEN_FILE_MAGIC = b'WTOK'
+TOKEN_FILE_VERSION = 2
+TOKEN_FILE_HEADER = struct.Struct('<4sHHQQQ')
+TOKEN_FILE_RECORD = struct.Struct('<IIIQQI')
+
+# Write [type, value, line, position, column] tokens to a seekable file opened in 'wb' mode
+def write_binary_tokens(stream, output_file):
+    strings = {}
+    string_table = bytearray()
+    records = bytearray()
+    count = 0
+    # leave room for the header, it is filled in once the counts are known
+    output_file.write(bytes(TOKEN_FILE_HEADER.size))
+    for token_type, token_value, line, position, column in stream:
+        kind = TOKEN_KIND[token_type]
+        # intern the values so repeated names and keywords are stored once
+        value = strings.get(token_value)
+        if value is None:
+            encoded = token_value.encode('utf8')
+            value = strings[token_value] = (len(string_table), len(encoded))
+            string_table += encoded
+        records += TOKEN_FILE_RECORD.pack(kind, line, column, position, value[0], value[1])
+        count += 1
+        if len(records) >= 1 << 20:
+            output_file.write(records)
+            records.clear()
+    output_file.write(records)
+    strings_offset = TOKEN_FILE_HEADER.size + count * TOKEN_FILE_RECORD.size
+    output_file.write(string_table)
+    kinds_offset = strings_offset + len(string_table)
+    output_file.write('\n'.join(TOKEN_KINDS).encode('utf8'))
+    output_file.seek(0)
+    output_file.write(TOKEN_FILE_HEADER.pack(TOKEN_FILE_MAGIC, TOKEN_FILE_VERSION, 0, count, strings_offset, kinds_offset))
+    output_file.seek(0, os.SEEK_END)
+
+TOKEN_WRITERS = {
+    'plain': write_plain_tokens,
+    'jsonl': write_jsonl_tokens,
+    'csv': write_csv_tokens,
+    'binary': write_binary_tokens,
+}
+
+# Function to test lexer with a given input string
+# Prints the colored token table, the human view, and returns the tokens; the table is only printed
+# once every token has been added to it, so writing the token file should not wait on it
+# toks are the LexTokens when they were already lexed (e.g. read from the parse cache)
+def run_lexer(input_string, lexer, engine='ply', toks=None):
+    from prettytable import PrettyTable
+    from colorama import Fore, Style
+    table = PrettyTable(["Token Type", "Value", "Line", "Position", "Column"])
+    stream = []
+    for values in token_records(tokenize(input_string, lexer, engine) if toks is None else toks, input_string):
+        token_type, token_value, line, position, column = values
         
         if token_type == 'COMMENT':
             token_type = Fore.YELLOW + token_type + Style.RESET_ALL
@@ -120,7 +507,7 @@ def run_lexer(input_string, lexer):
             token_type = Fore.GREEN + token_type + Style.RESET_ALL
             token_value = Fore.GREEN + token_value + Style.RESET_ALL
             
-        table.add_row([token_type, token_value, tok.lineno, tok.lexpos])
+        table.add_row([token_type, token_value, line, position, column])
 
         stream.append(values)
 
@@ -128,24 +515,57 @@ def run_lexer(input_string, lexer):
     return stream
 
 # Function to test lexer with files in a specified folder
-def run_lexer_with_file(source_code, lexer, output_file):
+# Without table the tokens are streamed to output_file as they are lexed; status lines go to
+# status_file, which must not be output_file when the tokens are written to stdout
+def run_lexer_with_file(source_code, lexer, output_file, output_format='plain', engine='ply', cache=None, table=False, status_file=None):
+    from colorama import Fore, Style
     # Print the name of the file being run with colorama
-    print(Fore.CYAN + Style.BRIGHT + f"Testing file: {source_code}" + Style.RESET_ALL)
+    print(Fore.CYAN + Style.BRIGHT + f"Testing file: {source_code}" + Style.RESET_ALL, file=status_file)
     # Open the file and read the contents
     with open(source_code, 'r') as file:
         test_input = file.read()
-        stream = run_lexer(test_input, lexer)
-        for token in stream:
-            output_file.write(f"{token[0]} {token[1]} {token[2]} {token[3]}\n")
+        toks = None
+        if cache is not None:
+            import parse_cache
+            toks = parse_cache.lex_source(test_input, cache, lexer, engine)
+        if table:
+            stream = run_lexer(test_input, lexer, engine, toks)
+        else:
+            stream = token_records(tokenize(test_input, lexer, engine) if toks is None else toks, test_input)
+        TOKEN_WRITERS[output_format](stream, output_file)
+
+        print(Fore.GREEN + Style.BRIGHT + "Lexing successful" + Style.RESET_ALL, file=status_file)
 
-        print(Fore.GREEN + Style.BRIGHT + "Lexing successful" + Style.RESET_ALL)
+def open_output(path, output_format, stdout=None):
+    # the file the tokens are written to; '-' is stdout, which cannot hold the binary format
+    if path == '-':
+        if output_format == 'binary':
+            raise ValueError('The binary format needs a seekable output file, not stdout')
+        stdout = stdout or sys.stdout
+        if output_format == 'csv':
+            stdout.reconfigure(newline='')
+        return stdout
+    if output_format == 'binary':
+        return open(path, "wb")
+    return open(path, "w", encoding="utf8", newline='' if output_format == 'csv' else None)
 
 def main():
+    from colorama import Fore, Style, init
+    # tokens written to stdout bypass colorama's wrapper, which would check every write for escape codes
+    stdout = sys.stdout
+    init(autoreset=True)
 
     parse = argparse.ArgumentParser()
     parse.add_argument('-f', '--file', help='Add file path to the source code', type=str)
     parse.add_argument('-d', '--debug', help='Activate debug mode', action='store_true')
-    parse.add_argument('-o', '--output', help='Add file path to the output file', type=str)
+    parse.add_argument('--no-optimize', help='Rebuild the lexer tables from the rules instead of using the cached lextab', action='store_true')
+    parse.add_argument('-o', '--output', help='Add file path to the output file, - writes the tokens to stdout', type=str)
+    parse.add_argument('--format', help='Token file format', choices=list(TOKEN_WRITERS), default='plain')
+    parse.add_argument('--table', help='Also print the colored token table', action='store_true')
+    parse.add_argument('--engine', help='Lexer backend: the ply rules or the hand-written scanner', choices=ENGINES, default='ply')
+    parse.add_argument('-j', '--workers', help='Lex chunks of the file in this many processes, --table is ignored', type=int)
+    parse.add_argument('--cache', help='Reuse the tokens of a source lexed before, from this cache directory', nargs='?', const='.wumpus_cache', type=str)
+    parse.add_argument('--cache-size', help='Largest size of the cache directory in MB', type=int, default=256)
 
     args = parse.parse_args()
 
@@ -167,8 +587,20 @@ def main():
         print("\tInclude the source code file path")
         print_fancy(Fore.CYAN + Style.BRIGHT + "-d, --debug" + Style.RESET_ALL, fill_char='=')
         print("\tExecute the program in debug mode")
+        print_fancy(Fore.CYAN + Style.BRIGHT + "--no-optimize" + Style.RESET_ALL, fill_char='=')
+        print("\tRebuild the lexer tables instead of loading the cached lextab")
         print_fancy(Fore.CYAN + Style.BRIGHT + "-o, --output" + Style.RESET_ALL, fill_char='=')
         print("\tSpecify the output file path")
+        print_fancy(Fore.CYAN + Style.BRIGHT + "--format" + Style.RESET_ALL, fill_char='=')
+        print("\tWrite the tokens as plain text lines, JSON Lines, CSV or a compact binary file")
+        print_fancy(Fore.CYAN + Style.BRIGHT + "--table" + Style.RESET_ALL, fill_char='=')
+        print("\tAlso print the colored token table (slower, the tokens are written once it is printed)")
+        print_fancy(Fore.CYAN + Style.BRIGHT + "--engine" + Style.RESET_ALL, fill_char='=')
+        print("\tLex with the ply rules (default) or the hand-written scanner")
+        print_fancy(Fore.CYAN + Style.BRIGHT + "-j, --workers" + Style.RESET_ALL, fill_char='=')
+        print("\tLex large files in parallel worker processes, without the token table")
+        print_fancy(Fore.CYAN + Style.BRIGHT + "--cache [DIR], --cache-size MB" + Style.RESET_ALL, fill_char='=')
+        print("\tReuse the tokens of sources lexed before, from a size-bounded cache directory")
 
         print_fancy("", fill_char='-')
         exit(1)
@@ -178,10 +610,32 @@ def main():
         print("No output file provided. Using ./output.txt")
         args.output = "output.txt"
 
-    output_file = open(args.output, "w", encoding="utf8")
-    # Create the lexer
-    lexer = lex.lex(debug=args.debug)
-    run_lexer_with_file(source_code, lexer, output_file)
+    try:
+        output_file = open_output(args.output, args.format, stdout)
+    except ValueError as e:
+        parse.error(str(e))
+    # keep stdout for the tokens when they are written there
+    status_file = sys.stderr if output_file is stdout else sys.stdout
+    if args.workers is not None:
+        with open(source_code, 'r') as file:
+            write_tokens_parallel(file.read(), output_file, args.format, args.engine, max(1, args.workers))
+        if output_file is not stdout:
+            output_file.close()
+        print(Fore.GREEN + Style.BRIGHT + "Lexing successful" + Style.RESET_ALL, file=status_file)
+        return
+    cache = None
+    if args.cache is not None:
+        import parse_cache
+        cache = parse_cache.ParseCache(args.cache, args.cache_size << 20)
+    # Create the lexer, with a cache it is only built by a miss
+    lexer = None
+    if args.engine == 'ply' and (cache is None or args.debug or args.no_optimize):
+        lexer = build_lexer(debug=args.debug, optimize=not args.no_optimize)
+    run_lexer_with_file(source_code, lexer, output_file, args.format, args.engine, cache, args.table, status_file)
+    if output_file is not stdout:
+        output_file.close()
+    if cache is not None:
+        print(cache.summary(), file=status_file)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,326 @@
+# Content-addressed on-disk cache of token streams and CSTs
+# An entry is keyed by the SHA-256 of the source text and of a version stamp (the lexer rules, grammar.txt
+# and the entry format), so a program that is submitted again is neither lexed nor parsed, and any change
+# to the lexer or the grammar misses the old entries. Entries are columns of integers plus an interned
+# string table, marshalled and zlib compressed, one file per entry. Loading an entry refreshes its
+# modification time, and storing evicts the least recently used entries once the directory outgrows max_bytes.
+
+import gc
+import os
+import sys
+import zlib
+import marshal
+import hashlib
+import argparse
+import tempfile
+from array import array
+from contextlib import contextmanager
+
+import ply.lex as lex
+
+import lexer
+from table_parser import GRAMMAR_FILE
+from wumpus_parser import Token, TreeNode, LexerTokenStream
+
+DEFAULT_DIRECTORY = '.wumpus_cache'
+DEFAULT_MAX_BYTES = 256 << 20
+ENTRY_SUFFIX = '.wcache'
+# bump when the layout of an entry changes
+CACHE_FORMAT = 1
+
+@contextmanager
+def paused_gc():
+    # decoding an entry allocates millions of objects and no garbage, which would only trigger collections
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def version_stamp():
+    # hashes the grammar file the table parser loads, so a grammar change misses every old entry
+    digest = hashlib.sha256(f'{CACHE_FORMAT} {marshal.version} {lexer.rules_signature()}'.encode())
+    with open(GRAMMAR_FILE, 'rb') as file:
+        digest.update(file.read())
+    return digest.digest()
+
+class CacheEntry:
+    '''
+    The tokens of a source, comments included, as columns: kinds (ids into lexer.TOKEN_KINDS),
+    values (ids into strings), lines and positions; and its CST in preorder, or None when only the
+    tokens were cached: node names (ids into names), child counts, and token ids (-1 for inner nodes)
+    '''
+    def __init__(self, kinds, strings, values, lines, positions, cst=None):
+        self.kinds = kinds
+        self.strings = strings
+        self.values = values
+        self.lines = lines
+        self.positions = positions
+        self.cst = cst
+
+    @classmethod
+    def from_tokens(cls, toks, tree=None):
+        kinds = array('H')
+        values = array('I')
+        lines = array('I')
+        positions = array('q')
+        string_ids = {}
+        for tok in toks:
+            kinds.append(lexer.TOKEN_KIND[tok.type])
+            value = string_ids.get(tok.value)
+            if value is None:
+                value = string_ids[tok.value] = len(string_ids)
+            values.append(value)
+            lines.append(tok.lineno)
+            positions.append(tok.lexpos)
+        entry = cls(kinds, list(string_ids), values, lines, positions)
+        if tree is not None:
+            entry.cst = entry.encode_tree(tree)
+        return entry
+
+    def encode_tree(self, root):
+        # None when a leaf holds a token that is not one of the entry's (the EOF token)
+        token_ids = {position: index for index, position in enumerate(self.positions)}
+        name_ids = {}
+        names = array('H')
+        counts = array('I')
+        leaves = array('i')
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            name = name_ids.get(node.val)
+            if name is None:
+                name = name_ids[node.val] = len(name_ids)
+            names.append(name)
+            if node.token is not None:
+                token = token_ids.get(node.token.token_offset)
+                if token is None:
+                    return None
+                leaves.append(token)
+                counts.append(0)
+            else:
+                leaves.append(-1)
+                counts.append(len(node.children))
+                stack.extend(reversed(node.children))
+        return list(name_ids), names, counts, leaves
+
+    def lex_tokens(self):
+        # the LexTokens the lexer produced
+        toks = []
+        kinds = lexer.TOKEN_KINDS
+        strings = self.strings
+        with paused_gc():
+            for kind, value, line, position in zip(self.kinds, self.values, self.lines, self.positions):
+                tok = lex.LexToken()
+                tok.type = kinds[kind]
+                tok.value = strings[value]
+                tok.lineno = line
+                tok.lexpos = position
+                toks.append(tok)
+        return toks
+
+    def tree(self, line_index=None):
+        # the CST as TreeNodes, with the LineIndex of the source its tokens get their columns
+        node_names, names, counts, leaves = self.cst
+        kinds = lexer.TOKEN_KINDS
+        starts = None if line_index is None else line_index.starts
+        root = None
+        # [node, children not read yet] of the inner nodes being filled
+        stack = []
+        with paused_gc():
+            for name, count, leaf in zip(names, counts, leaves):
+                token = None
+                if leaf >= 0:
+                    kind = self.kinds[leaf]
+                    line = self.lines[leaf]
+                    position = self.positions[leaf]
+                    column = None if starts is None else position - starts[line - 1] + 1
+                    token = Token((kinds[kind], self.strings[self.values[leaf]], line, position), kind, column)
+                if stack:
+                    top = stack[-1]
+                    node = TreeNode(node_names[name], token, top[0])
+                    top[0].children.append(node)
+                    top[1] -= 1
+                    if not top[1]:
+                        stack.pop()
+                else:
+                    root = node = TreeNode(node_names[name], token)
+                if count:
+                    stack.append([node, count])
+        return root
+
+    def dumps(self):
+        cst = None
+        if self.cst is not None:
+            node_names, names, counts, leaves = self.cst
+            cst = (node_names, names.tobytes(), counts.tobytes(), leaves.tobytes())
+        data = (CACHE_FORMAT, self.kinds.tobytes(), self.strings, self.values.tobytes(), self.lines.tobytes(), self.positions.tobytes(), cst)
+        return zlib.compress(marshal.dumps(data), 1)
+
+    @classmethod
+    def loads(cls, blob):
+        version, kinds, strings, values, lines, positions, cst = marshal.loads(zlib.decompress(blob))
+        if version != CACHE_FORMAT:
+            raise ValueError(f'Cache entry format {version}, expected {CACHE_FORMAT}')
+        entry = cls(array('H', kinds), strings, array('I', values), array('I', lines), array('q', positions))
+        if cst is not None:
+            node_names, names, counts, leaves = cst
+            entry.cst = (node_names, array('H', names), array('I', counts), array('i', leaves))
+        return entry
+
+class ParseCache:
+    '''
+    A directory of cache entries bounded to about max_bytes, with the counts of this process's lookups
+    Several processes can share a directory: entries are written to a temporary file and renamed into place,
+    and an entry evicted by another process is just a miss
+    '''
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.stamp = version_stamp()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.evicted = 0
+        # bytes in the directory, None until it is first scanned
+        self.size = None
+
+    def key(self, source):
+        digest = hashlib.sha256(self.stamp)
+        digest.update(source.encode('utf8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def load(self, key):
+        # the entry stored under key, or None; a corrupt or outdated entry is removed
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                blob = file.read()
+            entry = CacheEntry.loads(blob)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError, EOFError, zlib.error):
+            self.remove(path)
+            return None
+        self.bytes_read += len(blob)
+        return entry
+
+    def store(self, key, entry):
+        blob = entry.dumps()
+        if len(blob) > self.max_bytes:
+            return
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as file:
+            file.write(blob)
+        os.replace(temporary, self.path(key))
+        self.bytes_written += len(blob)
+        if self.size is not None:
+            self.size += len(blob)
+        if self.size is None or self.size > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        # (modification time, size, path) of every entry
+        found = []
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if item.name.endswith(ENTRY_SUFFIX):
+                    try:
+                        stat = item.stat()
+                    except FileNotFoundError:
+                        continue
+                    found.append((stat.st_mtime, stat.st_size, item.path))
+        return found
+
+    def evict(self):
+        # drop the least recently used entries until the directory fits in max_bytes
+        entries = self.entries()
+        self.size = sum(size for _, size, _ in entries)
+        if self.size <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if self.size <= self.max_bytes:
+                break
+            if self.remove(path):
+                self.evicted += 1
+            self.size -= size
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self.remove(path)
+        self.size = 0
+
+    def summary(self):
+        return (f'cache: {self.hits} hits, {self.misses} misses, {self.bytes_read} bytes read, '
+                f'{self.bytes_written} bytes written, {self.evicted} evicted')
+
+def lex_source(source, cache=None, lex_tokens=None, engine='ply'):
+    # the list of LexTokens of source, from the cache when it has them
+    if cache is not None:
+        key = cache.key(source)
+        entry = cache.load(key)
+        if entry is not None:
+            cache.hits += 1
+            return entry.lex_tokens()
+        cache.misses += 1
+    toks = list(lexer.tokenize(source, lex_tokens, engine))
+    if cache is not None:
+        cache.store(key, CacheEntry.from_tokens(toks))
+    return toks
+
+def parse_source(source, parse, cache=None, lex_tokens=None, engine='ply'):
+    # (CST, syntax errors) of source, parse takes a token stream and returns the same pair
+    # only trees without syntax errors are cached; an entry with just the tokens saves the lexing
+    toks = None
+    line_index = lexer.LineIndex(source)
+    if cache is not None:
+        key = cache.key(source)
+        entry = cache.load(key)
+        if entry is not None and entry.cst is not None:
+            cache.hits += 1
+            return entry.tree(line_index), []
+        cache.misses += 1
+        if entry is not None:
+            toks = entry.lex_tokens()
+    if toks is None:
+        toks = list(lexer.tokenize(source, lex_tokens, engine))
+    tree, errors = parse(LexerTokenStream(toks, line_index))
+    if cache is not None and not errors:
+        cache.store(key, CacheEntry.from_tokens(toks, tree))
+    return tree, errors
+
+def main():
+    parse = argparse.ArgumentParser(description='Show or clear the parse cache')
+    parse.add_argument('-d', '--directory', help='Cache directory', type=str, default=DEFAULT_DIRECTORY)
+    parse.add_argument('--clear', help='Remove every entry', action='store_true')
+    args = parse.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f'No cache at {args.directory}')
+        sys.exit(1)
+    cache = ParseCache(args.directory)
+    if args.clear:
+        cache.clear()
+        print(f'Cleared {args.directory}')
+        return
+    entries = cache.entries()
+    print(f'{len(entries)} entries, {sum(size for _, size, _ in entries)} bytes in {args.directory}')
+
+if __name__ == '__main__':
+    main()
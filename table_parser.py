@@ -0,0 +1,449 @@
+# Table-driven LL(1) parser generated from grammar.txt
+# The EBNF rules are rewritten into plain BNF, FIRST/FOLLOW sets and the parse table are computed once,
+# and parsing runs on an explicit stack, so nesting depth is not limited by Python's recursion limit.
+# The tree it builds is the same CST as wumpus_parser.program(): the helper nonterminals introduced
+# for (), [] and {} are transparent, their children go to the enclosing grammar rule's node.
+# Given a token stream with a diagnostics list, syntax errors are recovered from in panic mode and
+# collected there instead of raised (see parse_recovering).
+
+import os
+import re
+import sys
+import argparse
+from lexer import TOKEN_KIND, TOKEN_KINDS
+from wumpus_parser import TreeNode, ExpectationError, MissingTokenError
+
+GRAMMAR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grammar.txt')
+
+EOF = 'EOF'
+EOF_KIND = TOKEN_KIND[EOF]
+
+# <nonterminal>, ::=, TERMINAL or one of the EBNF operators
+grammar_token = re.compile(r'<[^>]+>|::=|[A-Z_]+|[|()\[\]{}]')
+
+class GrammarError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+class Conflict:
+    '''
+    An LL(1) parse table cell with more than one production
+    When the alternatives can be told apart by the token after the current one,
+    second holds the second token -> production map used to resolve it
+    '''
+    def __init__(self, nonterminal, token, productions, second=None):
+        self.nonterminal = nonterminal
+        self.token = token
+        self.productions = productions
+        self.second = second
+
+class Grammar:
+    '''
+    BNF form of grammar.txt with its FIRST/FOLLOW sets and LL(1) parse table
+    productions maps each nonterminal to its list of alternatives, each a tuple of symbols
+    table is what parse() runs on: nonterminal -> token kind -> alternative, where the terminals
+    of the alternative are replaced by their token kind ids
+    '''
+    def __init__(self, source=GRAMMAR_FILE):
+        self.productions = {}
+        # helper nonterminal -> the EBNF text it was made from
+        self.helpers = {}
+        self.start = None
+        with open(source, 'r') as file:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                self.read_rule(line, line_number)
+        self.check_symbols()
+        self.nullable = self.compute_nullable()
+        self.first = self.compute_first()
+        self.follow = self.compute_follow()
+        self.symbol_table, self.conflicts = self.build_table()
+        self.table = self.compile_table()
+        self.sync = self.compile_sync()
+
+    def read_rule(self, line, line_number):
+        symbols = grammar_token.findall(line)
+        if len(symbols) < 3 or not symbols[0].startswith('<') or symbols[1] != '::=':
+            raise GrammarError(f'line {line_number}: expected <name> ::= ...')
+        name = symbols[0][1:-1]
+        if self.start is None:
+            self.start = name
+        self.helper_count = 0
+        self.rule = name
+        self.symbols = symbols[2:]
+        self.position = 0
+        alternatives = self.read_alternatives()
+        if self.position != len(self.symbols):
+            raise GrammarError(f'line {line_number}: unexpected {self.symbols[self.position]}')
+        self.productions[name] = alternatives
+
+    def read_alternatives(self):
+        # alternatives ::= sequence { | sequence }
+        alternatives = [self.read_sequence()]
+        while self.position < len(self.symbols) and self.symbols[self.position] == '|':
+            self.position += 1
+            alternatives.append(self.read_sequence())
+        return alternatives
+
+    def read_sequence(self):
+        sequence = []
+        while self.position < len(self.symbols):
+            symbol = self.symbols[self.position]
+            if symbol in ('|', ')', ']', '}'):
+                break
+            self.position += 1
+            if symbol.startswith('<'):
+                sequence.append(symbol[1:-1])
+            elif symbol in ('(', '[', '{'):
+                sequence.append(self.read_group(symbol))
+            else:
+                sequence.append(symbol)
+        return tuple(sequence)
+
+    def read_group(self, opening):
+        # every (), [] and {} becomes a helper nonterminal of the rule it appears in
+        start = self.position - 1
+        alternatives = self.read_alternatives()
+        closing = {'(': ')', '[': ']', '{': '}'}[opening]
+        if self.position >= len(self.symbols) or self.symbols[self.position] != closing:
+            raise GrammarError(f'<{self.rule}>: missing {closing}')
+        self.position += 1
+        self.helper_count += 1
+        helper = f'{self.rule}#{self.helper_count}'
+        self.helpers[helper] = ' '.join(self.symbols[start:self.position])
+        if opening == '[':
+            alternatives.append(())
+        elif opening == '{':
+            alternatives = [alternative + (helper,) for alternative in alternatives] + [()]
+        self.productions[helper] = alternatives
+        return helper
+
+    def check_symbols(self):
+        for name, alternatives in self.productions.items():
+            for alternative in alternatives:
+                for symbol in alternative:
+                    if symbol.islower() and symbol not in self.productions:
+                        raise GrammarError(f'<{name}> uses undefined <{symbol}>')
+                    if self.is_terminal(symbol) and symbol not in TOKEN_KIND:
+                        raise GrammarError(f'<{name}> uses {symbol}, which the lexer does not produce')
+
+    def is_terminal(self, symbol):
+        return symbol not in self.productions
+
+    def compute_nullable(self):
+        nullable = set()
+        changed = True
+        while changed:
+            changed = False
+            for name, alternatives in self.productions.items():
+                if name not in nullable and any(all(symbol in nullable for symbol in alternative) for alternative in alternatives):
+                    nullable.add(name)
+                    changed = True
+        return nullable
+
+    def first_of(self, symbols, first=None):
+        # FIRST set of a sequence of symbols, and whether the whole sequence can derive nothing
+        first = self.first if first is None else first
+        result = set()
+        for symbol in symbols:
+            if self.is_terminal(symbol):
+                result.add(symbol)
+                return result, False
+            result |= first[symbol]
+            if symbol not in self.nullable:
+                return result, False
+        return result, True
+
+    def compute_first(self):
+        first = {name: set() for name in self.productions}
+        changed = True
+        while changed:
+            changed = False
+            for name, alternatives in self.productions.items():
+                for alternative in alternatives:
+                    symbols, _ = self.first_of(alternative, first)
+                    if not symbols <= first[name]:
+                        first[name] |= symbols
+                        changed = True
+        return first
+
+    def compute_follow(self):
+        follow = {name: set() for name in self.productions}
+        follow[self.start].add(EOF)
+        changed = True
+        while changed:
+            changed = False
+            for name, alternatives in self.productions.items():
+                for alternative in alternatives:
+                    for i, symbol in enumerate(alternative):
+                        if self.is_terminal(symbol):
+                            continue
+                        symbols, nullable = self.first_of(alternative[i + 1:])
+                        if nullable:
+                            symbols = symbols | follow[name]
+                        if not symbols <= follow[symbol]:
+                            follow[symbol] |= symbols
+                            changed = True
+        return follow
+
+    def compute_first2(self):
+        # FIRST sets of terminal strings up to two tokens long, only needed to resolve conflicts
+        first2 = {name: set() for name in self.productions}
+        changed = True
+        while changed:
+            changed = False
+            for name, alternatives in self.productions.items():
+                for alternative in alternatives:
+                    strings = self.first2_of(alternative, first2)
+                    if not strings <= first2[name]:
+                        first2[name] |= strings
+                        changed = True
+        return first2
+
+    def first2_of(self, symbols, first2):
+        strings = {()}
+        for symbol in symbols:
+            tails = {(symbol,)} if self.is_terminal(symbol) else first2[symbol]
+            strings = {(head + tail)[:2] if len(head) < 2 else head for head in strings for tail in tails}
+        return strings
+
+    def build_table(self):
+        table = {name: {} for name in self.productions}
+        for name, alternatives in self.productions.items():
+            for alternative in alternatives:
+                symbols, nullable = self.first_of(alternative)
+                if nullable:
+                    symbols = symbols | self.follow[name]
+                for token in symbols:
+                    table[name].setdefault(token, []).append(alternative)
+        conflicts = []
+        first2 = None
+        for name, row in table.items():
+            for token, alternatives in row.items():
+                if len(alternatives) == 1:
+                    row[token] = alternatives[0]
+                    continue
+                if first2 is None:
+                    first2 = self.compute_first2()
+                conflict = Conflict(name, token, alternatives, self.resolve(name, token, alternatives, first2))
+                conflicts.append(conflict)
+                row[token] = conflict
+        return table, conflicts
+
+    def compile_alternative(self, alternative):
+        return tuple(TOKEN_KIND[symbol] if self.is_terminal(symbol) else symbol for symbol in alternative)
+
+    def compile_table(self):
+        # key the rows by token kind and replace the terminals by their kinds, so parse() compares integers
+        table = {}
+        for name, row in self.symbol_table.items():
+            compiled = table[name] = {}
+            for token, entry in row.items():
+                if entry.__class__ is Conflict:
+                    second = None
+                    if entry.second is not None:
+                        second = {TOKEN_KIND[follower]: self.compile_alternative(alternative) for follower, alternative in entry.second.items()}
+                    productions = [self.compile_alternative(alternative) for alternative in entry.productions]
+                    compiled[TOKEN_KIND[token]] = Conflict(name, token, productions, second)
+                else:
+                    compiled[TOKEN_KIND[token]] = self.compile_alternative(entry)
+        return table
+
+    def compile_sync(self):
+        # nonterminal -> the token kinds panic mode stops skipping at: those it can start with (it is
+        # then parsed again) and those that can follow it (it is then given up), EOF included
+        return {name: frozenset(TOKEN_KIND[token] for token in self.first[name] | self.follow[name]) | {EOF_KIND}
+                for name in self.productions}
+
+    def resolve(self, name, token, alternatives, first2):
+        # try to pick the alternative from the token after the conflicting one
+        second = {}
+        for alternative in alternatives:
+            followers = set()
+            for string in self.first2_of(alternative, first2):
+                if not string:
+                    # an empty alternative would need FOLLOW2, give up on this cell
+                    return None
+                if string[0] != token:
+                    continue
+                if len(string) == 2:
+                    followers.add(string[1])
+                else:
+                    followers |= self.follow[name]
+            for follower in followers:
+                if second.setdefault(follower, alternative) is not alternative:
+                    return None
+        return second
+
+    def describe(self, symbol):
+        if symbol in self.helpers:
+            return f'{self.helpers[symbol]} in <{symbol.split("#")[0]}>'
+        return f'<{symbol}>'
+
+    def report(self, output=sys.stdout):
+        for name in self.productions:
+            output.write(f'FIRST({name}) = {" ".join(sorted(self.first[name]))}\n')
+        for name in self.productions:
+            output.write(f'FOLLOW({name}) = {" ".join(sorted(self.follow[name]))}\n')
+        if not self.conflicts:
+            output.write('The grammar is LL(1)\n')
+        for conflict in self.conflicts:
+            choices = ' | '.join(' '.join(alternative) or 'ε' for alternative in conflict.productions)
+            if conflict.second is not None:
+                outcome = 'resolved with one more token of lookahead'
+            else:
+                outcome = 'unresolved, the first alternative is used'
+            output.write(f'LL(1) conflict in {self.describe(conflict.nonterminal)} on {conflict.token}: {choices} ({outcome})\n')
+
+# the grammar is only read and analysed once per process
+grammars = {}
+
+def load_grammar(source=GRAMMAR_FILE):
+    if source not in grammars:
+        grammars[source] = Grammar(source)
+    return grammars[source]
+
+def add_tree_node(val, parent, token=None):
+    node = TreeNode(val, token=token)
+    parent.add_child(node)
+    return node
+
+def parse(token_stream, grammar=None, arena=None, reuse=None, start=None):
+    # parse the token stream into the CST of grammar.start, the same tree program() builds
+    # with an arena (cst_arena.CSTArena) the nodes are stored there instead, and the root's row is returned
+    # reuse lets a previous tree's subtrees be spliced in instead of parsed again (see incremental.SubtreeReuse):
+    # before a nonterminal in reuse.symbols is expanded, reuse.lookup() may return an existing node for it,
+    # otherwise reuse.start() and reuse.finish() are told where the new node's tokens begin and end
+    # start parses a single nonterminal of the grammar from the stream's position instead of the whole program
+    grammar = load_grammar() if grammar is None else grammar
+    start = grammar.start if start is None else start
+    table = grammar.table
+    helpers = grammar.helpers
+    diagnostics = getattr(token_stream, 'diagnostics', None)
+    # tokens matched since the last syntax error, the errors that follow one without a match in between
+    # are its consequences and are not reported
+    matched = 1
+    if arena is None:
+        add_node = add_tree_node
+        root = TreeNode(start)
+    else:
+        add_node = arena.add_node
+        root = arena.add_node(start)
+    # each stack entry is a symbol still to be matched and the node its subtree goes under
+    stack = [(start, None)]
+    while stack:
+        symbol, parent = stack.pop()
+        token = token_stream.peek()
+        if symbol.__class__ is int:
+            # a terminal, given by its token kind
+            if token.kind != symbol:
+                error = syntax_error(token, TOKEN_KINDS[symbol])
+                if diagnostics is None:
+                    raise error
+                # recovered from as if it had been there
+                if matched:
+                    diagnostics.append(error)
+                matched = 0
+                continue
+            add_node(TOKEN_KINDS[symbol], parent, token_stream.pop())
+            matched += 1
+            continue
+        if reuse is not None:
+            if symbol is None:
+                # all of parent's tokens have been matched
+                reuse.finish(parent, token_stream)
+                continue
+            if symbol in reuse.symbols and parent is not None:
+                node = reuse.lookup(symbol, token_stream)
+                if node is not None:
+                    parent.add_child(node)
+                    continue
+        alternative = table[symbol].get(token.kind)
+        if alternative is None:
+            error = syntax_error(token, grammar.describe(symbol))
+            if diagnostics is None:
+                raise error
+            if symbol in grammar.nullable:
+                # an optional part is left out, the error shows at whatever comes next
+                continue
+            if matched:
+                diagnostics.append(error)
+            matched = 0
+            # skip to a token the symbol starts with (and parse it from there) or one that follows it (and give it up);
+            # the skipped tokens go in an error node, like wumpus_parser.recover() makes
+            sync = grammar.sync[symbol]
+            if token.kind not in sync:
+                error_node = add_node('error', root if parent is None else parent)
+                while token.kind not in sync:
+                    add_node(token.token_type, error_node, token_stream.pop())
+                    token = token_stream.peek()
+            if token.kind in table[symbol]:
+                stack.append((symbol, parent))
+            continue
+        if alternative.__class__ is Conflict:
+            conflict = alternative
+            if conflict.second is None:
+                alternative = conflict.productions[0]
+            else:
+                alternative = conflict.second.get(token_stream.peek(1).kind)
+                if alternative is None:
+                    error = syntax_error(token_stream.peek(1), grammar.describe(symbol))
+                    if diagnostics is None:
+                        raise error
+                    if matched:
+                        diagnostics.append(error)
+                    matched = 0
+                    # the error then shows where the first alternative stops matching
+                    alternative = conflict.productions[0]
+        if symbol in helpers:
+            node = parent
+        elif parent is None:
+            node = root
+        else:
+            node = add_node(symbol, parent)
+            if reuse is not None and symbol in reuse.symbols:
+                reuse.start(node, token_stream)
+                stack.append((None, node))
+        for child in reversed(alternative):
+            stack.append((child, node))
+    return root
+
+def syntax_error(token, expected):
+    # the error for finding token where expected should be
+    if token.kind == EOF_KIND:
+        return MissingTokenError(expected, token)
+    return ExpectationError(token, expected)
+
+def parse_recovering(token_stream, grammar=None):
+    # parse the whole input, recovering from syntax errors in panic mode, like wumpus_parser.parse_recovering()
+    # returns the CST, with an error node wherever tokens were skipped, and the list of every syntax error found
+    token_stream.diagnostics = []
+    try:
+        root = parse(token_stream, grammar)
+    finally:
+        diagnostics = token_stream.diagnostics
+        token_stream.diagnostics = None
+    return root, diagnostics
+
+def program(token_stream):
+    # drop-in replacement for wumpus_parser.program(): every syntax error is reported, after the partial tree,
+    # before the process exits
+    node, diagnostics = parse_recovering(token_stream)
+    if diagnostics:
+        print(node)
+        for error in diagnostics:
+            print(error)
+        sys.exit(1)
+    return node
+
+def main():
+    parse_args = argparse.ArgumentParser()
+    parse_args.add_argument('-g', '--grammar', help='Grammar file to analyse', type=str, default=GRAMMAR_FILE)
+    args = parse_args.parse_args()
+    grammar = load_grammar(args.grammar)
+    grammar.report()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# Tournament runner: every agent program against every world seed, over a process pool
+# Each program is parsed and compiled once here; the workers receive the bytecode once, when they start,
+# and then only (program, seed) pairs. Every game has a step and a time budget. Results are streamed
+# into a columnar results directory: one raw little-endian file per column and a manifest.json that
+# describes the columns, the programs and the outcome names (see read_results).
+
+import os
+import sys
+import json
+import time
+import argparse
+from array import array
+from multiprocessing import Pool
+
+import numpy as np
+
+import table_parser
+from lexer import tokenize, LineIndex
+from batch import find_files
+from wumpus_parser import LexerTokenStream, ExpectationError, MissingTokenError
+from wumpus_vm import VM, compile_program, CompileError, VMError, MAX_STEPS
+from wumpus_world import WorldError, ALIVE, GOLD, DEAD, OUT_OF_STEPS, OUT_OF_TIME
+from wumpus_batch import WorldBatch, ERROR
+
+OUTCOMES = (ALIVE, GOLD, DEAD, OUT_OF_STEPS, OUT_OF_TIME, ERROR)
+
+# column name -> array typecode and the matching NumPy dtype
+COLUMNS = {
+    'program': ('I', '<u4'),
+    'seed': ('q', '<i8'),
+    'outcome': ('B', '<u1'),
+    'score': ('q', '<i8'),
+    'steps': ('q', '<i8'),
+    'actions': ('q', '<i8'),
+    'seconds': ('d', '<f8'),
+}
+MANIFEST = 'manifest.json'
+# rows buffered before the column files are written to
+FLUSH_ROWS = 4096
+
+# per-worker state, set up by init_worker
+worker = {}
+
+class ResultsWriter:
+    '''Appends result rows to one file per column in directory, and writes the manifest on close'''
+    def __init__(self, directory, programs, settings):
+        self.directory = directory
+        self.programs = programs
+        self.settings = settings
+        self.rows = 0
+        os.makedirs(directory, exist_ok=True)
+        self.files = {name: open(os.path.join(directory, f'{name}.bin'), 'wb') for name in COLUMNS}
+        self.buffers = {name: array(typecode) for name, (typecode, _) in COLUMNS.items()}
+
+    def write(self, row):
+        for name, value in zip(COLUMNS, row):
+            self.buffers[name].append(value)
+        self.rows += 1
+        if len(self.buffers['program']) >= FLUSH_ROWS:
+            self.flush()
+
+    def flush(self):
+        for name, buffer in self.buffers.items():
+            if sys.byteorder != 'little':
+                buffer.byteswap()
+            buffer.tofile(self.files[name])
+            del buffer[:]
+
+    def close(self):
+        self.flush()
+        for file in self.files.values():
+            file.close()
+        manifest = {
+            'rows': self.rows,
+            'columns': [{'name': name, 'dtype': dtype, 'file': f'{name}.bin'} for name, (_, dtype) in COLUMNS.items()],
+            'programs': self.programs,
+            'outcomes': list(OUTCOMES),
+            'settings': self.settings,
+        }
+        with open(os.path.join(self.directory, MANIFEST), 'w', encoding='utf8') as file:
+            json.dump(manifest, file, indent=2)
+
+def read_results(directory):
+    # the manifest and a dict of column name -> NumPy array
+    with open(os.path.join(directory, MANIFEST), 'r', encoding='utf8') as file:
+        manifest = json.load(file)
+    columns = {}
+    for column in manifest['columns']:
+        columns[column['name']] = np.fromfile(os.path.join(directory, column['file']), dtype=column['dtype'], count=manifest['rows'])
+    return manifest, columns
+
+def compile_file(path, optimize=False):
+    with open(path, 'r') as file:
+        source = file.read()
+    cst, diagnostics = table_parser.parse_recovering(LexerTokenStream(tokenize(source, engine='scanner'), LineIndex(source)))
+    if diagnostics:
+        # every syntax error of the program, not only the first
+        raise CompileError('; '.join(str(error) for error in diagnostics))
+    bytecode = compile_program(cst, optimize)
+    # make sure random worlds can be drawn for its init block
+    WorldBatch.random(bytecode.world, 1, seed=0).world(0)
+    return bytecode
+
+def init_worker(bytecodes, max_steps, max_seconds, pit_probability):
+    worker['vms'] = [VM(bytecode) for bytecode in bytecodes]
+    worker['max_steps'] = max_steps
+    worker['max_seconds'] = max_seconds
+    worker['pit_probability'] = pit_probability
+
+def play(game):
+    # one game: a row of the results, in COLUMNS order
+    program, seed = game
+    vm = worker['vms'][program]
+    world = WorldBatch.random(vm.bytecode.world, 1, worker['pit_probability'], seed).world(0)
+    start = time.perf_counter()
+    try:
+        result = vm.run(world, worker['max_steps'], max_seconds=worker['max_seconds'])
+        row = (program, seed, OUTCOMES.index(result.outcome), result.score, result.steps, result.actions)
+    except VMError:
+        row = (program, seed, OUTCOMES.index(ERROR), world.score(), 0, world.actions)
+    return row + (time.perf_counter() - start,)
+
+def main():
+    parse = argparse.ArgumentParser(description='Play every agent program against every world seed')
+    parse.add_argument('paths', help='Agent program files, directories (searched recursively) or glob patterns', nargs='+')
+    parse.add_argument('-n', '--seeds', help='Number of world seeds per program', type=int, default=100)
+    parse.add_argument('--first-seed', help='First world seed', type=int, default=0)
+    parse.add_argument('-o', '--output', help='Results directory', type=str, default='tournament_results')
+    parse.add_argument('-j', '--workers', help='Number of worker processes', type=int, default=os.cpu_count())
+    parse.add_argument('-c', '--chunksize', help='Games handed to a worker at a time', type=int, default=64)
+    parse.add_argument('-p', '--pattern', help='File name pattern used inside directories', type=str, default='*.txt')
+    parse.add_argument('--pits', help='Probability of a pit in a room', type=float, default=0.2)
+    parse.add_argument('--max-steps', help='Instructions per game', type=int, default=MAX_STEPS)
+    parse.add_argument('--max-seconds', help='Seconds per game', type=float, default=1.0)
+    parse.add_argument('-O', '--optimize', help='Fold constant expressions and dead branches before compiling', action='store_true')
+    args = parse.parse_args()
+
+    # parse and compile every program once
+    paths = []
+    bytecodes = []
+    for path in find_files(args.paths, args.pattern):
+        try:
+            bytecodes.append(compile_file(path, args.optimize))
+            paths.append(path)
+        except (ExpectationError, MissingTokenError, CompileError, WorldError) as e:
+            print(f'{path}: skipped, {e}')
+    if not bytecodes:
+        print('No playable programs')
+        sys.exit(1)
+
+    seeds = range(args.first_seed, args.first_seed + args.seeds)
+    games = ((program, seed) for program in range(len(bytecodes)) for seed in seeds)
+    settings = {'pits': args.pits, 'max_steps': args.max_steps, 'max_seconds': args.max_seconds, 'optimize': args.optimize}
+    writer = ResultsWriter(args.output, paths, settings)
+    scores = np.zeros(len(bytecodes), dtype=np.int64)
+    wins = np.zeros(len(bytecodes), dtype=np.int64)
+    start = time.perf_counter()
+    initargs = (bytecodes, args.max_steps, args.max_seconds, args.pits)
+    with Pool(max(1, args.workers), initializer=init_worker, initargs=initargs) as pool:
+        for row in pool.imap_unordered(play, games, max(1, args.chunksize)):
+            writer.write(row)
+            scores[row[0]] += row[3]
+            wins[row[0]] += row[2] == OUTCOMES.index(GOLD)
+    writer.close()
+    elapsed = time.perf_counter() - start
+
+    for program, path in enumerate(paths):
+        print(f'{path}: mean score {scores[program] / args.seeds:9.2f}, gold in {wins[program]} of {args.seeds} games')
+    print(f'{writer.rows} games in {elapsed:.3f} s ({writer.rows / elapsed:.1f} games/s), results in {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+# Tracing and profiling of the recursive descent parser (wumpus_parser)
+# Nothing here costs anything until a tracer is installed: install() swaps the selected production
+# functions of wumpus_parser (and the dispatch tables that hold them) for wrappers that call the tracer,
+# and uninstall() puts the originals back. A tracer gets enter() before a production parses and
+# leave() after it returns or raises; tracers that count tokens also get consume() for every matched terminal.
+# Timeline records the lex, parse and render stages (and optionally productions) as Chrome trace events,
+# which chrome://tracing and Perfetto can open.
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import functools
+from contextlib import contextmanager
+
+import wumpus_parser
+from lexer import tokenize, ENGINES
+from table_parser import GRAMMAR_FILE
+
+def production_names(grammar_file=GRAMMAR_FILE):
+    # the nonterminals of grammar.txt that wumpus_parser has a function for, in grammar order
+    with open(grammar_file, 'r') as file:
+        names = re.findall(r'^<(\w+)>\s*::=', file.read(), re.MULTILINE)
+    return [name for name in names if callable(getattr(wumpus_parser, name, None))]
+
+def terminal_names():
+    # the terminal functions of wumpus_parser, one per token type
+    return [name for name, value in vars(wumpus_parser).items() if name.isupper() and callable(value)]
+
+class Tracer:
+    '''Base of the tracers, every hook does nothing'''
+    # whether consume() should be called for every terminal the parser matches
+    count_tokens = False
+
+    def enter(self, name, token_stream):
+        pass
+
+    def leave(self, name, token_stream, node):
+        # node is None when the production raised a syntax error
+        pass
+
+    def consume(self):
+        pass
+
+class Tracers(Tracer):
+    '''Sends every call on to several tracers'''
+    def __init__(self, *tracers):
+        self.tracers = tracers
+        self.count_tokens = any(tracer.count_tokens for tracer in tracers)
+
+    def enter(self, name, token_stream):
+        for tracer in self.tracers:
+            tracer.enter(name, token_stream)
+
+    def leave(self, name, token_stream, node):
+        for tracer in reversed(self.tracers):
+            tracer.leave(name, token_stream, node)
+
+    def consume(self):
+        for tracer in self.tracers:
+            tracer.consume()
+
+class PrintTracer(Tracer):
+    '''Writes a line per production entered, indented by nesting, with the token it starts at'''
+    def __init__(self, output_file=sys.stdout):
+        self.output_file = output_file
+        self.depth = 0
+
+    def enter(self, name, token_stream):
+        token = token_stream.peek()
+        self.output_file.write(f'{"  " * self.depth}{name} at {token.token_type} {token.token_value!r} (line {token.token_line})\n')
+        self.depth += 1
+
+    def leave(self, name, token_stream, node):
+        self.depth -= 1
+
+class ProductionStats:
+    '''
+    What the profiler measured for one production
+    total and tokens count a recursive production's outermost calls only, own excludes the time of nested productions
+    '''
+    __slots__ = ('calls', 'tokens', 'total', 'own')
+
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0
+        self.total = 0.0
+        self.own = 0.0
+
+class Profiler(Tracer):
+    '''Call counts, tokens consumed and cumulative time per production'''
+    count_tokens = True
+
+    def __init__(self):
+        self.stats = {}
+        # [name, start time, tokens consumed before, time spent in nested productions] per active call
+        self.stack = []
+        # active calls per production, to count recursive ones once
+        self.active = {}
+        self.tokens = 0
+
+    def enter(self, name, token_stream):
+        self.active[name] = self.active.get(name, 0) + 1
+        self.stack.append([name, time.perf_counter(), self.tokens, 0.0])
+
+    def leave(self, name, token_stream, node):
+        _, start, tokens, nested = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = ProductionStats()
+        stats.calls += 1
+        stats.own += elapsed - nested
+        if self.stack:
+            self.stack[-1][3] += elapsed
+        depth = self.active[name] = self.active[name] - 1
+        if not depth:
+            stats.total += elapsed
+            stats.tokens += self.tokens - tokens
+
+    def consume(self):
+        self.tokens += 1
+
+    def report(self, output_file=sys.stdout):
+        # one line per production, by time spent in the production itself
+        output_file.write(f'{"production":<28}{"calls":>10}{"tokens":>10}{"total ms":>12}{"self ms":>12}\n')
+        for name, stats in sorted(self.stats.items(), key=lambda item: item[1].own, reverse=True):
+            output_file.write(f'{name:<28}{stats.calls:>10}{stats.tokens:>10}{stats.total * 1000:>12.3f}{stats.own * 1000:>12.3f}\n')
+
+class Timeline(Tracer):
+    '''
+    Chrome trace events: a complete event per stage, and begin/end events per production when installed
+    Timestamps are microseconds since the timeline was created
+    '''
+    def __init__(self, pid=None):
+        self.events = []
+        self.pid = os.getpid() if pid is None else pid
+        self.origin = time.perf_counter()
+
+    def now(self):
+        return (time.perf_counter() - self.origin) * 1e6
+
+    @contextmanager
+    def stage(self, name, **args):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.events.append({'name': name, 'cat': 'stage', 'ph': 'X', 'ts': start, 'dur': self.now() - start, 'pid': self.pid, 'tid': 0, 'args': args})
+
+    def enter(self, name, token_stream):
+        self.events.append({'name': name, 'cat': 'production', 'ph': 'B', 'ts': self.now(), 'pid': self.pid, 'tid': 0})
+
+    def leave(self, name, token_stream, node):
+        self.events.append({'name': name, 'cat': 'production', 'ph': 'E', 'ts': self.now(), 'pid': self.pid, 'tid': 0})
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf8') as file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, file)
+
+def traced_production(name, production, tracer):
+    enter = tracer.enter
+    leave = tracer.leave
+
+    @functools.wraps(production)
+    def wrapper(token_stream):
+        enter(name, token_stream)
+        node = None
+        try:
+            node = production(token_stream)
+            return node
+        finally:
+            leave(name, token_stream, node)
+    return wrapper
+
+def counted_terminal(terminal, tracer):
+    consume = tracer.consume
+
+    @functools.wraps(terminal)
+    def wrapper(token_stream):
+        node = terminal(token_stream)
+        if node is not None:
+            consume()
+        return node
+    return wrapper
+
+# the originals of the functions replaced by install(), name -> function
+installed = {}
+
+def install(tracer, productions=None):
+    # trace the named productions (all of them by default) of wumpus_parser with tracer
+    if installed:
+        raise RuntimeError('A tracer is already installed')
+    names = production_names() if productions is None else list(productions)
+    unknown = [name for name in names if not callable(getattr(wumpus_parser, name, None))]
+    if unknown:
+        raise ValueError(f'No such production: {", ".join(unknown)}')
+    replacements = {}
+    for name in names:
+        replacements[name] = traced_production(name, getattr(wumpus_parser, name), tracer)
+    if tracer.count_tokens:
+        for name in terminal_names():
+            replacements[name] = counted_terminal(getattr(wumpus_parser, name), tracer)
+    swap(replacements)
+
+def uninstall():
+    swap(dict(installed), restore=True)
+    installed.clear()
+
+def swap(replacements, restore=False):
+    # rebind the module's globals and the entries of its dispatch tables
+    namespace = vars(wumpus_parser)
+    current = {id(namespace[name]): replacement for name, replacement in replacements.items()}
+    for name, replacement in replacements.items():
+        if not restore:
+            installed[name] = namespace[name]
+        namespace[name] = replacement
+    for name, table in list(namespace.items()):
+        if table.__class__ is dict and not name.startswith('__'):
+            for key, value in table.items():
+                replacement = current.get(id(value))
+                if replacement is not None:
+                    table[key] = replacement
+
+@contextmanager
+def tracing(tracer, productions=None):
+    install(tracer, productions)
+    try:
+        yield tracer
+    finally:
+        uninstall()
+
+def run_stages(source, engine, output_file, timeline):
+    # lex, parse and render as separate stages; returns the number of tokens, the CST and the syntax errors
+    with timeline.stage('lex', engine=engine):
+        tokens = list(tokenize(source, engine=engine))
+    with timeline.stage('parse', tokens=len(tokens)):
+        cst, diagnostics = wumpus_parser.parse_recovering(wumpus_parser.LexerTokenStream(tokens, wumpus_parser.LineIndex(source)))
+    with timeline.stage('render'):
+        wumpus_parser.render_tree(cst, output_file)
+    return len(tokens), cst, diagnostics
+
+def main():
+    parse = argparse.ArgumentParser(description='Trace or profile the recursive descent parser on a source file')
+    parse.add_argument('-f', '--file', help='Wumpus source file', type=str, required=True)
+    parse.add_argument('--engine', help='Lexer backend', choices=ENGINES, default='scanner')
+    parse.add_argument('-p', '--productions', help='Comma separated productions to trace (all by default)', type=str)
+    parse.add_argument('--print', help='Print every traced production as it is entered', action='store_true', dest='print_trace')
+    parse.add_argument('--profile', help='Report calls, tokens and time per production', action='store_true')
+    parse.add_argument('--chrome', help='Write the stage timings as Chrome trace-event JSON to this file', type=str)
+    parse.add_argument('--chrome-productions', help='Add the traced productions to the Chrome trace', action='store_true')
+    parse.add_argument('-o', '--output', help='File the CST is rendered to (discarded by default)', type=str, default=os.devnull)
+    args = parse.parse_args()
+
+    productions = args.productions.split(',') if args.productions else None
+    timeline = Timeline()
+    profiler = Profiler() if args.profile else None
+    tracers = [tracer for tracer in (profiler, PrintTracer() if args.print_trace else None) if tracer is not None]
+    if args.chrome and args.chrome_productions:
+        tracers.append(timeline)
+
+    with open(args.file, 'r') as file:
+        source = file.read()
+    with open(args.output, 'w', encoding='utf8') as output_file:
+        if tracers:
+            with tracing(Tracers(*tracers), productions):
+                count, cst, diagnostics = run_stages(source, args.engine, output_file, timeline)
+        else:
+            count, cst, diagnostics = run_stages(source, args.engine, output_file, timeline)
+
+    for error in diagnostics:
+        print(error)
+    if profiler is not None:
+        profiler.report()
+    for event in timeline.events:
+        if event['cat'] == 'stage':
+            print(f'{event["name"]:<8}{event["dur"] / 1000:>10.3f} ms')
+    print(f'{count} tokens')
+    if args.chrome:
+        timeline.write(args.chrome)
+        print(f'Chrome trace written to {args.chrome}')
+
+if __name__ == '__main__':
+    main()
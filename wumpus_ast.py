@@ -0,0 +1,395 @@
+# Lowering of the CST built by program() into a compact AST
+# Punctuation leaves (LPAREN, COMMA, RBRACE, ...) are dropped, single-child wrappers such as
+# statement, element, exprbase and exprfac are collapsed, and every construct gets a slotted node type.
+
+import io
+from wumpus_parser import render_tree
+
+class Node:
+    '''
+    Base of the AST nodes
+    fields lists the attributes holding child nodes (or lists of them), in source order
+    '''
+    __slots__ = ('line',)
+    fields = ()
+
+    def __str__(self):
+        buffer = io.StringIO()
+        render_tree(display_tree(self), buffer)
+        return buffer.getvalue()
+
+class Program(Node):
+    __slots__ = ('constants', 'functions', 'world', 'body', 'scope')
+    fields = ('constants', 'functions', 'world', 'body')
+
+    def __init__(self, constants, functions, world, body, line=None, scope=None):
+        self.constants = constants
+        self.functions = functions
+        self.world = world
+        self.body = body
+        self.line = line
+        # the play block's local scope, set by wumpus_semantic
+        self.scope = scope
+
+class ConstDecl(Node):
+    __slots__ = ('type', 'name', 'value')
+
+    def __init__(self, type, name, value, line=None):
+        self.type = type
+        self.name = name
+        self.value = value
+        self.line = line
+
+class FunctionDecl(Node):
+    __slots__ = ('return_type', 'name', 'params', 'body', 'scope')
+    fields = ('body',)
+
+    def __init__(self, return_type, name, params, body, line=None, scope=None):
+        self.return_type = return_type
+        # list of (type, name) pairs
+        self.params = params
+        self.name = name
+        self.body = body
+        self.line = line
+        # parameters and local variables, set by wumpus_semantic
+        self.scope = scope
+
+class WorldInit(Node):
+    '''
+    The init block: grid size and the mandatory placements as (x, y) pairs,
+    then the place_pit / clear_room statements in order as (statement, x, y)
+    '''
+    __slots__ = ('grid_size', 'agent', 'wumpus', 'gold', 'rooms')
+
+    def __init__(self, grid_size, agent, wumpus, gold, rooms, line=None):
+        self.grid_size = grid_size
+        self.agent = agent
+        self.wumpus = wumpus
+        self.gold = gold
+        self.rooms = rooms
+        self.line = line
+
+class Move(Node):
+    __slots__ = ('direction',)
+
+    def __init__(self, direction, line=None):
+        self.direction = direction
+        self.line = line
+
+class Shoot(Node):
+    __slots__ = ('direction',)
+
+    def __init__(self, direction, line=None):
+        self.direction = direction
+        self.line = line
+
+class Grab(Node):
+    __slots__ = ()
+
+    def __init__(self, line=None):
+        self.line = line
+
+class PrintPosition(Node):
+    __slots__ = ()
+
+    def __init__(self, line=None):
+        self.line = line
+
+class If(Node):
+    __slots__ = ('condition', 'body', 'orelse')
+    fields = ('condition', 'body', 'orelse')
+
+    def __init__(self, condition, body, orelse, line=None):
+        self.condition = condition
+        self.body = body
+        # empty list when there is no else block
+        self.orelse = orelse
+        self.line = line
+
+class While(Node):
+    __slots__ = ('condition', 'body')
+    fields = ('condition', 'body')
+
+    def __init__(self, condition, body, line=None):
+        self.condition = condition
+        self.body = body
+        self.line = line
+
+class Assign(Node):
+    __slots__ = ('target', 'value')
+    fields = ('target', 'value')
+
+    def __init__(self, target, value, line=None):
+        self.target = target
+        self.value = value
+        self.line = line
+
+class Return(Node):
+    __slots__ = ('value',)
+    fields = ('value',)
+
+    def __init__(self, value, line=None):
+        self.value = value
+        self.line = line
+
+class Call(Node):
+    __slots__ = ('name', 'args', 'symbol')
+    fields = ('args',)
+
+    def __init__(self, name, args, line=None, symbol=None):
+        self.name = name
+        self.args = args
+        self.line = line
+        # the called function's symbol, set by wumpus_semantic
+        self.symbol = symbol
+
+class BinOp(Node):
+    '''Arithmetic (+ - * /), comparison (== != < <= > >=) and logic (and or) operators'''
+    __slots__ = ('op', 'left', 'right')
+    fields = ('left', 'right')
+
+    def __init__(self, op, left, right, line=None):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.line = line
+
+class Negate(Node):
+    __slots__ = ('operand',)
+    fields = ('operand',)
+
+    def __init__(self, operand, line=None):
+        self.operand = operand
+        self.line = line
+
+class Sense(Node):
+    '''sense_stench(), sense_breeze() or sense_glitter(), percept is 'stench', 'breeze' or 'glitter\''''
+    __slots__ = ('percept',)
+
+    def __init__(self, percept, line=None):
+        self.percept = percept
+        self.line = line
+
+class Var(Node):
+    __slots__ = ('name', 'index', 'symbol')
+    fields = ('index',)
+
+    def __init__(self, name, index=None, line=None, symbol=None):
+        self.name = name
+        self.index = index
+        self.line = line
+        # the constant, parameter or variable the name resolves to, set by wumpus_semantic
+        self.symbol = symbol
+
+class Literal(Node):
+    '''An INTEGER (int) or BOOLEAN (bool) value'''
+    __slots__ = ('value',)
+
+    def __init__(self, value, line=None):
+        self.value = value
+        self.line = line
+
+'''Lowering'''
+
+def terminals(node):
+    # the token leaves directly under a CST node
+    return [child.token for child in node.children if child.token is not None]
+
+def subtrees(node):
+    # the inner nodes directly under a CST node
+    return [child for child in node.children if child.token is None]
+
+def literal(token):
+    if token.token_type == 'BOOLEAN':
+        return Literal(token.token_value == 'true', token.token_line)
+    return Literal(int(token.token_value), token.token_line)
+
+def location(node):
+    # <location> ::= INTEGER COMMA INTEGER, under GRID_SIZE LPAREN <location> RPAREN and the like
+    x, _, y = terminals(subtrees(node)[0])
+    return int(x.token_value), int(y.token_value)
+
+def lower(cst):
+    # <program> ::= <declarations> <init_block> <play_block>
+    declarations, init, play = cst.children
+    constants = []
+    functions = []
+    for declaration in declarations.children or ():
+        if declaration.val == 'constant_declaration':
+            constants.append(lower_constant(declaration))
+        else:
+            functions.append(lower_function(declaration))
+    return Program(constants, functions, lower_init(init), lower_block(play), line=1)
+
+def lower_constant(node):
+    # CONSTANT (INTDTYPE|BOOLDTYPE) ID ASSIGNMENT (INTEGER | BOOLEAN)
+    _, data_type, name, _, value = terminals(node)
+    return ConstDecl(data_type.token_value, name.token_value, literal(value).value, data_type.token_line)
+
+def lower_function(node):
+    # FUNCTION <return_type> ID LPAREN [<formal_params> {COMMA <formal_params>}] RPAREN <block>
+    keyword, name = terminals(node)[:2]
+    return_type, *params, body = subtrees(node)
+    params = [tuple(token.token_value for token in terminals(param)) for param in params]
+    return FunctionDecl(terminals(return_type)[0].token_value, name.token_value, params, lower_block(body), keyword.token_line)
+
+def lower_init(node):
+    # INIT LBRACE <grid_size> <mandatory_agent> <mandatory_wumpus> <mandatory_gold> {<init_statement>} RBRACE
+    grid, agent, wumpus, gold, *statements = subtrees(node)
+    rooms = [(terminals(statement)[0].token_value,) + location(statement) for statement in statements]
+    return WorldInit(location(grid), location(agent), location(wumpus), location(gold), rooms, terminals(node)[0].token_line)
+
+def lower_block(node):
+    # LBRACE <statement> {<statement>} RBRACE, and the same for the play block
+    return [lower_statement(statement.children[0]) for statement in subtrees(node)]
+
+def lower_statement(node):
+    return statement_lowerers[node.val](node)
+
+def lower_move(node):
+    keyword = terminals(node)[0]
+    return Move(terminals(subtrees(node)[0])[0].token_value, keyword.token_line)
+
+def lower_shoot(node):
+    keyword = terminals(node)[0]
+    return Shoot(terminals(subtrees(node)[0])[0].token_value, keyword.token_line)
+
+def lower_if(node):
+    # IF LPAREN <conditional_expression> RPAREN <block> [ELSE <block>]
+    condition, body, *orelse = subtrees(node)
+    orelse = lower_block(orelse[0]) if orelse else []
+    return If(lower_condition(condition), lower_block(body), orelse, terminals(node)[0].token_line)
+
+def lower_while(node):
+    condition, body = subtrees(node)
+    return While(lower_condition(condition), lower_block(body), terminals(node)[0].token_line)
+
+def lower_assignment(node):
+    # <var> ASSIGNMENT (<element> | ID LPAREN [ID {COMMA ID}] RPAREN)
+    target = lower_var(node.children[0])
+    rest = node.children[2:]
+    if rest[0].token is None:
+        value = lower_element(rest[0])
+    else:
+        name, *args = [child.token for child in rest if child.val == 'ID']
+        value = Call(name.token_value, [Var(arg.token_value, line=arg.token_line) for arg in args], name.token_line)
+    return Assign(target, value, target.line)
+
+def lower_return(node):
+    return Return(lower_expr(subtrees(node)[0]), terminals(node)[0].token_line)
+
+def lower_condition(node):
+    # <conditional_expression> ::= <term> { LOGIC <term>}, folded from the left
+    return lower_chain(node, lower_term)
+
+def lower_term(node):
+    # <term> ::= <element> { COMPARISON <element>}, folded from the left
+    return lower_chain(node, lower_element)
+
+def lower_chain(node, lower_operand):
+    children = node.children
+    result = lower_operand(children[0])
+    for i in range(1, len(children), 2):
+        operator = children[i].token
+        result = BinOp(operator.token_value, result, lower_operand(children[i + 1]), operator.token_line)
+    return result
+
+def lower_element(node):
+    # <element> ::= <sense> | <expr>
+    child = node.children[0]
+    if child.val == 'sense':
+        statement = child.children[0]
+        keyword = statement.children[0].token
+        return Sense(keyword.token_value[len('sense_'):], keyword.token_line)
+    return lower_expr(child)
+
+def lower_expr(node):
+    # <expr> ::= <exprfac> [ (PLUS | MINUS) <expr> ]
+    # the CST nests the chain to the right, a - b - c means (a - b) - c so it is folded from the left
+    children = node.children
+    result = lower_exprfac(children[0])
+    while len(children) > 1:
+        operator = children[1].token
+        children = children[2].children
+        result = BinOp(operator.token_value, result, lower_exprfac(children[0]), operator.token_line)
+    return result
+
+def lower_exprfac(node):
+    # <exprfac> ::= <exprbase> [ (MULTIPLY | DIVIDE) <exprbase> ], a single operator
+    children = node.children
+    left = lower_exprbase(children[0])
+    if len(children) == 1:
+        return left
+    operator = children[1].token
+    return BinOp(operator.token_value, left, lower_exprbase(children[2]), operator.token_line)
+
+def lower_exprbase(node):
+    # <exprbase> ::= <var> | INTEGER | BOOLEAN | LPAREN <expr> RPAREN | MINUS <exprbase>
+    children = node.children
+    first = children[0]
+    if first.token is None:
+        return lower_var(first)
+    kind = first.token.token_type
+    if kind == 'LPAREN':
+        return lower_expr(children[1])
+    if kind == 'MINUS':
+        return Negate(lower_exprbase(children[1]), first.token.token_line)
+    return literal(first.token)
+
+def lower_var(node):
+    # <var> ::= ID [LEFTBRACKET <expr> RIGHTBRACKET]
+    name = node.children[0].token
+    index = lower_expr(node.children[2]) if len(node.children) > 1 else None
+    return Var(name.token_value, index, name.token_line)
+
+statement_lowerers = {
+    'move_statement': lower_move,
+    'shoot_statement': lower_shoot,
+    'grab_statement': lambda node: Grab(terminals(node)[0].token_line),
+    'print_position_statement': lambda node: PrintPosition(terminals(node)[0].token_line),
+    'if_statement': lower_if,
+    'while_statement': lower_while,
+    'action_assignment': lower_assignment,
+    'return_statement': lower_return,
+}
+
+'''Traversal and printing'''
+
+def walk(node):
+    # every AST node under node (included), in preorder, without recursion
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        children = []
+        for field in node.fields:
+            value = getattr(node, field)
+            if value.__class__ is list:
+                children.extend(value)
+            elif value is not None:
+                children.append(value)
+        stack.extend(reversed(children))
+
+class DisplayNode:
+    # val/children pair render_tree can print
+    __slots__ = ('val', 'children')
+
+    def __init__(self, val, children=None):
+        self.val = val
+        self.children = children
+
+def display_tree(node):
+    label = type(node).__name__
+    # attributes that are not set yet (symbols before semantic analysis) are left out
+    details = [f'{name}={getattr(node, name)!r}' for name in node.__slots__ if name not in node.fields and getattr(node, name) is not None]
+    if details:
+        label += ' ' + ' '.join(details)
+    children = []
+    for field in node.fields:
+        value = getattr(node, field)
+        if value.__class__ is list:
+            if value:
+                children.append(DisplayNode(field, [display_tree(child) for child in value]))
+        elif value is not None:
+            children.append(DisplayNode(field, [display_tree(value)]))
+    return DisplayNode(label, children)
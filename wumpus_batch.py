@@ -0,0 +1,406 @@
+# Lock-step execution of one agent program over many worlds at once
+# Every world shares the grid size of the program's init block. The agent state of all worlds lives in
+# NumPy vectors, program variables are vectors with one value per world, and each statement runs once
+# for the whole batch under a mask of the worlds that reach it: an if runs both branches, each under
+# its part of the mask, and a while loops until no world still in it wants another iteration.
+# Function calls are evaluated recursively for the whole batch, so the depth of recursion in a program
+# is limited by Python's recursion limit here; wumpus_vm runs single worlds without that limit.
+# Cost: a statement runs as long as any world reaches it, so a batch takes at least as many lock-step
+# statements as its longest world, plus the branches and loop turns the worlds do not share, each a few
+# vector operations over the batch. 10,000 worlds costing a few times one world is NOT met: on
+# benchmarks/batch.py one world runs 12 statements in 0.5 to 0.7 ms, while 10,000 worlds run 660 lock-step
+# statements (the longest world 400) in about 70 ms, 110 to 150 times as long, 0.11 ms per statement against
+# 0.06 ms. Per world that is still 35 to 45 times cheaper than running them one by one with wumpus_vm.
+
+import sys
+import argparse
+import numpy as np
+
+import wumpus_ast
+from wumpus_ast import Var
+from wumpus_world import World, WorldError, DELTAS, DIRECTIONS, PERCEPTS, adjacent, move_table
+from wumpus_world import ALIVE, GOLD, DEAD, OUT_OF_STEPS, GOLD_REWARD, DEATH_PENALTY, ACTION_COST, ARROW_COST
+
+# a world whose program divided by zero
+ERROR = 'error'
+OUTCOMES = (ALIVE, GOLD, DEAD, OUT_OF_STEPS, ERROR)
+
+# statements executed per world before it is stopped
+MAX_STEPS = 100000
+
+class WorldBatch:
+    '''
+    N worlds of the same size, as (N, rooms) tables and per-world state vectors
+    Rooms are flat indexes y * width + x, like World.room
+    '''
+    def __init__(self, grid_size, pits, wumpus, gold, agent):
+        self.width, self.height = grid_size
+        self.count = len(wumpus)
+        n = self.count
+        rooms = self.width * self.height
+        pits = pits.reshape(n, self.height, self.width)
+        wumpus_layer = np.zeros_like(pits)
+        wumpus_layer.reshape(n, rooms)[np.arange(n), wumpus] = True
+        self.pits = pits.reshape(n, rooms)
+        self.stench = (adjacent(wumpus_layer) | wumpus_layer).reshape(n, rooms)
+        self.breeze = adjacent(pits).reshape(n, rooms)
+        self.moves = move_table(self.width, self.height)
+        self.wumpus = wumpus
+        self.gold = gold
+        self.start = agent
+        self.index = np.arange(n)
+        self.room = agent.copy()
+        self.facing = np.zeros(n, dtype=np.int8)
+        self.arrows = np.ones(n, dtype=np.int8)
+        self.alive = np.ones(n, dtype=bool)
+        self.has_gold = np.zeros(n, dtype=bool)
+        self.wumpus_alive = np.ones(n, dtype=bool)
+        self.actions = np.zeros(n, dtype=np.int64)
+
+    @classmethod
+    def from_worlds(cls, worlds):
+        # stack World objects built from init blocks, they must all have the same size
+        first = worlds[0]
+        if any((world.width, world.height) != (first.width, first.height) for world in worlds):
+            raise WorldError('All the worlds of a batch must have the same grid size')
+        pits = np.stack([world.pits for world in worlds])
+        wumpus = np.array([world.wumpus_room for world in worlds])
+        gold = np.array([world.gold_room for world in worlds])
+        agent = np.array([world.room for world in worlds])
+        return cls((first.width, first.height), pits, wumpus, gold, agent)
+
+    @classmethod
+    def random(cls, world_init, count, pit_probability=0.2, seed=None):
+        '''
+        count random worlds with the size and agent room of an init block (a wumpus_ast.WorldInit)
+        The Wumpus and the gold are put in any room but the agent's, and every other room
+        except the Wumpus's has a pit with pit_probability
+        '''
+        width, height = world_init.grid_size
+        rooms = width * height
+        if rooms < 2:
+            raise WorldError('A random world needs at least two rooms')
+        rng = np.random.default_rng(seed)
+        agent = world_init.agent[1] * width + world_init.agent[0]
+        # draw from the rooms - 1 rooms that are not the agent's
+        wumpus = rng.integers(0, rooms - 1, count)
+        wumpus += wumpus >= agent
+        gold = rng.integers(0, rooms - 1, count)
+        gold += gold >= agent
+        pits = rng.random((count, rooms)) < pit_probability
+        pits[:, agent] = False
+        pits[np.arange(count), wumpus] = False
+        return cls((width, height), pits, wumpus, gold, np.full(count, agent))
+
+    def world(self, i):
+        # the starting state of world i as a World, e.g. to replay it with wumpus_vm
+        room = lambda flat: (int(flat) % self.width, int(flat) // self.width)
+        rooms = [('place_pit',) + room(flat) for flat in np.flatnonzero(self.pits[i])]
+        return World((self.width, self.height), room(self.start[i]), room(self.wumpus[i]), room(self.gold[i]), rooms)
+
+    def move(self, direction, mask):
+        self.actions += mask
+        self.facing[mask] = direction
+        self.room = np.where(mask, self.moves[direction][self.room], self.room)
+        deadly = self.pits[self.index, self.room] | ((self.room == self.wumpus) & self.wumpus_alive)
+        self.alive &= ~(mask & deadly)
+
+    def shoot(self, direction, mask):
+        self.actions += mask
+        self.facing[mask] = direction
+        firing = mask & (self.arrows > 0)
+        self.arrows -= firing
+        dx, dy = DELTAS[direction]
+        y, x = np.divmod(self.room, self.width)
+        wy, wx = np.divmod(self.wumpus, self.width)
+        # the Wumpus is hit if it is on the ray from the agent's room to the wall
+        if dx:
+            hit = (wy == y) & ((wx - x) * dx > 0)
+        else:
+            hit = (wx == x) & ((wy - y) * dy > 0)
+        self.wumpus_alive &= ~(firing & hit)
+
+    def grab(self, mask):
+        self.actions += mask
+        self.has_gold |= mask & (self.room == self.gold)
+
+    def sense(self, percept):
+        if percept == 0:
+            return self.stench[self.index, self.room]
+        if percept == 1:
+            return self.breeze[self.index, self.room]
+        return (self.room == self.gold) & ~self.has_gold
+
+    def score(self):
+        score = -ACTION_COST * self.actions - ARROW_COST * (1 - self.arrows.astype(np.int64))
+        score -= DEATH_PENALTY * ~self.alive
+        score += GOLD_REWARD * (self.alive & self.has_gold)
+        return score
+
+class BatchArray:
+    '''
+    A program array over the batch: keys is the sorted vector of the indexes written so far in any world,
+    columns the column of values, a (worlds, capacity) table, each of them is stored in. Reads and writes are
+    a few vector operations however many different indexes the worlds use, and the table doubles when it is
+    full, so adding indexes one by one does not copy it every time. An index never written reads as 0, like
+    in wumpus_vm
+    '''
+    def __init__(self, count):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.columns = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros((count, 8), dtype=np.int64)
+
+    def find(self, index):
+        # (columns, found): the column of every index, valid where found is set
+        keys = self.keys
+        if not len(keys):
+            return np.zeros(len(index), dtype=np.int64), np.zeros(len(index), dtype=bool)
+        position = np.minimum(np.searchsorted(keys, index), len(keys) - 1)
+        return self.columns[position], keys[position] == index
+
+    def read(self, index):
+        # the value at index[i] of world i, for every world
+        result = np.zeros(len(index), dtype=np.int64)
+        columns, found = self.find(index)
+        rows = np.flatnonzero(found)
+        result[rows] = self.values[rows, columns[rows]]
+        return result
+
+    def write(self, index, value, mask):
+        # value[i] to index[i] in the worlds of mask
+        rows = np.flatnonzero(mask)
+        index = index[rows]
+        columns, found = self.find(index)
+        if not found.all():
+            new = np.unique(index[~found])
+            used = len(self.keys)
+            if used + len(new) > self.values.shape[1]:
+                values = np.zeros((len(self.values), max(2 * self.values.shape[1], used + len(new))), dtype=np.int64)
+                values[:, :used] = self.values[:, :used]
+                self.values = values
+            keys = np.concatenate((self.keys, new))
+            order = np.argsort(keys, kind='stable')
+            self.keys = keys[order]
+            self.columns = np.concatenate((self.columns, np.arange(used, used + len(new))))[order]
+            columns, _ = self.find(index)
+        self.values[rows, columns] = value[rows]
+
+class Frame:
+    # the variables of one call, each a vector over the batch, and which worlds have returned from it
+    # owned holds the variables whose vector belongs to the frame and is updated in place; the others
+    # (parameters, variables not assigned yet) may be shared with the caller
+    def __init__(self, count, variables):
+        self.variables = variables
+        self.owned = set()
+        self.arrays = {}
+        self.returned = np.zeros(count, dtype=bool)
+        self.result = np.zeros(count, dtype=np.int64)
+
+class BatchResult:
+    '''Per-world results as arrays: outcome (index into OUTCOMES), score, executed statements and actions'''
+    def __init__(self, outcome, score, steps, actions):
+        self.outcome = outcome
+        self.score = score
+        self.steps = steps
+        self.actions = actions
+
+    def outcomes(self):
+        return [OUTCOMES[code] for code in self.outcome]
+
+class BatchRunner:
+    '''
+    Runs a wumpus_ast.Program over a WorldBatch
+    running is the vector of worlds that can still execute: alive, within max_steps, no error, play not returned
+    '''
+    def __init__(self, program, max_steps=MAX_STEPS):
+        if not isinstance(program, wumpus_ast.Program):
+            program = wumpus_ast.lower(program)
+        self.program = program
+        self.max_steps = max_steps
+        self.constants = {declaration.name: declaration.value for declaration in program.constants}
+        self.functions = {declaration.name: declaration for declaration in program.functions}
+
+    def run(self, worlds):
+        self.worlds = worlds
+        n = worlds.count
+        self.steps = np.zeros(n, dtype=np.int64)
+        self.errors = np.zeros(n, dtype=bool)
+        self.exhausted = np.zeros(n, dtype=bool)
+        self.running = np.ones(n, dtype=bool)
+        # statements run in lock step so far, no world has executed more
+        self.dispatched = 0
+        self.main = Frame(n, {})
+        self.block(self.program.body, self.main, self.running.copy())
+        outcome = np.where(worlds.has_gold, OUTCOMES.index(GOLD), OUTCOMES.index(ALIVE))
+        outcome[self.exhausted] = OUTCOMES.index(OUT_OF_STEPS)
+        outcome[self.errors] = OUTCOMES.index(ERROR)
+        outcome[~worlds.alive] = OUTCOMES.index(DEAD)
+        return BatchResult(outcome.astype(np.int8), worlds.score(), self.steps, worlds.actions)
+
+    def block(self, statements, frame, mask):
+        for statement in statements:
+            mask = mask & self.running & ~frame.returned
+            if not mask.any():
+                return
+            self.steps += mask
+            self.dispatched += 1
+            if self.dispatched > self.max_steps:
+                over = mask & (self.steps > self.max_steps)
+                if over.any():
+                    self.exhausted |= over
+                    self.running &= ~over
+                    mask = mask & ~over
+            self.statement(statement, frame, mask)
+
+    def statement(self, node, frame, mask):
+        kind = node.__class__
+        worlds = self.worlds
+        if kind is wumpus_ast.Assign:
+            self.assign(node, frame, mask)
+        elif kind is wumpus_ast.Move:
+            worlds.move(DIRECTIONS.index(node.direction), mask)
+            self.running &= worlds.alive
+        elif kind is wumpus_ast.Shoot:
+            worlds.shoot(DIRECTIONS.index(node.direction), mask)
+        elif kind is wumpus_ast.Grab:
+            worlds.grab(mask)
+        elif kind is wumpus_ast.PrintPosition:
+            # positions are not collected in a batch
+            pass
+        elif kind is wumpus_ast.If:
+            condition = self.truth(node.condition, frame, mask)
+            self.block(node.body, frame, mask & condition)
+            if node.orelse:
+                self.block(node.orelse, frame, mask & ~condition)
+        elif kind is wumpus_ast.While:
+            while True:
+                mask = mask & self.running & ~frame.returned
+                if not mask.any():
+                    break
+                mask = mask & self.truth(node.condition, frame, mask)
+                if not mask.any():
+                    break
+                self.block(node.body, frame, mask)
+        elif kind is wumpus_ast.Return:
+            value = self.expression(node.value, frame, mask)
+            frame.result = np.where(mask, value, frame.result)
+            frame.returned |= mask
+            if frame is self.main:
+                # return in the play block ends the game
+                self.running &= ~mask
+
+    def assign(self, node, frame, mask):
+        target = node.target
+        value = self.value(node.value, frame, mask)
+        if target.index is None:
+            variables = frame.variables
+            if target.name not in frame.owned:
+                variables[target.name] = np.array(np.broadcast_to(variables.get(target.name, 0), mask.shape), dtype=np.int64)
+                frame.owned.add(target.name)
+            np.copyto(variables[target.name], value, where=mask)
+            return
+        index = np.broadcast_to(self.expression(target.index, frame, mask), mask.shape).astype(np.int64)
+        array = frame.arrays.get(target.name)
+        if array is None:
+            array = frame.arrays[target.name] = BatchArray(len(mask))
+        array.write(index, np.broadcast_to(value, mask.shape), mask)
+
+    def value(self, node, frame, mask):
+        if node.__class__ is not wumpus_ast.Call:
+            return self.expression(node, frame, mask)
+        function = self.functions.get(node.name)
+        if function is None or len(function.params) != len(node.args):
+            raise WorldError(f'Cannot call {node.name} with {len(node.args)} arguments')
+        n = self.worlds.count
+        args = [np.broadcast_to(self.expression(arg, frame, mask), (n,)) for arg in node.args]
+        callee = Frame(n, {name: arg for (_, name), arg in zip(function.params, args)})
+        self.block(function.body, callee, mask)
+        return callee.result
+
+    def truth(self, node, frame, mask):
+        return np.broadcast_to(np.asarray(self.expression(node, frame, mask)).astype(bool), mask.shape)
+
+    def expression(self, node, frame, mask):
+        # evaluated for every world, the mask only matters for side effects (division by zero, calls)
+        kind = node.__class__
+        if kind is Var:
+            if node.index is not None:
+                index = np.broadcast_to(self.expression(node.index, frame, mask), mask.shape).astype(np.int64)
+                array = frame.arrays.get(node.name)
+                if array is None:
+                    return np.zeros(mask.shape, dtype=np.int64)
+                return array.read(index)
+            # constants win over variables, like in wumpus_vm
+            if node.name in self.constants:
+                return self.constants[node.name]
+            return frame.variables.get(node.name, 0)
+        if kind is wumpus_ast.Literal:
+            return node.value
+        if kind is wumpus_ast.BinOp:
+            op = node.op
+            left = self.expression(node.left, frame, mask)
+            if op == 'and':
+                left = np.asarray(left).astype(bool)
+                return left & np.asarray(self.expression(node.right, frame, mask & left)).astype(bool)
+            if op == 'or':
+                left = np.asarray(left).astype(bool)
+                return left | np.asarray(self.expression(node.right, frame, mask & ~left)).astype(bool)
+            right = self.expression(node.right, frame, mask)
+            if op in COMPARISONS:
+                return COMPARISONS[op](left, right)
+            # arithmetic on booleans counts them as 0 and 1, like the VM
+            left = np.asarray(left).astype(np.int64)
+            right = np.asarray(right).astype(np.int64)
+            if op == '/':
+                zero = mask & (right == 0)
+                if zero.any():
+                    self.errors |= zero
+                    self.running &= ~zero
+                return np.floor_divide(left, np.where(right == 0, 1, right))
+            return ARITHMETIC[op](left, right)
+        if kind is wumpus_ast.Negate:
+            return np.negative(np.asarray(self.expression(node.operand, frame, mask)).astype(np.int64))
+        if kind is wumpus_ast.Sense:
+            return self.worlds.sense(PERCEPTS.index(node.percept))
+        raise WorldError(f'Cannot evaluate {kind.__name__}')
+
+ARITHMETIC = {'+': np.add, '-': np.subtract, '*': np.multiply}
+COMPARISONS = {
+    '==': np.equal, '!=': np.not_equal, '<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+}
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('-f', '--file', help='Wumpus source file to run', type=str, required=True)
+    parse.add_argument('-n', '--worlds', help='Number of random worlds', type=int, default=10000)
+    parse.add_argument('-p', '--pits', help='Probability of a pit in a room', type=float, default=0.2)
+    parse.add_argument('-s', '--seed', help='Seed of the random worlds', type=int)
+    parse.add_argument('--max-steps', help='Statements executed per world before it is stopped', type=int, default=MAX_STEPS)
+    args = parse.parse_args()
+
+    import time
+    import table_parser
+    from lexer import tokenize, LineIndex
+    from wumpus_parser import LexerTokenStream
+    with open(args.file, 'r') as file:
+        source = file.read()
+    program = wumpus_ast.lower(table_parser.program(LexerTokenStream(tokenize(source, engine='scanner'), LineIndex(source))))
+    try:
+        worlds = WorldBatch.random(program.world, args.worlds, args.pits, args.seed)
+    except WorldError as e:
+        print(e)
+        sys.exit(1)
+    start = time.perf_counter()
+    try:
+        result = BatchRunner(program, args.max_steps).run(worlds)
+    except RecursionError:
+        print('The program recurses too deep to run batched, run it with wumpus_vm instead')
+        sys.exit(1)
+    seconds = time.perf_counter() - start
+    counts = np.bincount(result.outcome, minlength=len(OUTCOMES))
+    print(', '.join(f'{name} {count}' for name, count in zip(OUTCOMES, counts.tolist())))
+    print(f'mean score {result.score.mean():.2f}, mean actions {result.actions.mean():.2f}')
+    print(f'{args.worlds} worlds in {seconds:.3f} s')
+
+if __name__ == '__main__':
+    main()
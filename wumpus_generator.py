@@ -0,0 +1,247 @@
+# Generator of synthetic, valid Wumpus programs of a given size and shape, for benchmarks
+# Programs follow grammar.txt (expressions nest to the right, exprfac has at most one * or /, call
+# arguments are IDs) and are also well typed for wumpus_semantic: variables hold ints, conditions are
+# comparisons, senses and bool constants. Every while loop counts a variable of its own up to a bound,
+# functions only call the functions declared before them, and divisions are by a non-zero literal.
+# The same seed and shape always give the same program.
+
+import sys
+import random
+import argparse
+
+DIRECTIONS = ('north', 'south', 'east', 'west')
+SENSES = ('sense_stench()', 'sense_breeze()', 'sense_glitter()')
+COMPARISONS = ('==', '!=', '<', '<=', '>', '>=')
+
+class Shape:
+    '''
+    The knobs of a generated program
+    functions: number of function declarations, depth: deepest nesting of if/while blocks,
+    terms: largest number of + / - terms in an expression, pits: place_pit/clear_room statements in init,
+    comments: share of statements preceded by a comment line
+    '''
+    def __init__(self, functions=20, depth=4, terms=6, pits=50, grid=32, comments=0.05):
+        self.functions = functions
+        self.depth = depth
+        self.terms = terms
+        self.pits = pits
+        self.grid = grid
+        self.comments = comments
+
+class Generator:
+    def __init__(self, shape, seed=0):
+        self.shape = shape
+        self.random = random.Random(seed)
+        self.lines = []
+        self.indent = 0
+        self.loops = 0
+        # the functions declared so far, name -> arity
+        self.functions = []
+        self.constants = []
+        self.flags = []
+
+    def emit(self, text):
+        self.lines.append('  ' * self.indent + text)
+
+    def program(self, target_lines):
+        # declarations take about a third of the lines when there are functions, the play block the rest
+        shape = self.shape
+        for i in range(4):
+            name = f'c{i}'
+            self.emit(f'const int {name} = {self.random.randint(1, 100)}')
+            self.constants.append(name)
+        for i in range(2):
+            name = f'flag{i}'
+            self.emit(f'const bool {name} = {self.random.choice(("true", "false"))}')
+            self.flags.append(name)
+        init_lines = shape.pits + 6
+        budget = max(0, target_lines - len(self.lines) - init_lines - 2)
+        per_function = budget // 3 // shape.functions if shape.functions else 0
+        for i in range(shape.functions):
+            self.function(f'f{i}', per_function)
+        self.init_block()
+        self.emit('play {')
+        self.indent += 1
+        scope = Scope([])
+        self.body(scope, target_lines - 1, shape.depth)
+        self.indent -= 1
+        self.emit('}')
+        return '\n'.join(self.lines) + '\n'
+
+    def function(self, name, lines):
+        arity = self.random.randint(0, 3)
+        params = [f'p{i}' for i in range(arity)]
+        self.emit(f'function int {name}({", ".join(f"int {param}" for param in params)}) {{')
+        self.indent += 1
+        scope = Scope(params)
+        self.body(scope, len(self.lines) + max(lines - 2, 1), self.shape.depth)
+        self.emit(f'return {self.expression(scope, self.shape.terms)}')
+        self.indent -= 1
+        self.emit('}')
+        self.functions.append((name, arity))
+
+    def init_block(self):
+        grid = self.shape.grid
+        agent = (0, 0)
+        wumpus = (grid - 1, grid - 1)
+        self.emit('init {')
+        self.indent += 1
+        self.emit(f'grid_size({grid}, {grid})')
+        self.emit(f'place_agent({agent[0]}, {agent[1]})')
+        self.emit(f'place_wumpus({wumpus[0]}, {wumpus[1]})')
+        self.emit(f'place_gold({self.random.randrange(grid)}, {self.random.randrange(grid)})')
+        for _ in range(self.shape.pits):
+            room = agent
+            while room in (agent, wumpus):
+                room = (self.random.randrange(grid), self.random.randrange(grid))
+            statement = 'place_pit' if self.random.random() < 0.8 else 'clear_room'
+            self.emit(f'{statement}({room[0]}, {room[1]})')
+        self.indent -= 1
+        self.emit('}')
+
+    def body(self, scope, until, depth):
+        # statements up to line until, at least one
+        self.statement(scope, depth)
+        while len(self.lines) < until:
+            self.statement(scope, depth)
+
+    def block(self, scope, depth, size):
+        self.indent += 1
+        self.body(scope, len(self.lines) + size, depth - 1)
+        self.indent -= 1
+
+    def statement(self, scope, depth):
+        choice = self.random.random()
+        if self.random.random() < self.shape.comments:
+            self.emit(f'$ line {len(self.lines) + 1} $')
+        if depth > 0 and choice < 0.12:
+            self.emit(f'if ({self.condition(scope)}) {{')
+            self.block(scope, depth, self.random.randint(1, 6))
+            if self.random.random() < 0.4:
+                self.emit('} else {')
+                self.block(scope, depth, self.random.randint(1, 4))
+            self.emit('}')
+        elif depth > 0 and choice < 0.2:
+            counter = f'i{self.loops}'
+            self.loops += 1
+            self.emit(f'{counter} = 0')
+            self.emit(f'while ({counter} < {self.random.randint(1, 20)} and {self.condition(scope)}) {{')
+            self.block(scope, depth, self.random.randint(1, 6))
+            self.indent += 1
+            self.emit(f'{counter} = {counter} + 1')
+            self.indent -= 1
+            self.emit('}')
+        elif choice < 0.3 and self.functions:
+            name, arity = self.random.choice(self.functions)
+            args = [self.variable(scope) for _ in range(arity)]
+            self.emit(f'{scope.assign(self.random)} = {name}({", ".join(args)})')
+        elif choice < 0.4:
+            self.emit(f'a[{self.expression(scope, 2)}] = {self.expression(scope, self.shape.terms)}')
+        elif choice < 0.5:
+            action = self.random.randrange(4)
+            if action == 0:
+                self.emit(f'move({self.random.choice(DIRECTIONS)})')
+            elif action == 1:
+                self.emit(f'shoot({self.random.choice(DIRECTIONS)})')
+            elif action == 2:
+                self.emit('grab()')
+            else:
+                self.emit('print_position()')
+        else:
+            value = self.expression(scope, self.shape.terms)
+            self.emit(f'{scope.assign(self.random)} = {value}')
+
+    def variable(self, scope):
+        # a name that is defined, for call arguments
+        return scope.read(self.random) or self.random.choice(self.constants)
+
+    def expression(self, scope, terms, nesting=0):
+        # <exprfac> { (+|-) <exprfac> }, written as the right-nested <expr> of the grammar
+        parts = [self.factor(scope, nesting)]
+        for _ in range(self.random.randint(0, max(terms - 1, 0))):
+            parts.append(self.random.choice(('+', '-')))
+            parts.append(self.factor(scope, nesting))
+        return ' '.join(parts)
+
+    def factor(self, scope, nesting):
+        # <exprbase> [ (*|/) <exprbase> ]
+        base = self.base(scope, nesting)
+        choice = self.random.random()
+        if choice < 0.15:
+            return f'{base} * {self.base(scope, nesting)}'
+        if choice < 0.25:
+            return f'{base} / {self.random.randint(1, 9)}'
+        return base
+
+    def base(self, scope, nesting):
+        choice = self.random.random()
+        if choice < 0.1 and nesting < 2:
+            return f'({self.expression(scope, 3, nesting + 1)})'
+        if choice < 0.15:
+            return f'-{self.base(scope, nesting + 1)}'
+        if choice < 0.2:
+            return f'a[{self.random.randint(0, 9)}]'
+        if choice < 0.55:
+            name = scope.read(self.random)
+            if name is not None:
+                return name
+        if choice < 0.65:
+            return self.random.choice(self.constants)
+        return str(self.random.randint(0, 99))
+
+    def condition(self, scope):
+        # <term> { LOGIC <term> }, each term a comparison, a sense or a flag compared with a boolean
+        terms = []
+        for _ in range(self.random.randint(1, 3)):
+            choice = self.random.random()
+            if choice < 0.2:
+                terms.append(self.random.choice(SENSES))
+            elif choice < 0.3:
+                terms.append(f'{self.random.choice(self.flags)} == {self.random.choice(("true", "false"))}')
+            else:
+                terms.append(f'{self.expression(scope, 2)} {self.random.choice(COMPARISONS)} {self.expression(scope, 2)}')
+        return f' {self.random.choice(("and", "or"))} '.join(terms)
+
+class Scope:
+    '''The int variables of a function or of the play block'''
+    def __init__(self, params):
+        self.names = list(params)
+
+    def read(self, rng):
+        return rng.choice(self.names) if self.names else None
+
+    def assign(self, rng):
+        # an existing variable or, now and then, a new one
+        if self.names and rng.random() < 0.8:
+            return rng.choice(self.names)
+        name = f'v{len(self.names)}'
+        self.names.append(name)
+        return name
+
+def generate(lines, shape=None, seed=0):
+    # the source of a program of about lines lines
+    return Generator(shape or Shape(), seed).program(lines)
+
+def main():
+    parse = argparse.ArgumentParser(description='Write a synthetic Wumpus program of a given size and shape')
+    parse.add_argument('-n', '--lines', help='Approximate number of lines', type=int, default=1000)
+    parse.add_argument('-o', '--output', help='Output file (stdout by default)', type=str)
+    parse.add_argument('-s', '--seed', type=int, default=0)
+    parse.add_argument('--functions', help='Function declarations', type=int, default=20)
+    parse.add_argument('--depth', help='Deepest if/while nesting', type=int, default=4)
+    parse.add_argument('--terms', help='Most + / - terms in an expression', type=int, default=6)
+    parse.add_argument('--pits', help='place_pit / clear_room statements in the init block', type=int, default=50)
+    parse.add_argument('--grid', help='Width and height of the grid', type=int, default=32)
+    parse.add_argument('--comments', help='Share of statements preceded by a comment', type=float, default=0.05)
+    args = parse.parse_args()
+
+    shape = Shape(args.functions, args.depth, args.terms, args.pits, args.grid, args.comments)
+    source = generate(args.lines, shape, args.seed)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as file:
+            file.write(source)
+    else:
+        sys.stdout.write(source)
+
+if __name__ == '__main__':
+    main()
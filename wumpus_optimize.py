@@ -0,0 +1,154 @@
+# Constant folding and simplification of the AST built by wumpus_ast.lower
+# Declared constants are propagated into the expressions that read them, operators whose operands
+# are literals are evaluated the way the VM would evaluate them, and/or with a literal left operand
+# are short-circuited, and if/while statements with a literal condition lose the code that can never run.
+# fold builds a new tree and leaves its argument untouched; the result prints like any other AST.
+
+import sys
+import argparse
+import operator
+
+import wumpus_ast
+from wumpus_ast import Program, FunctionDecl, If, While, Assign, Return, Call, BinOp, Negate, Var, Literal
+
+# the VM's semantics: floor division, booleans count as 0 and 1 in arithmetic
+OPERATORS = {
+    '+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.floordiv,
+    '==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+}
+
+class Folder:
+    '''
+    Folds the functions and the play block of a program
+    constants maps a declared constant's name to its value; like in wumpus_vm, a constant wins over
+    a variable or parameter of the same name
+    '''
+    def __init__(self, constants):
+        self.constants = {}
+        for declaration in constants:
+            self.constants.setdefault(declaration.name, declaration.value)
+
+    def block(self, statements):
+        result = []
+        for statement in statements:
+            folded = statement_folders.get(statement.__class__)
+            if folded is None:
+                # moves, shots, grabs and prints have nothing to fold
+                result.append(statement)
+            else:
+                result.extend(folded(self, statement))
+        return result
+
+    def fold_if(self, node):
+        condition = self.expression(node.condition)
+        if condition.__class__ is Literal:
+            return self.block(node.body if condition.value else node.orelse)
+        return [If(condition, self.block(node.body), self.block(node.orelse), node.line)]
+
+    def fold_while(self, node):
+        condition = self.expression(node.condition)
+        if condition.__class__ is Literal and not condition.value:
+            return []
+        return [While(condition, self.block(node.body), node.line)]
+
+    def fold_assign(self, node):
+        target = node.target
+        if target.index is not None:
+            target = Var(target.name, self.expression(target.index), target.line, target.symbol)
+        value = node.value
+        if value.__class__ is Call:
+            value = Call(value.name, [self.expression(arg) for arg in value.args], value.line, value.symbol)
+        else:
+            value = self.expression(value)
+        return [Assign(target, value, node.line)]
+
+    def fold_return(self, node):
+        return [Return(self.expression(node.value), node.line)]
+
+    def expression(self, node):
+        kind = node.__class__
+        if kind is Var:
+            if node.index is not None:
+                return Var(node.name, self.expression(node.index), node.line, node.symbol)
+            if node.name in self.constants:
+                return Literal(self.constants[node.name], node.line)
+            return node
+        if kind is BinOp:
+            return self.binary(node)
+        if kind is Negate:
+            operand = self.expression(node.operand)
+            if operand.__class__ is Literal:
+                return Literal(-operand.value, node.line)
+            if operand.__class__ is Negate:
+                return operand.operand
+            return Negate(operand, node.line)
+        # literals and senses
+        return node
+
+    def binary(self, node):
+        op = node.op
+        left = self.expression(node.left)
+        if op in ('and', 'or'):
+            # the VM leaves the deciding operand as the result, without evaluating the right one
+            if left.__class__ is Literal:
+                if bool(left.value) == (op == 'or'):
+                    return left
+                return self.expression(node.right)
+            return BinOp(op, left, self.expression(node.right), node.line)
+        right = self.expression(node.right)
+        if left.__class__ is Literal and right.__class__ is Literal:
+            # a division by zero is left for the VM to report when (and if) it runs
+            if not (op == '/' and not right.value):
+                return Literal(OPERATORS[op](left.value, right.value), node.line)
+        elif right.__class__ is Literal:
+            # x + 0, x - 0, x * 1 and x / 1
+            if (op in ('+', '-') and right.value == 0) or (op in ('*', '/') and right.value == 1):
+                return left
+        elif left.__class__ is Literal:
+            # 0 + x and 1 * x
+            if (op == '+' and left.value == 0) or (op == '*' and left.value == 1):
+                return right
+        return BinOp(op, left, right, node.line)
+
+statement_folders = {
+    If: Folder.fold_if,
+    While: Folder.fold_while,
+    Assign: Folder.fold_assign,
+    Return: Folder.fold_return,
+}
+
+def fold(program):
+    # a folded copy of a wumpus_ast.Program, or of the program() CST after lowering it
+    if not isinstance(program, Program):
+        program = wumpus_ast.lower(program)
+    folder = Folder(program.constants)
+    functions = [
+        FunctionDecl(function.return_type, function.name, function.params, folder.block(function.body), function.line, function.scope)
+        for function in program.functions
+    ]
+    return Program(program.constants, functions, program.world, folder.block(program.body), program.line, program.scope)
+
+def count_nodes(program):
+    return sum(1 for _ in wumpus_ast.walk(program))
+
+def main():
+    parse = argparse.ArgumentParser(description='Print the AST of a Wumpus program after constant folding')
+    parse.add_argument('-f', '--file', help='Wumpus source file', type=str, required=True)
+    parse.add_argument('-o', '--output', help='Output file for the folded tree', type=str)
+    args = parse.parse_args()
+
+    import table_parser
+    from lexer import tokenize
+    from wumpus_parser import LexerTokenStream
+    with open(args.file, 'r') as file:
+        program = wumpus_ast.lower(table_parser.program(LexerTokenStream(tokenize(file.read(), engine='scanner'))))
+    folded = fold(program)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as output_file:
+            output_file.write(str(folded))
+    else:
+        sys.stdout.write(str(folded))
+    print(f'{count_nodes(program)} nodes before folding, {count_nodes(folded)} after')
+
+if __name__ == '__main__':
+    main()
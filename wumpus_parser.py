@@ -1,52 +1,192 @@
 # LL(1) parser that used the lexer's output to parse the input according to grammar.txt's rules
 
 import sys
-from colorama import Fore, Style, init
 import argparse
 from collections import deque
 import traceback
+import mmap
+import io
+import gzip
+from lexer import tokenize, ENGINES, Kind, LineIndex, TOKEN_KIND, TOKEN_FILE_MAGIC, TOKEN_FILE_VERSION, TOKEN_FILE_HEADER, TOKEN_FILE_RECORD
 
 def print_fancy(text, width=80, fill_char='-'):
     print(text.center(width, fill_char))
 
+# kind of the token types the parser does not know about
+UNKNOWN_KIND = -1
+
 class Token:
-    def __init__(self, token):
+    def __init__(self, token, kind=None, column=None):
         self.token_type = token[0]
         self.token_value = token[1]
         self.token_line = token[2]
-        self.token_column = token[3]
+        # absolute offset of the token in the source, ply's lexpos
+        self.token_offset = token[3]
+        # 1-based column on token_line, None when the token stream does not know it (a LexerTokenStream
+        # without the LineIndex of the source, a token file written before columns were stored)
+        self.token_column = column
+        # integer id of token_type (see lexer.TOKEN_KINDS), which is what the parser dispatches on
+        self.kind = TOKEN_KIND.get(self.token_type, UNKNOWN_KIND) if kind is None else kind
+
+    def span(self):
+        # (start, end) offsets of the token's text, None when its position is unknown
+        if self.token_offset.__class__ is not int:
+            return None
+        return self.token_offset, self.token_offset + (0 if self.kind == Kind.EOF else len(self.token_value))
 
     def __str__(self):
         return f'token type: {self.token_type} with token value: {self.token_value}'
     
     def __eq__(self, expected_token_type):
-        if type(expected_token_type) == str:
+        if expected_token_type.__class__ is str:
             return self.token_type == expected_token_type
         raise TypeError('Expected token type must be a string')
     
-class TokenStream:
+class LazyTokenStream:
+    '''
+    Base for the token streams that only decode a token when the parser reaches it
+    Subclasses provide next_token(), which returns the EOF token once the input is exhausted
+    '''
+    # syntax errors collected by parse_recovering, None when they are raised
+    diagnostics = None
+
+    def __init__(self):
+        self.lookahead = deque([self.next_token()])
+
+    def pop(self):
+        token = self.lookahead.popleft()
+        if not self.lookahead:
+            self.lookahead.append(self.next_token())
+        return token
+
+    def peek(self, offset=0):
+        while len(self.lookahead) <= offset:
+            self.lookahead.append(self.next_token())
+        return self.lookahead[offset]
+
+def end_token(last):
+    # the EOF token of a token file, placed right after its last token when that token's column is known
+    # (a file has no source to take the end of); comments after it are not counted
+    if last is None or last.token_column is None:
+        return Token(['EOF', 'EOF', 'EOF', 'EOF'])
+    width = len(last.token_value)
+    return Token(['EOF', 'EOF', last.token_line, last.token_offset + width], None, last.token_column + width)
+
+class TokenStream(LazyTokenStream):
+    '''
+    Token stream over the lexer's text token file, one "type value line position column" record per line
+    source is a path, an open text file or pipe, or any iterable of lines such as a generator.
+    Lines are read through the file's buffer and decoded one at a time as the parser pops tokens,
+    so memory use does not grow with the input. A file opened from a path is closed once its last
+    token is read, or by close().
+    Files written before the lexer stored columns are read too, their tokens then have no column.
+    '''
     def __init__(self, source):
         self.source = source
-        # open the file
-        file_stream = open(self.source, 'r')
-        token_stream = deque([])
-        # read every line in the file, create a token for that line and put it in the queue
-        for line in file_stream:
-            curr = line.strip().split()
-            if curr[0] == 'COMMENT':
+        # the last token read, which the EOF token is placed after
+        self.last = None
+        if isinstance(source, str):
+            self.file_stream = open(source, 'r')
+        else:
+            # the caller owns files and pipes passed in, and closes them
+            self.file_stream = None
+        self.lines = iter(self.file_stream if self.file_stream is not None else source)
+        super().__init__()
+
+    def next_token(self):
+        for line in self.lines:
+            curr = line.split()
+            # blank lines carry no token
+            if not curr or curr[0] == 'COMMENT':
                 continue
-            token_stream.append(Token(curr))
-        # add an EOF token to the end of the queue
-        token_stream.append(Token(['EOF', 'EOF', 'EOF', 'EOF']))
-        
-        self.token_stream = token_stream
-        
-    def pop(self):
-        # return the first token in the queue
-        return self.token_stream.popleft()
-    
-    def peek(self):
-        return self.token_stream[0]
+            self.last = Token((curr[0], curr[1], int(curr[2]), int(curr[3])), None, int(curr[4]) if len(curr) > 4 else None)
+            return self.last
+        self.close()
+        return end_token(self.last)
+
+    def close(self):
+        if self.file_stream is not None:
+            self.file_stream.close()
+            self.file_stream = None
+        self.lines = iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class BinaryTokenStream(LazyTokenStream):
+    '''
+    Token stream over a binary token file written by lexer.write_binary_tokens
+    The file is memory-mapped and a record is only decoded into a Token when the parser reaches it
+    '''
+    def __init__(self, source):
+        self.source = source
+        with open(self.source, 'rb') as file_stream:
+            self.data = mmap.mmap(file_stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.count, self.strings_offset, kinds_offset = TOKEN_FILE_HEADER.unpack_from(self.data, 0)
+        if magic != TOKEN_FILE_MAGIC or version != TOKEN_FILE_VERSION:
+            raise ValueError(f'{self.source} is not a version {TOKEN_FILE_VERSION} binary token file')
+        self.kinds = self.data[kinds_offset:].decode('utf8').split('\n')
+        # the file's kind ids -> the parser's, they only differ if the file was written by another version of the lexer
+        self.kind_map = [TOKEN_KIND.get(name, UNKNOWN_KIND) for name in self.kinds]
+        self.comment_kind = self.kinds.index('COMMENT') if 'COMMENT' in self.kinds else -1
+        # values are interned in the file, so decode each distinct one once
+        self.values = {}
+        self.index = 0
+        self.last = None
+        super().__init__()
+
+    def next_token(self):
+        record_size = TOKEN_FILE_RECORD.size
+        while self.index < self.count:
+            kind, line, column, position, offset, length = TOKEN_FILE_RECORD.unpack_from(self.data, TOKEN_FILE_HEADER.size + self.index * record_size)
+            self.index += 1
+            if kind == self.comment_kind:
+                continue
+            value = self.values.get(offset)
+            if value is None:
+                start = self.strings_offset + offset
+                value = self.values[offset] = self.data[start:start + length].decode('utf8')
+            self.last = Token((self.kinds[kind], value, line, position), self.kind_map[kind], column)
+            return self.last
+        return end_token(self.last)
+
+def open_token_stream(source):
+    # pick the reader matching the token file's format, - is a text token file piped to stdin
+    if source == '-':
+        return TokenStream(sys.stdin)
+    with open(source, 'rb') as file_stream:
+        magic = file_stream.read(len(TOKEN_FILE_MAGIC))
+    if magic == TOKEN_FILE_MAGIC:
+        return BinaryTokenStream(source)
+    return TokenStream(source)
+
+class LexerTokenStream(LazyTokenStream):
+    '''
+    Token stream fed straight from the lexer's LexTokens
+    Tokens are pulled from the generator one at a time, so there is no token file to write and re-read
+    With the LineIndex of the source, tokens get their columns and the EOF token the end of the source as position
+    '''
+    def __init__(self, lex_tokens, line_index=None):
+        self.lex_tokens = iter(lex_tokens)
+        self.line_index = line_index
+        super().__init__()
+
+    def next_token(self):
+        # skip comments like the token file reader does, and end with an EOF token
+        line_index = self.line_index
+        for tok in self.lex_tokens:
+            if tok.type == 'COMMENT':
+                continue
+            if line_index is None:
+                return Token((tok.type, tok.value, tok.lineno, tok.lexpos))
+            return Token((tok.type, tok.value, tok.lineno, tok.lexpos), None, tok.lexpos - line_index.starts[tok.lineno - 1] + 1)
+        if line_index is None:
+            return Token(['EOF', 'EOF', 'EOF', 'EOF'])
+        line, column = line_index.position(line_index.length)
+        return Token(['EOF', 'EOF', line, line_index.length], None, column)
 
 class TreeNode:
     '''
@@ -89,39 +229,115 @@ class TreeNode:
         └──sub
             └──page2.html
         '''
-        if not self.children:
-            return self.val
-        # if the node is not a leaf node, return the token and return the representation of the children
-        
-
-        result = self.val + '\n'
-        for i, child in enumerate(self.children):
-            if i == len(self.children) - 1:
-                result += '└───' + str(child).replace('\n', '\n    ') + '\n'
-            else:
-                result += '├───' + str(child).replace('\n', '\n│   ') + '\n'
-        return result
-    
+        buffer = io.StringIO()
+        render_tree(self, buffer)
+        return buffer.getvalue()
+
+def render_tree(root, output_file):
+    '''
+    Write the tree in the layout of TreeNode.__str__ straight to output_file
+    Runs in one pass with an explicit stack, so the cost is linear in the size of the output
+    and there is no recursion limit on the depth of the tree
+    '''
+    write = output_file.write
+    # a stack entry is either text to write or a (node, indentation) pair still to render
+    stack = [(root, '')]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is str:
+            write(item)
+            continue
+        node, indent = item
+        write(node.val)
+        children = node.children
+        if not children:
+            continue
+        # every line break inside a subtree is followed by the indentation of all its ancestors
+        newline = '\n' + indent
+        write(newline)
+        last = len(children) - 1
+        stack.append(newline)
+        stack.append((children[last], indent + '    '))
+        stack.append('└───')
+        for i in range(last - 1, -1, -1):
+            stack.append(newline)
+            stack.append((children[i], indent + '│   '))
+            stack.append('├───')
+
+def edge_token(node, last=False):
+    # the first (or last) token under a CST node that has a position, None if there is none
+    # one iterator per level, so a node with many children costs only the ones walked
+    stack = [iter((node,))]
+    while stack:
+        for node in stack[-1]:
+            if node.token is not None:
+                if node.token.span() is not None:
+                    return node.token
+            elif node.children:
+                stack.append(reversed(node.children) if last else iter(node.children))
+                break
+        else:
+            stack.pop()
+    return None
+
+def node_span(node):
+    # (start, end) offsets of the source text a CST node (TreeNode or cst_arena.NodeView) was parsed from,
+    # from its first and last tokens, None for a node without tokens
+    first = edge_token(node)
+    if first is None:
+        return None
+    return first.span()[0], edge_token(node, last=True).span()[1]
+
+def count_nodes(root):
+    # number of nodes of a CST, leaves included, without recursion
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if node.children:
+            stack.extend(node.children)
+    return count
+
+def describe_position(token):
+    # ' on line L, column C' for a token whose column is known, ' on line L' otherwise
+    if token.token_column is None:
+        return f' on line {token.token_line}'
+    return f' on line {token.token_line}, column {token.token_column}'
+
 class ExpectationError(Exception):
     def __init__(self, token, expected):
         self.token = token
         self.expected = expected
-        self.message = f'Expected {self.expected} but got {self.token.token_type} on line {self.token.token_line}'
+        self.message = f'Expected {self.expected} but got {self.token.token_type}{describe_position(token)}'
         super().__init__(self.message)
 
+    @property
+    def span(self):
+        # (start, end) offsets of the unexpected token
+        return self.token.span()
+
 class MissingTokenError(Exception):
-    def __init__(self, expected):
+    # token is the EOF token found instead, it has a position when the token stream knows the source
+    def __init__(self, expected, token=None):
         self.expected = expected
+        self.token = token
         self.message = f'Expected {self.expected} is Missing'
+        if token is not None and token.token_column is not None:
+            self.message += f' at the end of the input{describe_position(token)}'
         super().__init__(self.message)
 
+    @property
+    def span(self):
+        return None if self.token is None else self.token.span()
+
 '''Terminal functions'''
 
 
 def ID(token_stream):
     # if the current token is an ID
     token = token_stream.peek()
-    if token.token_type == 'ID':
+    if token.kind == Kind.ID:
         # create a node with the token as the value
         node = TreeNode('ID', token=token)
         # return the node
@@ -132,7 +348,7 @@ def ID(token_stream):
 def INTEGER(token_stream):
     # if the current token is an INTEGER
     token = token_stream.peek()
-    if token.token_type == 'INTEGER':
+    if token.kind == Kind.INTEGER:
         # create a node with the token as the value
         node = TreeNode('INTEGER', token=token)
         # return the node
@@ -143,7 +359,7 @@ def INTEGER(token_stream):
 def BOOLEAN(token_stream):
     # if the current token is a BOOLEAN
     token = token_stream.peek()
-    if token.token_type == 'BOOLEAN':
+    if token.kind == Kind.BOOLEAN:
         # create a node with the token as the value
         node = TreeNode('BOOLEAN', token=token)
         # return the node
@@ -154,7 +370,7 @@ def BOOLEAN(token_stream):
 def PLUS(token_stream):
     # if the current token is a PLUS
     token = token_stream.peek()
-    if token.token_type == 'PLUS':
+    if token.kind == Kind.PLUS:
         # create a node with the token as the value
         node = TreeNode('PLUS', token=token)
         # return the node
@@ -165,7 +381,7 @@ def PLUS(token_stream):
 def MINUS(token_stream):
     # if the current token is a MINUS
     token = token_stream.peek()
-    if token.token_type == 'MINUS':
+    if token.kind == Kind.MINUS:
         # create a node with the token as the value
         node = TreeNode('MINUS', token=token)
         # return the node
@@ -176,7 +392,7 @@ def MINUS(token_stream):
 def MULTIPLY(token_stream):
     # if the current token is a MULTIPLY
     token = token_stream.peek()
-    if token.token_type == 'MULTIPLY':
+    if token.kind == Kind.MULTIPLY:
         # create a node with the token as the value
         node = TreeNode('MULTIPLY', token=token)
         # return the node
@@ -187,7 +403,7 @@ def MULTIPLY(token_stream):
 def DIVIDE(token_stream):
     # if the current token is a DIVIDE
     token = token_stream.peek()
-    if token.token_type == 'DIVIDE':
+    if token.kind == Kind.DIVIDE:
         # create a node with the token as the value
         node = TreeNode('DIVIDE', token=token)
         # return the node
@@ -198,7 +414,7 @@ def DIVIDE(token_stream):
 def LEFTBRACKET(token_stream):
     # if the current token is a LEFTBRACKET
     token = token_stream.peek()
-    if token.token_type == 'LEFTBRACKET':
+    if token.kind == Kind.LEFTBRACKET:
         # create a node with the token as the value
         node = TreeNode('LEFTBRACKET', token=token)
         # return the node
@@ -209,7 +425,7 @@ def LEFTBRACKET(token_stream):
 def RIGHTBRACKET(token_stream):
     # if the current token is a RIGHTBRACKET
     token = token_stream.peek()
-    if token.token_type == 'RIGHTBRACKET':
+    if token.kind == Kind.RIGHTBRACKET:
         # create a node with the token as the value
         node = TreeNode('RIGHTBRACKET', token=token)
         # return the node
@@ -220,7 +436,7 @@ def RIGHTBRACKET(token_stream):
 def LPAREN(token_stream):
     # if the current token is a LPAREN
     token = token_stream.peek()
-    if token.token_type == 'LPAREN':
+    if token.kind == Kind.LPAREN:
         # create a node with the token as the value
         node = TreeNode('LPAREN', token=token)
         # return the node
@@ -231,7 +447,7 @@ def LPAREN(token_stream):
 def RPAREN(token_stream):
     # if the current token is a RPAREN
     token = token_stream.peek()
-    if token.token_type == 'RPAREN':
+    if token.kind == Kind.RPAREN:
         # create a node with the token as the value
         node = TreeNode('RPAREN', token=token)
         # return the node
@@ -242,7 +458,7 @@ def RPAREN(token_stream):
 def COMPARISON(token_stream):
     # if the current token is a COMPARISON
     token = token_stream.peek()
-    if token.token_type == 'COMPARISON':
+    if token.kind == Kind.COMPARISON:
         # create a node with the token as the value
         node = TreeNode('COMPARISON', token=token)
         # return the node
@@ -253,7 +469,7 @@ def COMPARISON(token_stream):
 def LBRACE(token_stream):
     # if the current token is a LBRACE
     token = token_stream.peek()
-    if token.token_type == 'LBRACE':
+    if token.kind == Kind.LBRACE:
         # create a node with the token as the value
         node = TreeNode('LBRACE', token=token)
         # return the node
@@ -264,7 +480,7 @@ def LBRACE(token_stream):
 def RBRACE(token_stream):
     # if the current token is a RBRACE
     token = token_stream.peek()
-    if token.token_type == 'RBRACE':
+    if token.kind == Kind.RBRACE:
         # create a node with the token as the value
         node = TreeNode('RBRACE', token=token)
         # return the node
@@ -275,7 +491,7 @@ def RBRACE(token_stream):
 def LOGIC(token_stream):
     # if the current token is a LOGIC
     token = token_stream.peek()
-    if token.token_type == 'LOGIC':
+    if token.kind == Kind.LOGIC:
         # create a node with the token as the value
         node = TreeNode('LOGIC', token=token)
         # return the node
@@ -286,7 +502,7 @@ def LOGIC(token_stream):
 def RETURN(token_stream):
     # if the current token is a RETURN
     token = token_stream.peek()
-    if token.token_type == 'RETURN':
+    if token.kind == Kind.RETURN:
         # create a node with the token as the value
         node = TreeNode('RETURN', token=token)
         # return the node
@@ -297,7 +513,7 @@ def RETURN(token_stream):
 def ASSIGNMENT(token_stream):
     # if the current token is a ASSIGNMENT
     token = token_stream.peek()
-    if token.token_type == 'ASSIGNMENT':
+    if token.kind == Kind.ASSIGNMENT:
         # create a node with the token as the value
         node = TreeNode('ASSIGNMENT', token=token)
         # return the node
@@ -308,7 +524,7 @@ def ASSIGNMENT(token_stream):
 def WHILE(token_stream):
     # if the current token is a WHILE
     token = token_stream.peek()
-    if token.token_type == 'WHILE':
+    if token.kind == Kind.WHILE:
         # create a node with the token as the value
         node = TreeNode('WHILE', token=token)
         # return the node
@@ -319,7 +535,7 @@ def WHILE(token_stream):
 def IF(token_stream):
     # if the current token is a IF
     token = token_stream.peek()
-    if token.token_type == 'IF':
+    if token.kind == Kind.IF:
         # create a node with the token as the value
         node = TreeNode('IF', token=token)
         # return the node
@@ -330,7 +546,7 @@ def IF(token_stream):
 def ELSE(token_stream):
     # if the current token is a ELSE
     token = token_stream.peek()
-    if token.token_type == 'ELSE':
+    if token.kind == Kind.ELSE:
         # create a node with the token as the value
         node = TreeNode('ELSE', token=token)
         # return the node
@@ -341,7 +557,7 @@ def ELSE(token_stream):
 def NORTH(token_stream):
     # if the current token is a NORTH
     token = token_stream.peek()
-    if token.token_type == 'NORTH':
+    if token.kind == Kind.NORTH:
         # create a node with the token as the value
         node = TreeNode('NORTH', token=token)
         # return the node
@@ -352,7 +568,7 @@ def NORTH(token_stream):
 def SOUTH(token_stream):
     # if the current token is a SOUTH
     token = token_stream.peek()
-    if token.token_type == 'SOUTH':
+    if token.kind == Kind.SOUTH:
         # create a node with the token as the value
         node = TreeNode('SOUTH', token=token)
         # return the node
@@ -363,7 +579,7 @@ def SOUTH(token_stream):
 def EAST(token_stream):
     # if the current token is a EAST
     token = token_stream.peek()
-    if token.token_type == 'EAST':
+    if token.kind == Kind.EAST:
         # create a node with the token as the value
         node = TreeNode('EAST', token=token)
         # return the node
@@ -374,7 +590,7 @@ def EAST(token_stream):
 def WEST(token_stream):
     # if the current token is a WEST
     token = token_stream.peek()
-    if token.token_type == 'WEST':
+    if token.kind == Kind.WEST:
         # create a node with the token as the value
         node = TreeNode('WEST', token=token)
         # return the node
@@ -385,7 +601,7 @@ def WEST(token_stream):
 def PRINT_POSITION(token_stream):
     # if the current token is a PRINT_POSITION
     token = token_stream.peek()
-    if token.token_type == 'PRINT_POSITION':
+    if token.kind == Kind.PRINT_POSITION:
         # create a node with the token as the value
         node = TreeNode('PRINT_POSITION', token=token)
         # return the node
@@ -396,7 +612,7 @@ def PRINT_POSITION(token_stream):
 def SENSE_GLITTER(token_stream):
     # if the current token is a SENSE_GLITTER
     token = token_stream.peek()
-    if token.token_type == 'SENSE_GLITTER':
+    if token.kind == Kind.SENSE_GLITTER:
         # create a node with the token as the value
         node = TreeNode('SENSE_GLITTER', token=token)
         # return the node
@@ -407,7 +623,7 @@ def SENSE_GLITTER(token_stream):
 def SENSE_BREEZE(token_stream):
     # if the current token is a SENSE_BREEZE
     token = token_stream.peek()
-    if token.token_type == 'SENSE_BREEZE':
+    if token.kind == Kind.SENSE_BREEZE:
         # create a node with the token as the value
         node = TreeNode('SENSE_BREEZE', token=token)
         # return the node
@@ -418,7 +634,7 @@ def SENSE_BREEZE(token_stream):
 def SENSE_STENCH(token_stream):
     # if the current token is a SENSE_STENCH
     token = token_stream.peek()
-    if token.token_type == 'SENSE_STENCH':
+    if token.kind == Kind.SENSE_STENCH:
         # create a node with the token as the value
         node = TreeNode('SENSE_STENCH', token=token)
         # return the node
@@ -429,7 +645,7 @@ def SENSE_STENCH(token_stream):
 def GRAB(token_stream):
     # if the current token is a GRAB
     token = token_stream.peek()
-    if token.token_type == 'GRAB':
+    if token.kind == Kind.GRAB:
         # create a node with the token as the value
         node = TreeNode('GRAB', token=token)
         # return the node
@@ -440,7 +656,7 @@ def GRAB(token_stream):
 def SHOOT(token_stream):
     # if the current token is a SHOOT
     token = token_stream.peek()
-    if token.token_type == 'SHOOT':
+    if token.kind == Kind.SHOOT:
         # create a node with the token as the value
         node = TreeNode('SHOOT', token=token)
         # return the node
@@ -452,7 +668,7 @@ def SHOOT(token_stream):
 def MOVE(token_stream):
     # if the current token is a MOVE
     token = token_stream.peek()
-    if token.token_type == 'MOVE':
+    if token.kind == Kind.MOVE:
         # create a node with the token as the value
         node = TreeNode('MOVE', token=token)
         # return the node
@@ -463,7 +679,7 @@ def MOVE(token_stream):
 def PLAY(token_stream):
     # if the current token is a PLAY
     token = token_stream.peek()
-    if token.token_type == 'PLAY':
+    if token.kind == Kind.PLAY:
         # create a node with the token as the value
         node = TreeNode('PLAY', token=token)
         # return the node
@@ -474,7 +690,7 @@ def PLAY(token_stream):
 def PLACE_GOLD(token_stream):
     # if the current token is a PLACE_GOLD
     token = token_stream.peek()
-    if token.token_type == 'PLACE_GOLD':
+    if token.kind == Kind.PLACE_GOLD:
         # create a node with the token as the value
         node = TreeNode('PLACE_GOLD', token=token)
         # return the node
@@ -485,7 +701,7 @@ def PLACE_GOLD(token_stream):
 def PLACE_WUMPUS(token_stream):
     # if the current token is a PLACE_WUMPUS
     token = token_stream.peek()
-    if token.token_type == 'PLACE_WUMPUS':
+    if token.kind == Kind.PLACE_WUMPUS:
         # create a node with the token as the value
         node = TreeNode('PLACE_WUMPUS', token=token)
         # return the node
@@ -496,7 +712,7 @@ def PLACE_WUMPUS(token_stream):
 def PLACE_PIT(token_stream):
     # if the current token is a PLACE_PIT
     token = token_stream.peek()
-    if token.token_type == 'PLACE_PIT':
+    if token.kind == Kind.PLACE_PIT:
         # create a node with the token as the value
         node = TreeNode('PLACE_PIT', token=token)
         # return the node
@@ -507,7 +723,7 @@ def PLACE_PIT(token_stream):
 def PLACE_AGENT(token_stream):
     # if the current token is a PLACE_AGENT
     token = token_stream.peek()
-    if token.token_type == 'PLACE_AGENT':
+    if token.kind == Kind.PLACE_AGENT:
         # create a node with the token as the value
         node = TreeNode('PLACE_AGENT', token=token)
         # return the node
@@ -518,7 +734,7 @@ def PLACE_AGENT(token_stream):
 def GRID_SIZE(token_stream):
     # if the current token is a GRID_SIZE
     token = token_stream.peek()
-    if token.token_type == 'GRID_SIZE':
+    if token.kind == Kind.GRID_SIZE:
         # create a node with the token as the value
         node = TreeNode('GRID_SIZE', token=token)
         # return the node
@@ -529,7 +745,7 @@ def GRID_SIZE(token_stream):
 def INIT(token_stream):
     # if the current token is a INIT
     token = token_stream.peek()
-    if token.token_type == 'INIT':
+    if token.kind == Kind.INIT:
         # create a node with the token as the value
         node = TreeNode('INIT', token=token)
         # return the node
@@ -540,7 +756,7 @@ def INIT(token_stream):
 def CONSTANT(token_stream):
     # if the current token is a CONSTANT
     token = token_stream.peek()
-    if token.token_type == 'CONSTANT':
+    if token.kind == Kind.CONSTANT:
         # create a node with the token as the value
         node = TreeNode('CONSTANT', token=token)
         # return the node
@@ -548,21 +764,10 @@ def CONSTANT(token_stream):
         return node
     return None
 
-def VARIABLE(token_stream):
-    # if the current token is a VARIABLE
-    token = token_stream.peek()
-    if token.token_type == 'VARIABLE':
-        # create a node with the token as the value
-        node = TreeNode('VARIABLE', token=token)
-        # return the node
-        token_stream.pop()
-        return node
-    return None
-
 def INTDTYPE(token_stream):
     # if the current token is a INTDTYPE
     token = token_stream.peek()
-    if token.token_type == 'INTDTYPE':
+    if token.kind == Kind.INTDTYPE:
         # create a node with the token as the value
         node = TreeNode('INTDTYPE', token=token)
         # return the node
@@ -573,7 +778,7 @@ def INTDTYPE(token_stream):
 def BOOLDTYPE(token_stream):
     # if the current token is a BOOLDTYPE
     token = token_stream.peek()
-    if token.token_type == 'BOOLDTYPE':
+    if token.kind == Kind.BOOLDTYPE:
         # create a node with the token as the value
         node = TreeNode('BOOLDTYPE', token=token)
         # return the node
@@ -584,7 +789,7 @@ def BOOLDTYPE(token_stream):
 def VOID(token_stream):
     # if the current token is a VOID
     token = token_stream.peek()
-    if token.token_type == 'VOID':
+    if token.kind == Kind.VOID:
         # create a node with the token as the value
         node = TreeNode('VOID', token=token)
         # return the node
@@ -595,7 +800,7 @@ def VOID(token_stream):
 def FUNCTION(token_stream):
     # if the current token is a FUNCTION
     token = token_stream.peek()
-    if token.token_type == 'FUNCTION':
+    if token.kind == Kind.FUNCTION:
         # create a node with the token as the value
         node = TreeNode('FUNCTION', token=token)
         # return the node
@@ -606,7 +811,7 @@ def FUNCTION(token_stream):
 def CLEAR_ROOM(token_stream):
     # if the current token is a CLEAR_ROOM
     token = token_stream.peek()
-    if token.token_type == 'CLEAR_ROOM':
+    if token.kind == Kind.CLEAR_ROOM:
         # create a node with the token as the value
         node = TreeNode('CLEAR_ROOM', token=token)
         # return the node
@@ -617,7 +822,7 @@ def CLEAR_ROOM(token_stream):
 def COMMA(token_stream):
     # if the current token is a COMMA
     token = token_stream.peek()
-    if token.token_type == 'COMMA':
+    if token.kind == Kind.COMMA:
         # create a node with the token as the value
         node = TreeNode('COMMA', token=token)
         # return the node
@@ -626,93 +831,121 @@ def COMMA(token_stream):
     return None
 
 
+'''Syntax errors and recovery'''
+
+def syntax_error(token, expected):
+    # the error for finding token where expected should be
+    if token.kind == Kind.EOF:
+        return MissingTokenError(expected, token)
+    return ExpectationError(token, expected)
+
+def expect(token_stream, terminal, sync=None):
+    # the leaf for terminal, which must be the current token
+    # with a sync set, a missing terminal is recovered from like in attempt(); the terminal is consumed
+    # if it is found after the skipped tokens
+    node = terminal(token_stream)
+    if node is not None:
+        return node
+    error = syntax_error(token_stream.peek(), terminal.__name__)
+    if sync is None:
+        raise error
+    node = recover(token_stream, error, sync)
+    found = terminal(token_stream)
+    if found is not None:
+        node.add_child(found)
+    return node
+
+def expect_one(token_stream, terminals, expected):
+    # the leaf for whichever of terminals (token kind -> terminal function) is the current token
+    terminal = terminals.get(token_stream.peek().kind)
+    if terminal is None:
+        raise syntax_error(token_stream.peek(), expected)
+    return terminal(token_stream)
+
+def recover(token_stream, error, sync):
+    # panic mode: note the error and skip every token up to the next one whose kind is in sync
+    # returns an error node holding the skipped tokens; without a diagnostics list the error is raised
+    diagnostics = token_stream.diagnostics
+    if diagnostics is None:
+        raise error
+    diagnostics.append(error)
+    node = TreeNode('error')
+    while True:
+        token = token_stream.peek()
+        kind = token.kind
+        # an ID only restarts a statement when an assignment follows it
+        if kind in sync and (kind != Kind.ID or token_stream.peek(1).kind in assignment_starts):
+            break
+        token_stream.pop()
+        node.add_child(TreeNode(token.token_type, token=token))
+    return node
+
+def attempt(production, token_stream, sync):
+    # the node of production, or the error node of recover() when it hits a syntax error
+    try:
+        return production(token_stream)
+    except (ExpectationError, MissingTokenError) as error:
+        return recover(token_stream, error, sync)
+
+'''Productions'''
+
 def var(token_stream):
     # This is for the production <var> ::= ID [LEFTBRACKET <expr> RIGHTBRACKET]
     node = TreeNode('var')
-    print(node)
     # add the var's children'
-    try:
-        node.add_child(ID(token_stream))
-        if token_stream.peek() == 'LEFTBRACKET':
-            node.add_child(LEFTBRACKET(token_stream))
-            try:
-                node.add_child(expr(token_stream))
-            except Exception as e:
-                raise e
-            node.add_child(RIGHTBRACKET(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, ID))
+    if token_stream.peek().kind == Kind.LEFTBRACKET:
+        node.add_child(LEFTBRACKET(token_stream))
+        node.add_child(expr(token_stream))
+        node.add_child(expect(token_stream, RIGHTBRACKET))
     # return the node
     return node
 
 def exprbase(token_stream):
     # This is for the production <exprbase> ::= <var> | INTEGER | BOOLEAN | LPAREN <expr> RPAREN | MINUS <exprbase>
     node = TreeNode('exprbase')
-    print(node)
     # add the exprbase's children'
-    try:
-        if token_stream.peek() == 'ID':
-            node.add_child(var(token_stream))
-        elif token_stream.peek() == 'INTEGER':
-            node.add_child(INTEGER(token_stream))
-        elif token_stream.peek() == 'BOOLEAN':
-            node.add_child(BOOLEAN(token_stream))
-        elif token_stream.peek() == 'LPAREN':
-            node.add_child(LPAREN(token_stream))
-            try:
-                node.add_child(expr(token_stream))
-            except Exception as e:
-                raise e
-            node.add_child(RPAREN(token_stream))
-        elif token_stream.peek() == 'MINUS':
-            node.add_child(MINUS(token_stream))
-            node.add_child(exprbase(token_stream))
-    except Exception as e:
-        raise e
+    # look the alternative up by the kind of the current token
+    alternative = exprbase_dispatch.get(token_stream.peek().kind)
+    if alternative is None:
+        raise syntax_error(token_stream.peek(), 'exprbase')
+    alternative(token_stream, node)
     return node
 
+def exprbase_parenthesized(token_stream, node):
+    # LPAREN <expr> RPAREN
+    node.add_child(LPAREN(token_stream))
+    node.add_child(expr(token_stream))
+    node.add_child(expect(token_stream, RPAREN))
 
+def exprbase_negated(token_stream, node):
+    # MINUS <exprbase>
+    node.add_child(MINUS(token_stream))
+    node.add_child(exprbase(token_stream))
 
-
-    
 def exprfac(token_stream):
     # create a node for the exprfac
     # <exprfac> ::= <exprbase> [ (MULTIPLY | DIVIDE) <exprbase> ]
     node = TreeNode('exprfac')
-    print(node)
     # add the exprfac's children
-    try:
-        node.add_child(exprbase(token_stream))
-    except Exception as e:
-        raise e
-    if token_stream.peek() == 'MULTIPLY':
-        node.add_child(MULTIPLY(token_stream))
-    elif token_stream.peek() == 'DIVIDE':
-        node.add_child(DIVIDE(token_stream))
-    else:
+    node.add_child(exprbase(token_stream))
+    operator = multiplicative_operators.get(token_stream.peek().kind)
+    if operator is None:
         return node
-    try:
-        node.add_child(exprbase(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(operator(token_stream))
+    node.add_child(exprbase(token_stream))
     return node
 
 def expr(token_stream):
     # This is for the production <expr> ::= <exprfac> [ (PLUS | MINUS) <expr> ]
     # create a node for the expr
     node = TreeNode('expr')
-    print(node)
     # add the expr's children
-    try:
-        node.add_child(exprfac(token_stream))
-    except Exception as e:
-        raise e
-    if token_stream.peek() == 'PLUS':
-        node.add_child(PLUS(token_stream))
-    elif token_stream.peek() == 'MINUS':
-        node.add_child(MINUS(token_stream))
-    else:
+    node.add_child(exprfac(token_stream))
+    operator = additive_operators.get(token_stream.peek().kind)
+    if operator is None:
         return node
+    node.add_child(operator(token_stream))
     node.add_child(expr(token_stream))
     return node
 
@@ -721,13 +954,10 @@ def element(token_stream):
     # create a node for the element
     node = TreeNode('element')
     # add the element's children
-    try:
-        if token_stream.peek() in ['SENSE_STENCH', 'SENSE_BREEZE', 'SENSE_GLITTER']:
-            node.add_child(sense(token_stream))
-        else:
-            node.add_child(expr(token_stream))
-    except Exception as e:
-        raise e
+    if token_stream.peek().kind in sense_dispatch:
+        node.add_child(sense(token_stream))
+    else:
+        node.add_child(expr(token_stream))
     # return the node
     return node
 
@@ -737,11 +967,8 @@ def term(token_stream):
     # create a node for the term
     node = TreeNode('term')
     # add the term's children
-    try:
-        node.add_child(element(token_stream))
-    except Exception as e:
-        raise e
-    while token_stream.peek() == 'COMPARISON':
+    node.add_child(element(token_stream))
+    while token_stream.peek().kind == Kind.COMPARISON:
         node.add_child(COMPARISON(token_stream))
         node.add_child(element(token_stream))
     # return the node
@@ -752,11 +979,8 @@ def conditional_expression(token_stream):
     # Create a node for the conditional_expression
     node = TreeNode('conditional_expression')
     # Add the conditional_expression's children
-    try:
-        node.add_child(term(token_stream))
-    except Exception as e:
-        raise e
-    while token_stream.peek() == 'LOGIC':
+    node.add_child(term(token_stream))
+    while token_stream.peek().kind == Kind.LOGIC:
         node.add_child(LOGIC(token_stream))
         node.add_child(term(token_stream))
     # return the node
@@ -768,40 +992,25 @@ def block(token_stream):
     # create a node for the block
     node = TreeNode('block')
     # add the block's children
-    LBRACE_node = LBRACE(token_stream)
-    if LBRACE_node is not None:
-        node.add_child(LBRACE_node)
-        try:
-            node.add_child(statement(token_stream))
-        except Exception as e:
-            raise e
-        while token_stream.peek() != 'RBRACE':
-            try:
-                node.add_child(statement(token_stream))
-            except Exception as e:
-                raise e
-        RBRACE_node = RBRACE(token_stream)
-        if RBRACE_node is not None:
-            node.add_child(RBRACE_node)
-            return node
-        if token_stream.peek() == 'EOF':
-            raise MissingTokenError('RBRACE')
-        else:
-            raise ExpectationError('RBRACE', token_stream.peek())
-        
+    node.add_child(expect(token_stream, LBRACE))
+    statements(token_stream, node)
+    # a block cut short by the end of the input or of its declaration is reported here, not by its parents
+    node.add_child(expect(token_stream, RBRACE, block_ends))
+    return node
+
+def statements(token_stream, node):
+    # <statement> { <statement> }, up to the end of the enclosing block
+    node.add_child(attempt(statement, token_stream, statement_sync))
+    while token_stream.peek().kind not in block_ends:
+        node.add_child(attempt(statement, token_stream, statement_sync))
+
 def return_statement(token_stream):
     # This is for the production <return_statement> ::= RETURN <expr>
     # create a node for the return_statement
     node = TreeNode('return_statement')
     # add the return_statement's children
-    try:
-        node.add_child(RETURN(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(expr(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, RETURN))
+    node.add_child(expr(token_stream))
     # return the node
     return node
 
@@ -811,22 +1020,20 @@ def action_assignment(token_stream):
     # create a node for the action_assignment
     node = TreeNode('action_assignment')
     # add the action_assignment's children
-    try:
-        node.add_child(var(token_stream))
-        node.add_child(ASSIGNMENT(token_stream))
-        if token_stream.peek() == 'ID':
+    node.add_child(var(token_stream))
+    node.add_child(expect(token_stream, ASSIGNMENT))
+    # an ID starts both a call and an <element>, the token after it tells them apart
+    if token_stream.peek().kind == Kind.ID and token_stream.peek(1).kind == Kind.LPAREN:
+        node.add_child(ID(token_stream))
+        node.add_child(LPAREN(token_stream))
+        if token_stream.peek().kind == Kind.ID:
             node.add_child(ID(token_stream))
-            node.add_child(LPAREN(token_stream))
-            if token_stream.peek() == 'ID':
-                node.add_child(ID(token_stream))
-                while token_stream.peek() == 'COMMA':
-                    node.add_child(COMMA(token_stream))
-                    node.add_child(ID(token_stream))
-            node.add_child(RPAREN(token_stream))
-        else:
-            node.add_child(element(token_stream))
-    except Exception as e:
-        raise e
+            while token_stream.peek().kind == Kind.COMMA:
+                node.add_child(COMMA(token_stream))
+                node.add_child(expect(token_stream, ID))
+        node.add_child(expect(token_stream, RPAREN))
+    else:
+        node.add_child(element(token_stream))
     # return the node
     return node
 
@@ -836,26 +1043,9 @@ def while_statement(token_stream):
     # create a node for the while_statement
     node = TreeNode('while_statement')
     # add the while_statement's children
-    try:
-        node.add_child(WHILE(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(LPAREN(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(conditional_expression(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(block(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, WHILE))
+    condition(token_stream, node)
+    node.add_child(block(token_stream))
     # return the node
     return node
 
@@ -864,50 +1054,28 @@ def if_statement(token_stream):
     # create a node for the if_statement
     node = TreeNode('if_statement')
     # add the if_statement's children
-    try:
-        node.add_child(IF(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(LPAREN(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(conditional_expression(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(block(token_stream))
-    except Exception as e:
-        raise e
-    if token_stream.peek() == 'ELSE':
+    node.add_child(expect(token_stream, IF))
+    condition(token_stream, node)
+    node.add_child(block(token_stream))
+    if token_stream.peek().kind == Kind.ELSE:
         node.add_child(ELSE(token_stream))
-        try:
-            node.add_child(block(token_stream))
-        except Exception as e:
-            raise e
+        node.add_child(block(token_stream))
     # return the node
     return node
 
+def condition(token_stream, node):
+    # LPAREN <conditional_expression> RPAREN of an if or while statement
+    # an error inside the parentheses resumes at the RPAREN, so the block after it is still parsed
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(attempt(conditional_expression, token_stream, condition_sync))
+    node.add_child(expect(token_stream, RPAREN, condition_sync))
+
 def direction(token_stream):
     # This is for the production <direction ::= NORTH | SOUTH | EAST | WEST
     # create a node for the direction
     node = TreeNode('direction')
     # add the direction's children
-    if token_stream.peek() == 'NORTH':
-        node.add_child(NORTH(token_stream))
-    elif token_stream.peek() == 'SOUTH':
-        node.add_child(SOUTH(token_stream))
-    elif token_stream.peek() == 'EAST':
-        node.add_child(EAST(token_stream))
-    elif token_stream.peek() == 'WEST':
-        node.add_child(WEST(token_stream))
-    else:
-        raise ExpectationError('direction', token_stream.peek())
+    node.add_child(expect_one(token_stream, directions, 'direction'))
     # return the node
     return node
 
@@ -916,18 +1084,9 @@ def print_position_statement(token_stream):
     # create a node for the print_position_statement
     node = TreeNode('print_position_statement')
     # add the print_position_statement's children
-    try:
-        node.add_child(PRINT_POSITION(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(LPAREN(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, PRINT_POSITION))
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(expect(token_stream, RPAREN))
     # return the node
     return node
 
@@ -936,37 +1095,20 @@ def sense_glitter_statement(token_stream):
     # create a node for the sense_glitter_statement
     node = TreeNode('sense_glitter_statement')
     # add the sense_glitter_statement's children
-    try:
-        node.add_child(SENSE_GLITTER(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(LPAREN(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, SENSE_GLITTER))
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(expect(token_stream, RPAREN))
     # return the node
+    return node
 
 def sense_breeze_statement(token_stream):
     # This is for the production <sense_breeze_statement> ::= SENSE_BREEZE LPAREN RPAREN
     # create a node for the sense_breeze_statement
     node = TreeNode('sense_breeze_statement')
     # add the sense_breeze_statement's children
-    try:
-        node.add_child(SENSE_BREEZE(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(LPAREN(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, SENSE_BREEZE))
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(expect(token_stream, RPAREN))
     # return the node
     return node
 
@@ -975,18 +1117,9 @@ def sense_stench_statement(token_stream):
     # create a node for the sense_stench_statement
     node = TreeNode('sense_stench_statement')
     # add the sense_stench_statement's children
-    try:
-        node.add_child(SENSE_STENCH(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(LPAREN(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, SENSE_STENCH))
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(expect(token_stream, RPAREN))
     # return the node
     return node
 
@@ -995,14 +1128,10 @@ def sense(token_stream):
     # create a node for the sense
     node = TreeNode('sense')
     # add the sense's children
-    if token_stream.peek() == 'SENSE_STENCH':
-        node.add_child(sense_stench_statement(token_stream))
-    elif token_stream.peek() == 'SENSE_BREEZE':
-        node.add_child(sense_breeze_statement(token_stream))
-    elif token_stream.peek() == 'SENSE_GLITTER':
-        node.add_child(sense_glitter_statement(token_stream))
-    else:
-        raise ExpectationError('sense', token_stream.peek())
+    production = sense_dispatch.get(token_stream.peek().kind)
+    if production is None:
+        raise syntax_error(token_stream.peek(), 'sense')
+    node.add_child(production(token_stream))
     # return the node
     return node
 
@@ -1011,18 +1140,9 @@ def grab_statement(token_stream):
     # create a node for the grab_statement
     node = TreeNode('grab_statement')
     # add the grab_statement's children
-    try:
-        node.add_child(GRAB(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(LPAREN(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, GRAB))
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(expect(token_stream, RPAREN))
     # return the node
     return node
 
@@ -1031,22 +1151,10 @@ def shoot_statement(token_stream):
     # create a node for the shoot_statement
     node = TreeNode('shoot_statement')
     # add the shoot_statement's children
-    try:
-        node.add_child(SHOOT(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(LPAREN(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(direction(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, SHOOT))
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(direction(token_stream))
+    node.add_child(expect(token_stream, RPAREN))
     # return the node
     return node
 
@@ -1055,22 +1163,10 @@ def move_statement(token_stream):
     # create a node for the move_statement
     node = TreeNode('move_statement')
     # add the move_statement's children
-    try:
-        node.add_child(MOVE(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(LPAREN(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(direction(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, MOVE))
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(direction(token_stream))
+    node.add_child(expect(token_stream, RPAREN))
     # return the node
     return node
 
@@ -1079,24 +1175,12 @@ def statement(token_stream):
     # create a node for the statement
     node = TreeNode('statement')
     # add the statement's children
-    if token_stream.peek() == 'MOVE':
-        node.add_child(move_statement(token_stream))
-    elif token_stream.peek() == 'SHOOT':
-        node.add_child(shoot_statement(token_stream))
-    elif token_stream.peek() == 'GRAB':
-        node.add_child(grab_statement(token_stream))
-    elif token_stream.peek() == 'PRINT_POSITION':
-        node.add_child(print_position_statement(token_stream))
-    elif token_stream.peek() == 'IF':
-        node.add_child(if_statement(token_stream))
-    elif token_stream.peek() == 'WHILE':
-        node.add_child(while_statement(token_stream))
-    elif token_stream.peek() == 'ID':
-        node.add_child(action_assignment(token_stream))
-    elif token_stream.peek() == 'RETURN':
-        node.add_child(return_statement(token_stream))
-    else:
-        raise ExpectationError('statement', token_stream.peek())
+    production = statement_dispatch.get(token_stream.peek().kind)
+    if production is None:
+        raise syntax_error(token_stream.peek(), 'statement')
+    node.add_child(production(token_stream))
+    # return the node
+    return node
 
 
 def play_block(token_stream):
@@ -1104,17 +1188,10 @@ def play_block(token_stream):
     # create a node for the play_block
     node = TreeNode('play_block')
     # add the play_block's children
-
-    try:
-        node.add_child(PLAY(token_stream))
-        node.add_child(LBRACE(token_stream))
-        node.add_child(statement(token_stream))
-        while token_stream.peek() in ['MOVE', 'SHOOT', 'GRAB', 'PRINT_POSITION', 'IF', 'WHILE', 'ID', 'RETURN', 'INTDTYPE', 'BOOLDTYPE']:
-            node.add_child(statement(token_stream))
-        node.add_child(RBRACE(token_stream))
-    except Exception as e:
-        raise e
-    
+    node.add_child(expect(token_stream, PLAY, play_sync))
+    node.add_child(expect(token_stream, LBRACE, statement_sync))
+    statements(token_stream, node)
+    node.add_child(expect(token_stream, RBRACE, block_ends))
     # return the node
     return node
 
@@ -1123,18 +1200,9 @@ def location(token_stream):
     # create a node for the location
     node = TreeNode('location')
     # add the location's children
-    try:
-        node.add_child(INTEGER(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(COMMA(token_stream))
-    except Exception as e:
-        raise e
-    try:
-        node.add_child(INTEGER(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, INTEGER))
+    node.add_child(expect(token_stream, COMMA))
+    node.add_child(expect(token_stream, INTEGER))
     # return the node
     return node
 
@@ -1143,57 +1211,24 @@ def init_statement(token_stream):
     # create a node for the init_statement
     node = TreeNode('init_statement')
     # add the init_statement's children
-    if token_stream.peek() == 'PLACE_PIT':
-        try:
-            node.add_child(PLACE_PIT(token_stream))
-        except Exception as e:
-            raise e
-        try:
-            node.add_child(LPAREN(token_stream))
-        except Exception as e:
-            raise e
-        try:
-            node.add_child(location(token_stream))
-        except Exception as e:
-            raise e
-        try:
-            node.add_child(RPAREN(token_stream))
-        except Exception as e:
-            raise e
-    elif token_stream.peek() == 'CLEAR_ROOM':
-        try:
-            node.add_child(CLEAR_ROOM(token_stream))
-        except Exception as e:
-            raise e
-        try:
-            node.add_child(LPAREN(token_stream))
-        except Exception as e:
-            raise e
-        try:
-            node.add_child(location(token_stream))
-        except Exception as e:
-            raise e
-        try:
-            node.add_child(RPAREN(token_stream))
-        except Exception as e:
-            raise e
+    node.add_child(expect_one(token_stream, init_statements, 'init_statement'))
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(location(token_stream))
+    node.add_child(expect(token_stream, RPAREN))
     # return the node
     return node
 
 
 def mandatory_gold(token_stream):
     # This is for the production <mandatory_gold> ::= PLACE_GOLD LPAREN <location> RPAREN
-    
+
     # create a node for the mandatory_gold
     node = TreeNode('mandatory_gold')
     # add the mandatory_gold's children
-    try:
-        node.add_child(PLACE_GOLD(token_stream))
-        node.add_child(LPAREN(token_stream))
-        node.add_child(location(token_stream))
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, PLACE_GOLD))
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(location(token_stream))
+    node.add_child(expect(token_stream, RPAREN))
     # return the node
     return node
 
@@ -1203,13 +1238,10 @@ def mandatory_wumpus(token_stream):
     # create a node for the mandatory_wumpus
     node = TreeNode('mandatory_wumpus')
     # add the mandatory_wumpus's children
-    try:
-        node.add_child(PLACE_WUMPUS(token_stream))
-        node.add_child(LPAREN(token_stream))
-        node.add_child(location(token_stream))
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, PLACE_WUMPUS))
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(location(token_stream))
+    node.add_child(expect(token_stream, RPAREN))
     # return the node
     return node
 
@@ -1219,29 +1251,23 @@ def mandatory_agent(token_stream):
     # create a node for the mandatory_agent
     node = TreeNode('mandatory_agent')
     # add the mandatory_agent's children
-    try:
-        node.add_child(PLACE_AGENT(token_stream))
-        node.add_child(LPAREN(token_stream))
-        node.add_child(location(token_stream))
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, PLACE_AGENT))
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(location(token_stream))
+    node.add_child(expect(token_stream, RPAREN))
     # return the node
     return node
 
 def grid_size(token_stream):
     # This is for the production <grid_size> ::= GRID_SIZE LPAREN <location> RPAREN
-    
+
     # create a node for the grid_size
     node = TreeNode('grid_size')
     # add the grid_size's children
-    try:
-        node.add_child(GRID_SIZE(token_stream))
-        node.add_child(LPAREN(token_stream))
-        node.add_child(location(token_stream))
-        node.add_child(RPAREN(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, GRID_SIZE))
+    node.add_child(expect(token_stream, LPAREN))
+    node.add_child(location(token_stream))
+    node.add_child(expect(token_stream, RPAREN))
     # return the node
     return node
 
@@ -1251,19 +1277,16 @@ def init_block(token_stream):
     # create a node for the init_block
     node = TreeNode('init_block')
     # add the init_block's children
-    try:
-        node.add_child(INIT(token_stream))
-        node.add_child(LBRACE(token_stream))
-        node.add_child(grid_size(token_stream))
-        node.add_child(mandatory_agent(token_stream))
-        node.add_child(mandatory_wumpus(token_stream))
-        node.add_child(mandatory_gold(token_stream))
-        while token_stream.peek() in ['PLACE_PIT', 'CLEAR_ROOM']:
-            node.add_child(init_statement(token_stream))
-        node.add_child(RBRACE(token_stream))
-        
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, INIT, init_sync | {Kind.LBRACE}))
+    node.add_child(expect(token_stream, LBRACE, init_sync))
+    # a broken placement resumes at the next one
+    node.add_child(attempt(grid_size, token_stream, init_sync))
+    node.add_child(attempt(mandatory_agent, token_stream, init_sync))
+    node.add_child(attempt(mandatory_wumpus, token_stream, init_sync))
+    node.add_child(attempt(mandatory_gold, token_stream, init_sync))
+    while token_stream.peek().kind in init_statements:
+        node.add_child(attempt(init_statement, token_stream, init_sync))
+    node.add_child(expect(token_stream, RBRACE, init_end_sync))
     # return the node
     return node
 def declarations(token_stream):
@@ -1271,17 +1294,10 @@ def declarations(token_stream):
     # create a node for the declarations
     node = TreeNode('declarations')
     # add the declarations's children
-    while token_stream.peek() in ['CONSTANT', 'FUNCTION']:
-        if token_stream.peek() == 'CONSTANT':
-            try:
-                node.add_child(constant_declaration(token_stream))
-            except Exception as e:
-                raise e
-        elif token_stream.peek() == 'FUNCTION':
-            try:
-                node.add_child(function_declaration(token_stream))
-            except Exception as e:
-                raise e
+    production = declaration_dispatch.get(token_stream.peek().kind)
+    while production is not None:
+        node.add_child(attempt(production, token_stream, declaration_sync))
+        production = declaration_dispatch.get(token_stream.peek().kind)
     # return the node
     return node
 
@@ -1290,77 +1306,59 @@ def function_declaration(token_stream):
     # create a node for the function_declaration
     node = TreeNode('function_declaration')
     # add the function_declaration's children
+    node.add_child(expect(token_stream, FUNCTION))
+    # an error in the signature resumes at the body
     try:
-        node.add_child(FUNCTION(token_stream))
-        node.add_child(return_type(token_stream))
-        node.add_child(ID(token_stream))
-        node.add_child(LPAREN(token_stream))
-        if token_stream.peek() in ['INTDTYPE', 'BOOLDTYPE']:
-            node.add_child(formal_params(token_stream))
-            while token_stream.peek() == 'COMMA':
-                node.add_child(COMMA(token_stream))
-                node.add_child(formal_params(token_stream))
-        node.add_child(RPAREN(token_stream))
-        node.add_child(block(token_stream))
-    except Exception as e:
-        raise e
+        function_signature(token_stream, node)
+    except (ExpectationError, MissingTokenError) as error:
+        node.add_child(recover(token_stream, error, signature_sync))
+    node.add_child(block(token_stream))
     # return the node
     return node
 
+def function_signature(token_stream, node):
+    # <return_type> ID LPAREN [<formal_params> {COMMA <formal_params>}] RPAREN
+    node.add_child(return_type(token_stream))
+    node.add_child(expect(token_stream, ID))
+    node.add_child(expect(token_stream, LPAREN))
+    if token_stream.peek().kind in data_types:
+        node.add_child(formal_params(token_stream))
+        while token_stream.peek().kind == Kind.COMMA:
+            node.add_child(COMMA(token_stream))
+            node.add_child(formal_params(token_stream))
+    node.add_child(expect(token_stream, RPAREN))
+
 def formal_params(token_stream):
     # This is for the production <formal_params> ::= (INTDTYPE | BOOLDTYPE) ID
     # create a node for the formal_params
     node = TreeNode('formal_params')
     # add the formal_params's children
-    try:
-        if token_stream.peek() == 'INTDTYPE':
-            node.add_child(INTDTYPE(token_stream))
-        elif token_stream.peek() == 'BOOLDTYPE':
-            node.add_child(BOOLDTYPE(token_stream))
-        node.add_child(ID(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect_one(token_stream, data_types, 'INTDTYPE or BOOLDTYPE'))
+    node.add_child(expect(token_stream, ID))
     # return the node
     return node
 
 def return_type(token_stream):
     # This is for the production <return_type> ::= INTDTYPE | BOOLDTYPE | VOID
     # create a node for the return_type
-    
+
     node = TreeNode('return_type')
     # add the return_type's children
-    try:
-        if token_stream.peek() == 'INTDTYPE':
-            node.add_child(INTDTYPE(token_stream))
-        elif token_stream.peek() == 'BOOLDTYPE':
-            node.add_child(BOOLDTYPE(token_stream))
-        elif token_stream.peek() == 'VOID':
-            node.add_child(VOID(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect_one(token_stream, return_types, 'return_type'))
     # return the node
     return node
 
 def constant_declaration(token_stream):
     # This is for the production <constant_declaration> ::= CONSTANT (INTDTYPE|BOOLDTYPE) ID ASSIGNMENT (INTEGER | BOOLEAN)
-    
+
     # create a node for the constant_declaration
     node = TreeNode('constant_declaration')
     # add the constant_declaration's children
-    try:
-        node.add_child(CONSTANT(token_stream))
-        if token_stream.peek() == 'INTDTYPE':
-            node.add_child(INTDTYPE(token_stream))
-        elif token_stream.peek() == 'BOOLDTYPE':
-            node.add_child(BOOLDTYPE(token_stream))
-        node.add_child(ID(token_stream))
-        node.add_child(ASSIGNMENT(token_stream))
-        if token_stream.peek() == 'INTEGER':
-            node.add_child(INTEGER(token_stream))
-        elif token_stream.peek() == 'BOOLEAN':
-            node.add_child(BOOLEAN(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect(token_stream, CONSTANT))
+    node.add_child(expect_one(token_stream, data_types, 'INTDTYPE or BOOLDTYPE'))
+    node.add_child(expect(token_stream, ID))
+    node.add_child(expect(token_stream, ASSIGNMENT))
+    node.add_child(expect_one(token_stream, literals, 'INTEGER or BOOLEAN'))
     # return the node
     return node
 
@@ -1369,67 +1367,170 @@ def var_declaration(token_stream):
     # create a node for the var_declaration
     node = TreeNode('var_declaration')
     # add the var_declaration's children
-    try:
-        if token_stream.peek() == 'INTDTYPE':
-            node.add_child(INTDTYPE(token_stream))
-        elif token_stream.peek() == 'BOOLDTYPE':
-            node.add_child(BOOLDTYPE(token_stream))
-        node.add_child(ID(token_stream))
-        while token_stream.peek() == 'LEFTBRACKET':
-            node.add_child(LEFTBRACKET(token_stream))
-            node.add_child(INTEGER(token_stream))
-            node.add_child(RIGHTBRACKET(token_stream))
-    except Exception as e:
-        raise e
+    node.add_child(expect_one(token_stream, data_types, 'INTDTYPE or BOOLDTYPE'))
+    node.add_child(expect(token_stream, ID))
+    while token_stream.peek().kind == Kind.LEFTBRACKET:
+        node.add_child(LEFTBRACKET(token_stream))
+        node.add_child(expect(token_stream, INTEGER))
+        node.add_child(expect(token_stream, RIGHTBRACKET))
     # return the node
     return node
 
+'''Dispatch tables: token kind -> the production or terminal to parse next'''
+
+statement_dispatch = {
+    Kind.MOVE: move_statement,
+    Kind.SHOOT: shoot_statement,
+    Kind.GRAB: grab_statement,
+    Kind.PRINT_POSITION: print_position_statement,
+    Kind.IF: if_statement,
+    Kind.WHILE: while_statement,
+    Kind.ID: action_assignment,
+    Kind.RETURN: return_statement,
+}
+
+exprbase_dispatch = {
+    Kind.ID: lambda token_stream, node: node.add_child(var(token_stream)),
+    Kind.INTEGER: lambda token_stream, node: node.add_child(INTEGER(token_stream)),
+    Kind.BOOLEAN: lambda token_stream, node: node.add_child(BOOLEAN(token_stream)),
+    Kind.LPAREN: exprbase_parenthesized,
+    Kind.MINUS: exprbase_negated,
+}
+additive_operators = {Kind.PLUS: PLUS, Kind.MINUS: MINUS}
+multiplicative_operators = {Kind.MULTIPLY: MULTIPLY, Kind.DIVIDE: DIVIDE}
+
+sense_dispatch = {
+    Kind.SENSE_STENCH: sense_stench_statement,
+    Kind.SENSE_BREEZE: sense_breeze_statement,
+    Kind.SENSE_GLITTER: sense_glitter_statement,
+}
+directions = {Kind.NORTH: NORTH, Kind.SOUTH: SOUTH, Kind.EAST: EAST, Kind.WEST: WEST}
+
+declaration_dispatch = {Kind.CONSTANT: constant_declaration, Kind.FUNCTION: function_declaration}
+init_statements = {Kind.PLACE_PIT: PLACE_PIT, Kind.CLEAR_ROOM: CLEAR_ROOM}
+data_types = {Kind.INTDTYPE: INTDTYPE, Kind.BOOLDTYPE: BOOLDTYPE}
+return_types = {Kind.INTDTYPE: INTDTYPE, Kind.BOOLDTYPE: BOOLDTYPE, Kind.VOID: VOID}
+literals = {Kind.INTEGER: INTEGER, Kind.BOOLEAN: BOOLEAN}
+
+'''Synchronizing sets: after a syntax error, tokens are skipped up to one of these kinds'''
+
+# tokens a block can end at, the RBRACE and anything that can only come after a missing one
+block_ends = frozenset({Kind.RBRACE, Kind.EOF, Kind.INIT, Kind.PLAY, Kind.FUNCTION, Kind.CONSTANT})
+statement_sync = frozenset(statement_dispatch) | block_ends
+condition_sync = frozenset({Kind.RPAREN, Kind.LBRACE}) | block_ends
+declaration_sync = frozenset({Kind.FUNCTION, Kind.CONSTANT, Kind.INIT, Kind.PLAY, Kind.EOF})
+signature_sync = declaration_sync | {Kind.LBRACE}
+init_sync = frozenset({
+    Kind.GRID_SIZE, Kind.PLACE_AGENT, Kind.PLACE_WUMPUS, Kind.PLACE_GOLD, Kind.PLACE_PIT, Kind.CLEAR_ROOM,
+    Kind.RBRACE, Kind.PLAY, Kind.EOF,
+})
+init_end_sync = frozenset({Kind.RBRACE, Kind.PLAY, Kind.EOF})
+play_sync = frozenset({Kind.LBRACE, Kind.EOF})
+assignment_starts = frozenset({Kind.ASSIGNMENT, Kind.LEFTBRACKET})
+
 def program(token_stream):
     # This is for the production <program> ::= <declarations> <init_block> <play_block>
-    # create a node for the program
-    node = TreeNode('program')
-    # add the program's children
-    try:
-        node.add_child(declarations(token_stream))
-        node.add_child(init_block(token_stream))
-        
-        node.add_child(play_block(token_stream))
-        '''if token_stream.peek() != 'EOF':
-            return node'''
-    except Exception as e:
+    # every syntax error is reported, after the partial tree, before the process exits
+    node, diagnostics = parse_recovering(token_stream)
+    if diagnostics:
         print(node)
-        print(e)
+        for error in diagnostics:
+            print(error)
         sys.exit(1)
     # return the node
     return node
 
 
-def run(token_stream, output_file):
-    # parse the token stream
-    cst = program(token_stream)
+def parse_program(token_stream):
+    # like program(), but the first syntax error is raised to the caller instead of ending the process
+    node = TreeNode('program')
+    program_children(token_stream, node)
+    return node
+
+
+def parse_recovering(token_stream):
+    # parse the whole input, recovering from syntax errors in panic mode
+    # returns the CST, with an error node wherever tokens were skipped, and the list of every
+    # ExpectationError and MissingTokenError found
+    token_stream.diagnostics = []
+    node = TreeNode('program')
+    try:
+        program_children(token_stream, node)
+    finally:
+        diagnostics = token_stream.diagnostics
+        token_stream.diagnostics = None
+    return node, diagnostics
+
+
+def program_children(token_stream, node):
+    node.add_child(declarations(token_stream))
+    node.add_child(init_block(token_stream))
+    node.add_child(play_block(token_stream))
+
+
+def parse_source(source, lexer=None, engine='ply'):
+    # lex and parse a source string in-process, streaming the lexer's tokens into the parser
+    return program(LexerTokenStream(tokenize(source, lexer, engine), LineIndex(source)))
+
+
+def run(token_stream, output_file, parser=None, cst=None):
+    # parse the token stream, unless the CST is given (e.g. by the parse cache)
+    if cst is None:
+        cst = (parser or program)(token_stream)
     # print the CST
-    print(cst)
+    render_tree(cst, sys.stdout)
+    sys.stdout.write('\n')
     # write the CST to the output file
-    output_file.write(str(cst))
+    render_tree(cst, output_file)
 
 
 def main():
     parse = argparse.ArgumentParser()
+    parse.add_argument('-f', '--file', help='Lex and parse this source code file directly, without the lexer\'s output.txt', type=str)
+    parse.add_argument('-t', '--tokens', help='Token file written by the lexer, - reads a text one from stdin', type=str, default='output.txt')
     parse.add_argument('-o', '--output', help='Add file path to the output file', type=str)
+    parse.add_argument('-z', '--gzip', help='Gzip the output file (implied by a .gz output path)', action='store_true')
+    parse.add_argument('--engine', help='Lexer backend used with -f', choices=ENGINES, default='ply')
+    parse.add_argument('--parser', help='Recursive descent parser, or the LL(1) table parser generated from grammar.txt', choices=['recursive', 'table'], default='recursive')
+    parse.add_argument('--cache', help='With -f, reuse the CST of a source parsed before, from this cache directory', nargs='?', const='.wumpus_cache', type=str)
+    parse.add_argument('--cache-size', help='Largest size of the cache directory in MB', type=int, default=256)
 
     args = parse.parse_args()
 
-    source_code = "output.txt"
+    source_code = args.tokens
     # if no output file is provided 
     if(args.output is None):
         print("No output file provided. Using ./output.txt")
         args.output = "parser_output.txt"
 
-    output_file = open(args.output, "w", encoding="utf8")
-    # create a token stream
-    token_stream = TokenStream(source_code)
+    if args.gzip or args.output.endswith('.gz'):
+        output_file = gzip.open(args.output, "wt", encoding="utf8")
+    else:
+        output_file = open(args.output, "w", encoding="utf8")
+    parser = program
+    if args.parser == 'table':
+        import table_parser
+        parser = table_parser.program
+    # a source in the cache is neither lexed nor parsed; program() exits on syntax errors, so only valid trees are stored
+    if args.file is not None and args.cache is not None:
+        import parse_cache
+        cache = parse_cache.ParseCache(args.cache, args.cache_size << 20)
+        with open(args.file, 'r') as file:
+            cst, _ = parse_cache.parse_source(file.read(), lambda token_stream: (parser(token_stream), []), cache, engine=args.engine)
+        run(None, output_file, cst=cst)
+        output_file.close()
+        print(cache.summary())
+        return
+    # create a token stream, either straight from the source or from the lexer's token file
+    if args.file is not None:
+        with open(args.file, 'r') as file:
+            source = file.read()
+        token_stream = LexerTokenStream(tokenize(source, engine=args.engine), LineIndex(source))
+    else:
+        token_stream = open_token_stream(source_code)
     # create a CST
-    run(token_stream, output_file)
+    run(token_stream, output_file, parser)
+    output_file.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,289 @@
+# Semantic analysis of the AST built by wumpus_ast.lower, in one traversal
+# Every name is resolved through hashed scope tables: the constants, the functions, and one local scope
+# per function (parameters first) and for the play block. Variables are declared by their first use,
+# as the VM gives an unassigned variable the value 0, and take the type of the first value assigned to them.
+# Each Var and Call gets its Symbol, whose slot is the integer id later stages use instead of the name
+# (wumpus_vm takes its local slots from them), and every problem found is collected as a SemanticError.
+
+import sys
+import argparse
+
+import wumpus_ast
+from wumpus_ast import Var, Literal, BinOp, Negate, Sense, Call
+
+# symbol kinds
+CONSTANT = 'constant'
+FUNCTION = 'function'
+PARAMETER = 'parameter'
+VARIABLE = 'variable'
+
+# types, None stands for the type of an expression that already has an error
+INT = 'int'
+BOOL = 'bool'
+VOID = 'void'
+
+ARITHMETIC = ('+', '-', '*', '/')
+ORDERING = ('<', '<=', '>', '>=')
+EQUALITY = ('==', '!=')
+LOGIC = ('and', 'or')
+
+class SemanticError(Exception):
+    def __init__(self, message, line=None):
+        self.message = message if line is None else f'{message} on line {line}'
+        self.line = line
+        super().__init__(self.message)
+
+class Symbol:
+    '''
+    A declared name: its kind, its type (the element type for arrays, the return type for functions)
+    and its slot, the index of the name in its scope
+    '''
+    __slots__ = ('name', 'kind', 'type', 'slot', 'line', 'array', 'params')
+
+    def __init__(self, name, kind, type, slot, line=None, array=False, params=()):
+        self.name = name
+        self.kind = kind
+        self.type = type
+        self.slot = slot
+        self.line = line
+        self.array = array
+        # parameter types of a function
+        self.params = params
+
+    def __repr__(self):
+        return f'{self.kind} {self.slot}'
+
+class Scope:
+    '''A symbol table: name -> Symbol, and the symbols in slot order'''
+    def __init__(self, name):
+        self.name = name
+        self.symbols = {}
+        self.slots = []
+
+    def __repr__(self):
+        return f'<{self.name}: {len(self.slots)} slots>'
+
+    def get(self, name):
+        return self.symbols.get(name)
+
+    def declare(self, name, kind, type, line=None, array=False, params=()):
+        symbol = self.symbols[name] = Symbol(name, kind, type, len(self.slots), line, array, params)
+        self.slots.append(symbol)
+        return symbol
+
+def type_of(value):
+    return BOOL if value.__class__ is bool else INT
+
+class Analyzer:
+    '''
+    Resolves and type checks a wumpus_ast.Program
+    errors collects every SemanticError found, the analysis goes on after each one
+    '''
+    def __init__(self):
+        self.constants = Scope('constants')
+        self.functions = Scope('functions')
+        self.scope = None
+        # the function being analyzed, None in the play block
+        self.function = None
+        self.errors = []
+
+    def error(self, message, line):
+        self.errors.append(SemanticError(message, line))
+
+    def analyze(self, program):
+        for declaration in program.constants:
+            if self.constants.get(declaration.name) is not None:
+                self.error(f'Constant {declaration.name} is declared twice', declaration.line)
+                continue
+            if type_of(declaration.value) != declaration.type:
+                self.error(f'Constant {declaration.name} is {declaration.type} but its value is {type_of(declaration.value)}', declaration.line)
+            self.constants.declare(declaration.name, CONSTANT, declaration.type, declaration.line)
+        # every function can be called from anywhere, so the signatures come first
+        for declaration in program.functions:
+            if self.functions.get(declaration.name) is not None:
+                self.error(f'Function {declaration.name} is declared twice', declaration.line)
+                continue
+            params = tuple(param_type for param_type, _ in declaration.params)
+            self.functions.declare(declaration.name, FUNCTION, declaration.return_type, declaration.line, params=params)
+        for declaration in program.functions:
+            self.function = declaration
+            self.scope = declaration.scope = Scope(declaration.name)
+            for param_type, name in declaration.params:
+                if self.scope.get(name) is not None:
+                    self.error(f'Parameter {name} of {declaration.name} is declared twice', declaration.line)
+                elif self.constants.get(name) is not None:
+                    # the constant would win over the parameter in every expression
+                    self.error(f'Parameter {name} of {declaration.name} hides the constant {name}', declaration.line)
+                self.scope.declare(name, PARAMETER, param_type, declaration.line)
+            self.block(declaration.body)
+        self.function = None
+        self.scope = program.scope = Scope('play')
+        self.block(program.body)
+        return self.errors
+
+    def lookup(self, node):
+        # the symbol a Var refers to, declared as a variable on its first use; constants win, like in the VM
+        name = node.name
+        symbol = self.constants.get(name)
+        if symbol is not None:
+            if node.index is not None:
+                self.error(f'Constant {name} is not an array', node.line)
+            return symbol
+        symbol = self.scope.get(name)
+        if symbol is None:
+            return self.scope.declare(name, VARIABLE, None, node.line, array=node.index is not None)
+        if symbol.array != (node.index is not None):
+            self.error(f'{name} is {"an array" if symbol.array else "not an array"}', node.line)
+        return symbol
+
+    def block(self, statements):
+        for statement in statements:
+            statement_analyzers[statement.__class__](self, statement)
+
+    def condition(self, node, statement):
+        condition_type = self.expression(node)
+        if condition_type not in (BOOL, None):
+            self.error(f'The condition of {statement} is {condition_type}, not bool', node.line)
+
+    def analyze_if(self, node):
+        self.condition(node.condition, 'if')
+        self.block(node.body)
+        self.block(node.orelse)
+
+    def analyze_while(self, node):
+        self.condition(node.condition, 'while')
+        self.block(node.body)
+
+    def analyze_assign(self, node):
+        # in the order the VM evaluates it: the index, the value, then the target
+        target = node.target
+        if target.index is not None:
+            self.index(target.index)
+        value_type = self.call(node.value) if node.value.__class__ is Call else self.expression(node.value)
+        if self.constants.get(target.name) is not None:
+            self.error(f'Assignment to the constant {target.name}', node.line)
+            target.symbol = self.constants.get(target.name)
+            return
+        symbol = target.symbol = self.lookup(target)
+        if symbol.type is None:
+            symbol.type = value_type
+        elif value_type is not None and value_type != symbol.type:
+            self.error(f'{target.name} is {symbol.type} but is assigned a {value_type}', node.line)
+
+    def analyze_return(self, node):
+        value_type = self.expression(node.value)
+        function = self.function
+        if function is None or value_type is None:
+            # return in the play block ends the game, whatever its value
+            return
+        if function.return_type == VOID:
+            self.error(f'Function {function.name} is void but returns a value', node.line)
+        elif value_type != function.return_type:
+            self.error(f'Function {function.name} returns {function.return_type} but the value is {value_type}', node.line)
+
+    def call(self, node):
+        symbol = node.symbol = self.functions.get(node.name)
+        arg_types = [self.expression(arg) for arg in node.args]
+        if symbol is None:
+            self.error(f'Call to undefined function {node.name}', node.line)
+            return None
+        if len(symbol.params) != len(arg_types):
+            self.error(f'{node.name} takes {len(symbol.params)} arguments but {len(arg_types)} were given', node.line)
+        else:
+            for position, (param_type, arg_type) in enumerate(zip(symbol.params, arg_types), 1):
+                if arg_type is not None and arg_type != param_type:
+                    self.error(f'Argument {position} of {node.name} must be {param_type}, not {arg_type}', node.line)
+        if symbol.type == VOID:
+            self.error(f'Function {node.name} is void and has no value to assign', node.line)
+            return None
+        return symbol.type
+
+    def index(self, node):
+        index_type = self.expression(node)
+        if index_type not in (INT, None):
+            self.error(f'Array index is {index_type}, not int', node.line)
+
+    def expression(self, node):
+        # the type of an expression, None when an error was already reported in it
+        kind = node.__class__
+        if kind is Var:
+            if node.index is not None:
+                self.index(node.index)
+            symbol = node.symbol = self.lookup(node)
+            if symbol.type is None:
+                # read before any assignment: the VM's default 0
+                symbol.type = INT
+            return symbol.type
+        if kind is Literal:
+            return type_of(node.value)
+        if kind is Sense:
+            return BOOL
+        if kind is Negate:
+            return self.operands(node, (node.operand,), INT, INT)
+        if kind is BinOp:
+            op = node.op
+            if op in ARITHMETIC:
+                return self.operands(node, (node.left, node.right), INT, INT)
+            if op in ORDERING:
+                return self.operands(node, (node.left, node.right), INT, BOOL)
+            if op in LOGIC:
+                return self.operands(node, (node.left, node.right), BOOL, BOOL)
+            left = self.expression(node.left)
+            right = self.expression(node.right)
+            if left is None or right is None:
+                return None
+            if left != right:
+                self.error(f'{left} {op} {right} compares values of different types', node.line)
+            return BOOL
+        raise SemanticError(f'Cannot analyze {kind.__name__}', node.line)
+
+    def operands(self, node, operands, operand_type, result_type):
+        # checks that every operand has operand_type, reported once per operator
+        types = [self.expression(operand) for operand in operands]
+        if None in types:
+            return None
+        if any(found != operand_type for found in types):
+            op = node.op if node.__class__ is BinOp else 'unary -'
+            self.error(f'{op} needs {operand_type} operands, not {" and ".join(types)}', node.line)
+            return None
+        return result_type
+
+statement_analyzers = {
+    wumpus_ast.Move: lambda analyzer, node: None,
+    wumpus_ast.Shoot: lambda analyzer, node: None,
+    wumpus_ast.Grab: lambda analyzer, node: None,
+    wumpus_ast.PrintPosition: lambda analyzer, node: None,
+    wumpus_ast.If: Analyzer.analyze_if,
+    wumpus_ast.While: Analyzer.analyze_while,
+    wumpus_ast.Assign: Analyzer.analyze_assign,
+    wumpus_ast.Return: Analyzer.analyze_return,
+}
+
+def analyze(program):
+    # resolve and check a wumpus_ast.Program (or a program() CST, lowered first)
+    # returns the annotated program and the list of SemanticErrors
+    if not isinstance(program, wumpus_ast.Program):
+        program = wumpus_ast.lower(program)
+    return program, Analyzer().analyze(program)
+
+def main():
+    parse = argparse.ArgumentParser(description='Resolve the names of a Wumpus program and check its types')
+    parse.add_argument('-f', '--file', help='Wumpus source file', type=str, required=True)
+    parse.add_argument('-t', '--tree', help='Print the AST annotated with the resolved symbols', action='store_true')
+    args = parse.parse_args()
+
+    import table_parser
+    from lexer import tokenize
+    from wumpus_parser import LexerTokenStream
+    with open(args.file, 'r') as file:
+        program, errors = analyze(table_parser.program(LexerTokenStream(tokenize(file.read(), engine='scanner'))))
+    if args.tree:
+        sys.stdout.write(str(program))
+    for error in errors:
+        print(error)
+    if errors:
+        sys.exit(1)
+    print('No semantic errors')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,516 @@
+# Bytecode compiler and stack virtual machine for Wumpus programs
+# The AST from wumpus_ast.lower is compiled once into flat integer code, one code object per function
+# plus one for the play block. Names are resolved at compile time: constants become indexes into a
+# constant pool and variables become local slots, so the VM never looks a name up in a dict.
+# Calls push an explicit frame, so recursion in a Wumpus program does not use the Python stack.
+
+import sys
+import time
+import argparse
+from array import array
+
+import wumpus_ast
+import wumpus_optimize
+import wumpus_semantic
+from wumpus_ast import Var
+from wumpus_world import World, WorldError, DIRECTIONS, PERCEPTS, OUT_OF_STEPS, OUT_OF_TIME
+
+# opcodes, every instruction is an opcode followed by one argument (0 when unused)
+OPCODES = (
+    'LOAD_CONST', 'LOAD_LOCAL', 'STORE_LOCAL', 'LOAD_INDEX', 'STORE_INDEX',
+    'ADD', 'SUB', 'MUL', 'DIV', 'NEG',
+    'EQ', 'NE', 'LT', 'LE', 'GT', 'GE',
+    'JUMP', 'JUMP_IF_FALSE', 'JUMP_IF_FALSE_OR_POP', 'JUMP_IF_TRUE_OR_POP',
+    'CALL', 'RETURN', 'HALT',
+    'MOVE', 'SHOOT', 'GRAB', 'PRINT_POSITION', 'SENSE',
+)
+(LOAD_CONST, LOAD_LOCAL, STORE_LOCAL, LOAD_INDEX, STORE_INDEX,
+ ADD, SUB, MUL, DIV, NEG,
+ EQ, NE, LT, LE, GT, GE,
+ JUMP, JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP,
+ CALL, RETURN, HALT,
+ MOVE, SHOOT, GRAB, PRINT_POSITION, SENSE) = range(len(OPCODES))
+
+BINARY_OPCODES = {
+    '+': ADD, '-': SUB, '*': MUL, '/': DIV,
+    '==': EQ, '!=': NE, '<': LT, '<=': LE, '>': GT, '>=': GE,
+}
+
+# executed instructions allowed per run by default, a guard against programs that never end
+MAX_STEPS = 1000000
+# frames allowed on the call stack
+MAX_DEPTH = 100000
+# with a time budget, the clock is read about once per this many instructions
+TIME_CHECK_INTERVAL = 65536
+
+class CompileError(Exception):
+    def __init__(self, message, line=None):
+        self.message = message if line is None else f'{message} on line {line}'
+        self.line = line
+        super().__init__(self.message)
+
+class VMError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+class Function:
+    '''
+    Compiled code of a function or of the play block
+    code is a flat array of (opcode, argument) pairs, the first arity slots hold the arguments
+    '''
+    def __init__(self, name, arity, slots, code, names):
+        self.name = name
+        self.arity = arity
+        self.slots = slots
+        self.code = code
+        # slot -> variable name, for disassembly
+        self.names = names
+
+class Bytecode:
+    '''
+    A compiled program: its functions, the play block (main), the constant pool and the world to play in
+    '''
+    def __init__(self, functions, main, constants, world):
+        self.functions = functions
+        self.main = main
+        self.constants = constants
+        self.world = world
+
+    def disassemble(self, output_file=sys.stdout):
+        for function in self.functions + [self.main]:
+            output_file.write(f'{function.name} ({function.arity} arguments, {function.slots} slots)\n')
+            code = function.code
+            for pc in range(0, len(code), 2):
+                op, arg = code[pc], code[pc + 1]
+                if op == LOAD_CONST:
+                    detail = repr(self.constants[arg])
+                elif op in (LOAD_LOCAL, STORE_LOCAL, LOAD_INDEX, STORE_INDEX):
+                    detail = function.names[arg]
+                elif op == CALL:
+                    detail = self.functions[arg].name
+                elif op in (MOVE, SHOOT):
+                    detail = DIRECTIONS[arg]
+                elif op == SENSE:
+                    detail = PERCEPTS[arg]
+                elif op in (JUMP, JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP):
+                    detail = f'-> {arg}'
+                else:
+                    detail = ''
+                output_file.write(f'  {pc:>5} {OPCODES[op]:<22}{detail}\n')
+
+class FunctionCompiler:
+    # compiles the statements of one function (or the play block) into code
+    def __init__(self, compiler, name, params, scope=None):
+        self.compiler = compiler
+        self.name = name
+        self.code = []
+        self.slots = {}
+        if scope is not None:
+            # resolved by wumpus_semantic, parameters first
+            for symbol in scope.slots:
+                self.slots[symbol.name] = symbol.slot
+        for _, param in params:
+            self.slot(param)
+
+    def slot(self, name):
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.slots)
+        return slot
+
+    def variable(self, node):
+        # the local slot of a Var, from its symbol when wumpus_semantic resolved it
+        symbol = node.symbol
+        if symbol is not None and symbol.kind in ('parameter', 'variable'):
+            return symbol.slot
+        return self.slot(node.name)
+
+    def emit(self, op, arg=0):
+        self.code.append(op)
+        self.code.append(arg)
+        # position of the argument, for jumps patched later
+        return len(self.code) - 1
+
+    def here(self):
+        return len(self.code)
+
+    def patch(self, position, target):
+        self.code[position] = target
+
+    def function(self, arity):
+        names = sorted(self.slots, key=self.slots.get)
+        return Function(self.name, arity, len(self.slots), array('i', self.code), names)
+
+    def block(self, statements):
+        for statement in statements:
+            self.statement(statement)
+
+    def statement(self, node):
+        kind = node.__class__
+        if kind is wumpus_ast.Assign:
+            self.assign(node)
+        elif kind is wumpus_ast.Move:
+            self.emit(MOVE, DIRECTIONS.index(node.direction))
+        elif kind is wumpus_ast.Shoot:
+            self.emit(SHOOT, DIRECTIONS.index(node.direction))
+        elif kind is wumpus_ast.Grab:
+            self.emit(GRAB)
+        elif kind is wumpus_ast.PrintPosition:
+            self.emit(PRINT_POSITION)
+        elif kind is wumpus_ast.If:
+            self.expression(node.condition)
+            to_else = self.emit(JUMP_IF_FALSE)
+            self.block(node.body)
+            if node.orelse:
+                to_end = self.emit(JUMP)
+                self.patch(to_else, self.here())
+                self.block(node.orelse)
+                self.patch(to_end, self.here())
+            else:
+                self.patch(to_else, self.here())
+        elif kind is wumpus_ast.While:
+            start = self.here()
+            # a literal true condition (left by wumpus_optimize) needs no test
+            forever = node.condition.__class__ is wumpus_ast.Literal and node.condition.value
+            if not forever:
+                self.expression(node.condition)
+                to_end = self.emit(JUMP_IF_FALSE)
+            self.block(node.body)
+            self.emit(JUMP, start)
+            if not forever:
+                self.patch(to_end, self.here())
+        elif kind is wumpus_ast.Return:
+            self.expression(node.value)
+            self.emit(RETURN)
+        else:
+            raise CompileError(f'Cannot compile {kind.__name__}', node.line)
+
+    def assign(self, node):
+        target = node.target
+        if target.name in self.compiler.constants:
+            raise CompileError(f'Assignment to the constant {target.name}', node.line)
+        if target.index is not None:
+            self.expression(target.index)
+        self.value(node.value)
+        if target.index is not None:
+            self.emit(STORE_INDEX, self.variable(target))
+        else:
+            self.emit(STORE_LOCAL, self.variable(target))
+
+    def value(self, node):
+        if node.__class__ is not wumpus_ast.Call:
+            self.expression(node)
+            return
+        index = self.compiler.function_index.get(node.name) if node.symbol is None else node.symbol.slot
+        if index is None:
+            raise CompileError(f'Call to undefined function {node.name}', node.line)
+        arity = len(self.compiler.declarations[index].params)
+        if arity != len(node.args):
+            raise CompileError(f'{node.name} takes {arity} arguments but {len(node.args)} were given', node.line)
+        for arg in node.args:
+            self.expression(arg)
+        self.emit(CALL, index)
+
+    def expression(self, node):
+        kind = node.__class__
+        if kind is Var:
+            constant = self.compiler.constants.get(node.name)
+            if constant is not None and node.index is None:
+                self.emit(LOAD_CONST, constant)
+            elif node.index is not None:
+                self.expression(node.index)
+                self.emit(LOAD_INDEX, self.variable(node))
+            else:
+                self.emit(LOAD_LOCAL, self.variable(node))
+        elif kind is wumpus_ast.Literal:
+            self.emit(LOAD_CONST, self.compiler.constant(node.value))
+        elif kind is wumpus_ast.BinOp:
+            self.expression(node.left)
+            if node.op in ('and', 'or'):
+                # short-circuit: the left value stays on the stack as the result when it decides
+                jump = self.emit(JUMP_IF_FALSE_OR_POP if node.op == 'and' else JUMP_IF_TRUE_OR_POP)
+                self.expression(node.right)
+                self.patch(jump, self.here())
+            else:
+                self.expression(node.right)
+                self.emit(BINARY_OPCODES[node.op])
+        elif kind is wumpus_ast.Negate:
+            self.expression(node.operand)
+            self.emit(NEG)
+        elif kind is wumpus_ast.Sense:
+            self.emit(SENSE, PERCEPTS.index(node.percept))
+        else:
+            raise CompileError(f'Cannot compile {kind.__name__}', node.line)
+
+class Compiler:
+    '''
+    Compiles a wumpus_ast.Program into Bytecode
+    constants maps a declared constant's name to its constant pool index
+    '''
+    def __init__(self):
+        self.pool = []
+        self.pool_index = {}
+        self.constants = {}
+        self.function_index = {}
+        self.declarations = []
+
+    def constant(self, value):
+        # True and 1 compare equal, so the pool is keyed by type as well
+        key = (value.__class__, value)
+        index = self.pool_index.get(key)
+        if index is None:
+            index = self.pool_index[key] = len(self.pool)
+            self.pool.append(value)
+        return index
+
+    def compile(self, program):
+        for declaration in program.constants:
+            if declaration.name in self.constants:
+                raise CompileError(f'Constant {declaration.name} is declared twice', declaration.line)
+            self.constants[declaration.name] = self.constant(declaration.value)
+        # every function can be called from anywhere, itself included
+        for declaration in program.functions:
+            if declaration.name in self.function_index:
+                raise CompileError(f'Function {declaration.name} is declared twice', declaration.line)
+            self.function_index[declaration.name] = len(self.declarations)
+            self.declarations.append(declaration)
+        zero = self.constant(0)
+        functions = []
+        for declaration in self.declarations:
+            function = FunctionCompiler(self, declaration.name, declaration.params, declaration.scope)
+            function.block(declaration.body)
+            # falling off the end of a function returns 0
+            function.emit(LOAD_CONST, zero)
+            function.emit(RETURN)
+            functions.append(function.function(len(declaration.params)))
+        main = FunctionCompiler(self, 'play', (), program.scope)
+        main.block(program.body)
+        main.emit(HALT)
+        return Bytecode(functions, main.function(0), self.pool, program.world)
+
+def compile_program(tree, optimize=False):
+    # compile a program() CST, or an AST that was already lowered
+    # with optimize, constants are propagated and folded first (see wumpus_optimize)
+    if not isinstance(tree, wumpus_ast.Program):
+        tree = wumpus_ast.lower(tree)
+    if optimize:
+        tree = wumpus_optimize.fold(tree)
+    return Compiler().compile(tree)
+
+class Result:
+    '''Outcome of one run: the world's outcome and score, executed instructions, and the printed positions'''
+    def __init__(self, outcome, score, steps, actions, positions):
+        self.outcome = outcome
+        self.score = score
+        self.steps = steps
+        self.actions = actions
+        self.positions = positions
+
+class VM:
+    '''
+    Runs Bytecode against a World
+    The operand stack is shared by all frames; a frame is the (code, pc, slots) of the caller
+    '''
+    def __init__(self, bytecode):
+        self.bytecode = bytecode
+        # lists index faster than arrays in the dispatch loop
+        self.codes = [function.code.tolist() for function in bytecode.functions]
+        self.arities = [function.arity for function in bytecode.functions]
+        self.slot_counts = [function.slots for function in bytecode.functions]
+        self.main = bytecode.main.code.tolist()
+
+    def run(self, world=None, max_steps=MAX_STEPS, max_depth=MAX_DEPTH, output=None, max_seconds=None):
+        # run the play block to its end, to the agent's death, until max_steps instructions have run
+        # or until max_seconds have passed
+        # both budgets are checked on backward jumps and calls only, against limit: the next step count
+        # at which to look at the steps or the clock again
+        if max_seconds is None:
+            limit = max_steps
+        else:
+            deadline = time.perf_counter() + max_seconds
+            limit = min(max_steps, TIME_CHECK_INTERVAL)
+        if world is None:
+            world = World.from_init(self.bytecode.world)
+        positions = [] if output is None else None
+        constants = self.bytecode.constants
+        codes = self.codes
+        code = self.main
+        slots = [0] * self.bytecode.main.slots
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        frames = []
+        pc = 0
+        steps = 0
+        outcome = None
+        while True:
+            op = code[pc]
+            arg = code[pc + 1]
+            pc += 2
+            steps += 1
+            if op == LOAD_LOCAL:
+                push(slots[arg])
+            elif op == LOAD_CONST:
+                push(constants[arg])
+            elif op == STORE_LOCAL:
+                slots[arg] = pop()
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                if arg < pc and steps > limit:
+                    outcome, limit = self.budget(steps, max_steps, max_seconds and deadline)
+                    if outcome:
+                        break
+                pc = arg
+            elif op == ADD:
+                right = pop()
+                stack[-1] += right
+            elif op == SUB:
+                right = pop()
+                stack[-1] -= right
+            elif op == LT:
+                right = pop()
+                stack[-1] = stack[-1] < right
+            elif op == LE:
+                right = pop()
+                stack[-1] = stack[-1] <= right
+            elif op == GT:
+                right = pop()
+                stack[-1] = stack[-1] > right
+            elif op == GE:
+                right = pop()
+                stack[-1] = stack[-1] >= right
+            elif op == EQ:
+                right = pop()
+                stack[-1] = stack[-1] == right
+            elif op == NE:
+                right = pop()
+                stack[-1] = stack[-1] != right
+            elif op == MUL:
+                right = pop()
+                stack[-1] *= right
+            elif op == DIV:
+                right = pop()
+                if not right:
+                    raise VMError('Division by zero')
+                # floor division, like Python's
+                stack[-1] //= right
+            elif op == NEG:
+                stack[-1] = -stack[-1]
+            elif op == JUMP_IF_FALSE_OR_POP:
+                if stack[-1]:
+                    pop()
+                else:
+                    pc = arg
+            elif op == JUMP_IF_TRUE_OR_POP:
+                if stack[-1]:
+                    pc = arg
+                else:
+                    pop()
+            elif op == SENSE:
+                push(world.sense(arg))
+            elif op == LOAD_INDEX:
+                values = slots[arg]
+                index = pop()
+                push(values.get(index, 0) if values.__class__ is dict else 0)
+            elif op == STORE_INDEX:
+                value = pop()
+                index = pop()
+                values = slots[arg]
+                if values.__class__ is not dict:
+                    values = slots[arg] = {}
+                values[index] = value
+            elif op == CALL:
+                if len(frames) >= max_depth:
+                    raise VMError(f'Call stack overflow in {self.bytecode.functions[arg].name}')
+                if steps > limit:
+                    outcome, limit = self.budget(steps, max_steps, max_seconds and deadline)
+                    if outcome:
+                        break
+                frames.append((code, pc, slots))
+                arity = self.arities[arg]
+                if arity:
+                    slots = stack[-arity:]
+                    del stack[-arity:]
+                else:
+                    slots = []
+                slots.extend([0] * (self.slot_counts[arg] - arity))
+                code = codes[arg]
+                pc = 0
+            elif op == RETURN:
+                if not frames:
+                    break
+                code, pc, slots = frames.pop()
+            elif op == MOVE:
+                world.move(arg)
+                if not world.alive:
+                    break
+            elif op == SHOOT:
+                world.shoot(arg)
+            elif op == GRAB:
+                world.grab()
+            elif op == PRINT_POSITION:
+                if output is None:
+                    positions.append(world.position)
+                else:
+                    output(world.position)
+            elif op == HALT:
+                break
+            else:
+                raise VMError(f'Unknown opcode {op}')
+        return Result(outcome or world.outcome(), world.score(), steps, world.actions, positions)
+
+    def budget(self, steps, max_steps, deadline):
+        # (outcome, None) when a budget ran out, otherwise (None, the next step count to check at)
+        if steps > max_steps:
+            return OUT_OF_STEPS, None
+        if not deadline:
+            return None, max_steps
+        if time.perf_counter() > deadline:
+            return OUT_OF_TIME, None
+        return None, min(max_steps, steps + TIME_CHECK_INTERVAL)
+
+def run_source(source, world=None, max_steps=MAX_STEPS, output=None):
+    # lex, parse, compile and run a source string, syntax errors are raised
+    import table_parser
+    from lexer import tokenize
+    from wumpus_parser import LexerTokenStream
+    cst = table_parser.parse(LexerTokenStream(tokenize(source, engine='scanner')))
+    return VM(compile_program(cst)).run(world, max_steps, output=output)
+
+def main():
+    parse = argparse.ArgumentParser()
+    parse.add_argument('-f', '--file', help='Wumpus source file to run', type=str, required=True)
+    parse.add_argument('-s', '--max-steps', help='Instructions executed before the game is stopped', type=int, default=MAX_STEPS)
+    parse.add_argument('-d', '--disassemble', help='Print the bytecode instead of running it', action='store_true')
+    parse.add_argument('-c', '--check', help='Run the semantic checks of wumpus_semantic before compiling', action='store_true')
+    parse.add_argument('-O', '--optimize', help='Fold constant expressions and dead branches before compiling', action='store_true')
+    args = parse.parse_args()
+
+    import table_parser
+    from lexer import tokenize, LineIndex
+    from wumpus_parser import LexerTokenStream
+    with open(args.file, 'r') as file:
+        source = file.read()
+    cst = table_parser.program(LexerTokenStream(tokenize(source, engine='scanner'), LineIndex(source)))
+    if args.check:
+        cst, errors = wumpus_semantic.analyze(cst)
+        for error in errors:
+            print(error)
+        if errors:
+            sys.exit(1)
+    try:
+        bytecode = compile_program(cst, args.optimize)
+        if args.disassemble:
+            bytecode.disassemble()
+            return
+        result = VM(bytecode).run(max_steps=args.max_steps, output=lambda position: print(f'({position[0]}, {position[1]})'))
+    except (CompileError, WorldError, VMError) as e:
+        print(e)
+        sys.exit(1)
+    print(f'{result.outcome}: score {result.score}, {result.actions} actions, {result.steps} instructions')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# The Wumpus world an agent program plays in, built from the program's init block
+# Rooms are (x, y) with 0 <= x < width and 0 <= y < height, north is +y and east is +x.
+# Entering a pit or the live Wumpus's room kills the agent, the single arrow kills the Wumpus
+# when it is anywhere in the line of fire, and grab() picks the gold up in its room.
+# The init block is materialized once into NumPy layers indexed [y, x]; the stench and breeze masks and
+# the room each move leads to are precomputed from them, so percepts and moves are table lookups.
+
+import numpy as np
+
+DIRECTIONS = ('north', 'south', 'east', 'west')
+DELTAS = ((0, 1), (0, -1), (1, 0), (-1, 0))
+PERCEPTS = ('stench', 'breeze', 'glitter')
+
+# outcomes of a game
+ALIVE = 'alive'
+GOLD = 'gold'
+DEAD = 'dead'
+OUT_OF_STEPS = 'out_of_steps'
+OUT_OF_TIME = 'out_of_time'
+
+# scoring, per game
+GOLD_REWARD = 1000
+DEATH_PENALTY = 1000
+ACTION_COST = 1
+ARROW_COST = 10
+
+class WorldError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+def adjacent(layer):
+    # cells that share a side with a set cell of layer, over the last two axes (so a stack of layers works too)
+    result = np.zeros_like(layer)
+    result[..., 1:, :] |= layer[..., :-1, :]
+    result[..., :-1, :] |= layer[..., 1:, :]
+    result[..., :, 1:] |= layer[..., :, :-1]
+    result[..., :, :-1] |= layer[..., :, 1:]
+    return result
+
+def build_layers(grid_size, agent, wumpus, gold, rooms=()):
+    '''
+    Check every placement and return the (pits, wumpus, gold) boolean layers
+    The init block's statements are applied in order: place_pit adds a pit, clear_room removes the pit
+    from a room again. All the problems found are reported together in one WorldError.
+    '''
+    width, height = grid_size
+    if width <= 0 or height <= 0:
+        raise WorldError(f'grid_size({width}, {height}) is empty')
+    names = ['place_agent', 'place_wumpus', 'place_gold'] + [statement for statement, _, _ in rooms]
+    rooms_xy = np.array([agent, wumpus, gold] + [(x, y) for _, x, y in rooms], dtype=np.int64)
+    x = rooms_xy[:, 0]
+    y = rooms_xy[:, 1]
+    inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    errors = [f'{names[i]}({x[i]}, {y[i]}) is outside the {width}x{height} grid' for i in np.flatnonzero(~inside)]
+    if errors:
+        raise WorldError('\n'.join(errors))
+    # the last statement for a room decides whether it has a pit
+    pits = np.zeros((height, width), dtype=bool)
+    if rooms:
+        cells = (y[3:] * width + x[3:])[::-1]
+        placed = np.array([statement == 'place_pit' for statement, _, _ in rooms])[::-1]
+        cells, last = np.unique(cells, return_index=True)
+        pits.flat[cells] = placed[last]
+    wumpus_layer = np.zeros_like(pits)
+    wumpus_layer[y[1], x[1]] = True
+    gold_layer = np.zeros_like(pits)
+    gold_layer[y[2], x[2]] = True
+    # rooms that must not hold more than one of the agent, the Wumpus and a pit
+    crowded = pits.astype(np.int8) + wumpus_layer
+    crowded[y[0], x[0]] += 1
+    errors = [f'Room ({cx}, {cy}) holds more than one of the agent, the Wumpus and a pit' for cy, cx in np.argwhere(crowded > 1)]
+    if errors:
+        raise WorldError('\n'.join(errors))
+    return pits, wumpus_layer, gold_layer
+
+def move_table(width, height):
+    # for each direction, the flat index of the room a move from each room leads to (the same room at a wall)
+    ys, xs = np.divmod(np.arange(width * height).reshape(height, width), width)
+    table = np.empty((len(DELTAS), height, width), dtype=np.int64)
+    for direction, (dx, dy) in enumerate(DELTAS):
+        nx = np.clip(xs + dx, 0, width - 1)
+        ny = np.clip(ys + dy, 0, height - 1)
+        table[direction] = ny * width + nx
+    return table.reshape(len(DELTAS), -1)
+
+class World:
+    '''
+    A game in progress
+    Layers are boolean NumPy arrays indexed [y, x]. During a game the agent's room is a flat index
+    (y * width + x) into the precomputed tables, which are kept as lists for the cheapest lookups.
+    '''
+    def __init__(self, grid_size, agent, wumpus, gold, rooms=()):
+        self.width, self.height = grid_size
+        self.pits, self.wumpus_layer, self.gold_layer = build_layers(grid_size, agent, wumpus, gold, rooms)
+        # stench reaches the Wumpus's room and its neighbours, breeze only the neighbours of a pit
+        self.stench = adjacent(self.wumpus_layer) | self.wumpus_layer
+        self.breeze = adjacent(self.pits)
+        self.moves = move_table(self.width, self.height)
+        self.stench_table = self.stench.ravel().tolist()
+        self.breeze_table = self.breeze.ravel().tolist()
+        self.pit_table = self.pits.ravel().tolist()
+        self.move_tables = self.moves.tolist()
+        self.start = agent
+        self.wumpus = wumpus
+        self.gold = gold
+        self.room = agent[1] * self.width + agent[0]
+        self.wumpus_room = wumpus[1] * self.width + wumpus[0]
+        self.gold_room = gold[1] * self.width + gold[0]
+        self.facing = 0
+        self.wumpus_alive = True
+        self.has_gold = False
+        self.arrows = 1
+        self.alive = True
+        self.actions = 0
+
+    @classmethod
+    def from_init(cls, world_init):
+        # from the WorldInit node of wumpus_ast
+        return cls(world_init.grid_size, world_init.agent, world_init.wumpus, world_init.gold, world_init.rooms)
+
+    @property
+    def position(self):
+        y, x = divmod(self.room, self.width)
+        return (x, y)
+
+    def move(self, direction):
+        # walking into a wall leaves the agent where it is
+        self.actions += 1
+        self.facing = direction
+        room = self.room = self.move_tables[direction][self.room]
+        if self.pit_table[room] or (room == self.wumpus_room and self.wumpus_alive):
+            self.alive = False
+
+    def shoot(self, direction):
+        self.actions += 1
+        self.facing = direction
+        if not self.arrows:
+            return
+        self.arrows -= 1
+        dx, dy = DELTAS[direction]
+        x, y = self.position
+        wx, wy = self.wumpus
+        # the Wumpus is hit if it is on the ray from the agent's room to the wall
+        if dx:
+            hit = wy == y and (wx - x) * dx > 0
+        else:
+            hit = wx == x and (wy - y) * dy > 0
+        if hit:
+            self.wumpus_alive = False
+
+    def grab(self):
+        self.actions += 1
+        if self.room == self.gold_room:
+            self.has_gold = True
+
+    def sense(self, percept):
+        if percept == 0:
+            return self.stench_table[self.room]
+        if percept == 1:
+            return self.breeze_table[self.room]
+        return self.room == self.gold_room and not self.has_gold
+
+    def outcome(self):
+        if not self.alive:
+            return DEAD
+        return GOLD if self.has_gold else ALIVE
+
+    def score(self):
+        score = -ACTION_COST * self.actions - ARROW_COST * (1 - self.arrows)
+        if not self.alive:
+            score -= DEATH_PENALTY
+        elif self.has_gold:
+            score += GOLD_REWARD
+        return score